@@ -1,54 +1,147 @@
 #!/usr/bin/env python3
+import os
 import sys
 import json
 import re
 
+import tracing
+from param_store import ParamStore, DEFAULT_KEY, export_json
+
+PARAMS_FILE = 'ai_agent_param.json'
+RUN_PARAMS_DIR = 'ai_agent_params'  # <run id>.json per run, so parallel runs don't read each other's
+RUN_ID_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+# "Take Profit <num>", "Take Profits <num>" or "Take Profit Level <num>" (and the same for Stop Loss),
+# one precompiled pattern per field; the first mention in the message wins
+NUMBER = r'\s*([0-9]+(?:\.[0-9]+)?)'
+TP_RE  = re.compile(r'Take Profit(?:s| Level)?' + NUMBER)
+SL_RE  = re.compile(r'Stop Loss(?:es| Level)?' + NUMBER)
+# Matched against the lowercased message: a literal prefix lets re skip ahead, IGNORECASE can't
+BUY_RE = re.compile(r'buy\s*(?:\:|)\s*yes')
+# Keys an archived JSONL record may keep the agent's message under (n8n's AI Agent node uses "output")
+MESSAGE_KEYS = ('output', 'text', 'message')
+
+
+def parse_agent_output(agent_msg):
+    """Returns {'take_profit', 'stop_loss', 'buy'} from an agent message, or None if TP or SL is missing."""
+    tp_match = TP_RE.search(agent_msg)
+    sl_match = SL_RE.search(agent_msg)
+    if not tp_match or not sl_match:
+        return None
+    return {
+        "take_profit": float(tp_match.group(1)),
+        "stop_loss": float(sl_match.group(1)),
+        # Default to "no" unless explicitly mentioned
+        "buy": "yes" if BUY_RE.search(agent_msg.lower()) else "no",
+    }
+
+
+def parse_batch(lines, out):
+    """Parses JSONL agent outputs from `lines`, writing one JSONL result per input line to `out`.
+
+    Each input line is a JSON string or an object with the message under one of MESSAGE_KEYS
+    (its "id", if any, is copied over). Lines that can't be parsed produce
+    {"line", "error"} records instead. Returns (parsed, failed) counts.
+    """
+    parsed = failed = 0
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        result = {"line": line_no}
+        try:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                if "id" in record:
+                    result["id"] = record["id"]
+                agent_msg = next((record[k] for k in MESSAGE_KEYS if isinstance(record.get(k), str)), None)
+            else:
+                agent_msg = record if isinstance(record, str) else None
+            if agent_msg is None:
+                result["error"] = "no agent message in record"
+            else:
+                params = parse_agent_output(agent_msg)
+                if params is None:
+                    result["error"] = "couldn't parse TP/SL"
+                else:
+                    result.update(params)
+        except ValueError as e:
+            result["error"] = f"invalid JSON: {e}"
+        if "error" in result:
+            failed += 1
+        else:
+            parsed += 1
+        out.write(json.dumps(result) + "\n")
+    return parsed, failed
+
+
+def run_batch(args):
+    # Usage: ai_agent_trade.py --batch [input.jsonl|-] [output.jsonl]
+    in_path = args[0] if args else "-"
+    out_path = args[1] if len(args) > 1 else "-"
+    src = sys.stdin if in_path == "-" else open(in_path, encoding="utf-8")
+    dst = sys.stdout if out_path == "-" else open(out_path, "w", encoding="utf-8")
+    try:
+        parsed, failed = parse_batch(src, dst)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    # Results may be on stdout, so the summary goes to stderr
+    print(f"✅  Parsed {parsed} agent outputs, {failed} failed", file=sys.stderr)
+
+
+def save_params(data, run_id=None):
+    """Stores {'take_profit', 'stop_loss', 'buy'} for the monitors and writes the JSON files for the workflow."""
+    # The monitors follow the parameter store; the JSON files are for the workflow to read
+    with tracing.span("param store write"):
+        store = ParamStore()
+        for key in dict.fromkeys([run_id or DEFAULT_KEY, DEFAULT_KEY]):
+            version = store.put(key, data['take_profit'], data['stop_loss'], data['buy'])
+            print(f"✅  Stored parameters under '{key}' (version {version}) in {store.path}")
+        store.close()
+
+    # Written to a temporary file and renamed into place, never half-written
+    with tracing.span("param json write"):
+        export_json(data, PARAMS_FILE)
+        print(f"✅  Data saved to {PARAMS_FILE}")
+        if run_id is not None:
+            run_file = os.path.join(RUN_PARAMS_DIR, f"{run_id}.json")
+            export_json(data, run_file)
+            print(f"✅  Data saved to {run_file}")
+
+
 def main():
     if len(sys.argv) < 2:
         print("ERROR: No agent output provided")
         sys.exit(1)
 
+    if sys.argv[1] == "--batch":
+        run_batch(sys.argv[2:])
+        return
+
+    # Usage: ai_agent_trade.py "<agent output>" [run id]
     agent_msg = sys.argv[1]
-    # Look specifically for "Take Profit <num>" and "Stop Loss <num>", if there's none, look for "Take Profits <num>" and "Stop Losses <num>",
-    # if there's still none, look for "Take Profit Level <num>" and "Stop Loss Level <num>"
-    tp_match = re.search(r'Take Profit\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
-    if not tp_match:
-        tp_match = re.search(r'Take Profits\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
-        if not tp_match:
-            tp_match = re.search(r'Take Profit Level\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
-    
-    sl_match = re.search(r'Stop Loss\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
-    if not sl_match:
-        sl_match = re.search(r'Stop Losses\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
-        if not sl_match:
-            sl_match = re.search(r'Stop Loss Level\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
+    run_id = sys.argv[2] if len(sys.argv) > 2 else None
+    if run_id is not None and not RUN_ID_RE.fullmatch(run_id):
+        print(f"ERROR: Invalid run id {run_id!r} (use letters, digits, '-' and '_')")
+        sys.exit(1)
 
-    if not tp_match or not sl_match:
+    if run_id is not None:
+        tracing.set_run_id(run_id)
+    with tracing.span("parse", chars=len(agent_msg)) as trace:
+        data = parse_agent_output(agent_msg)
+        trace["parsed"] = data is not None
+    if data is None:
         print(f"ERROR: Couldn't parse TP/SL from agent output:\n{agent_msg}")
         sys.exit(1)
 
-    take_profit = float(tp_match.group(1))
-    stop_loss   = float(sl_match.group(1))
-
-    # Check for buy recommendation. Default to "no" unless explicitly mentioned
-    buy = "no"
-    if re.search(r'Buy\s*(?:\:|)\s*yes', agent_msg, re.IGNORECASE):
-        buy = "yes"
-
     # Echo for readability in your n8n logs
-    print(f"Take Profit: {take_profit}")
-    print(f"Stop Loss: {stop_loss}")
-    print(f"Buy: {buy}")
-
-    # Write clean JSON
-    data = {
-        "take_profit": take_profit,
-        "stop_loss": stop_loss,
-        "buy": buy
-    }
-    with open('ai_agent_param.json', 'w') as f:
-        json.dump(data, f, indent=4)
-    print("✅  Data saved to ai_agent_param.json")
+    print(f"Take Profit: {data['take_profit']}")
+    print(f"Stop Loss: {data['stop_loss']}")
+    print(f"Buy: {data['buy']}")
+
+    save_params(data, run_id)
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,17 @@
 import os
+import re
+import json
+import time
+import queue
+import threading
+import asyncio
 import argparse
-import psycopg2
-import google.generativeai as genai
-import requests
 from dotenv import load_dotenv
 from datetime import datetime
+from functools import partial
+
+from analysis_cache import AnalysisCache, DEFAULT_CACHE_DIR as DEFAULT_ANALYSIS_CACHE_DIR, DEFAULT_TTL
+import tracing
 
 # Load environment variables
 load_dotenv()
@@ -12,165 +19,776 @@ load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 COINAPI_KEY = os.getenv("COINAPI_KEY")
+OHLCV_CACHE_DIR = os.getenv("OHLCV_CACHE_DIR")  # ohlcv_cache.DEFAULT_CACHE_DIR when unset
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", DEFAULT_ANALYSIS_CACHE_DIR)
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", DEFAULT_TTL))
+# Overridable so the pipeline can run against a local stand-in (CoinAPI's URL is read by price_oracle.py)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+# prompt_encoding.DEFAULT_TOKEN_BUDGET; that module (and numpy) is only imported once there is data to encode
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+BTC_SYMBOL = "BTCUSD"
+# Timeframes --max-bars picks from; the prompt encoder works on dated (not intraday) bars
+PROMPT_TIMEFRAMES = ['1d', '1w', '1mo']
 
 
-def fetch_data_from_supabase(db_url, symbol, start_date, end_date):
-    """Fetches OHLCV data from Supabase for a given symbol and date range."""
-    conn = None
-    try:
+class AnalysisError(Exception):
+    """Raised when an analysis can't run (bad input, missing configuration, database error)."""
+
+
+# One pool per database URL, shared by every fetch in the process
+_db_pools = {}
+DB_POOL_MAX_CONNECTIONS = 4
+# Above this many (estimated) rows, stream the result through a server-side cursor
+SERVER_SIDE_CURSOR_ROWS = 20000
+
+
+def get_db_pool(db_url):
+    """Returns the connection pool for db_url, connecting on first use."""
+    pool = _db_pools.get(db_url)
+    if pool is None:
+        import psycopg2.pool
+
         print(f"Connecting to database...")
-        conn = psycopg2.connect(db_url)
-        cur = conn.cursor()
+        with tracing.span("db connect"):
+            pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_MAX_CONNECTIONS, db_url)
+        _db_pools[db_url] = pool
         print("✅ Connected to database.")
+    return pool
+
+
+def close_db_pools():
+    """Closes every pooled database connection."""
+    for pool in _db_pools.values():
+        pool.closeall()
+    if _db_pools:
+        print("✅ Database connection closed.")
+    _db_pools.clear()
+
 
-        print(f"Fetching data for {symbol} from {start_date} to {end_date}...")
+def fetch_multi_from_supabase(db_url, symbols, start_date, end_date):
+    """Fetches OHLCV data for several symbols with one query on a pooled connection.
+
+    Returns {symbol: rows}, with an (possibly empty) entry for every requested symbol,
+    or None on a database error.
+    """
+    import psycopg2
+
+    symbols = list(dict.fromkeys(symbols))
+    pool = None
+    conn = None
+    try:
+        pool = get_db_pool(db_url)
+        conn = pool.getconn()
+
+        print(f"Fetching data for {', '.join(symbols)} from {start_date} to {end_date}...")
         query = """
-        SELECT trade_date, open_price, high_price, low_price, close_price, volume
+        SELECT symbol, trade_date, open_price, high_price, low_price, close_price, volume
         FROM daily_ohlcv
-        WHERE symbol = %s AND trade_date >= %s AND trade_date <= %s
-        ORDER BY trade_date ASC;
+        WHERE symbol = ANY(%s) AND trade_date >= %s AND trade_date <= %s
+        ORDER BY symbol, trade_date ASC;
         """
-        cur.execute(query, (symbol, start_date, end_date))
-        rows = cur.fetchall()
-        print(f"✅ Found {len(rows)} records for {symbol}.")
+        days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+        if days * len(symbols) > SERVER_SIDE_CURSOR_ROWS:
+            cur = conn.cursor(name="daily_ohlcv_fetch")
+            cur.itersize = SERVER_SIDE_CURSOR_ROWS
+        else:
+            cur = conn.cursor()
+
+        series = {symbol: [] for symbol in symbols}
+        with cur, tracing.span("db query", symbols=len(symbols)) as trace:
+            cur.execute(query, (symbols, start_date, end_date))
+            for row in cur:
+                series[row[0]].append(row[1:])
+            trace["rows"] = sum(len(rows) for rows in series.values())
+        # End the read transaction so the pooled connection isn't left idle in a transaction
+        conn.commit()
+
+        for symbol in symbols:
+            print(f"✅ Found {len(series[symbol])} records for {symbol}.")
+        return series
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if conn:
+            pool.putconn(conn)
+
+
+def pick_series_timeframe(db_url, symbols, start_date, end_date, max_bars, timeframes=None):
+    """Picks one timeframe for all symbols, so their bars line up in the prompt.
+
+    Returns the finest of `timeframes` (default: all of them) that every symbol has data
+    for back to start_date and that covers the range in at most max_bars bars (the
+    coarsest such one when none does), '1d' when no timeframe is shared, or None on a
+    database error.
+    """
+    import psycopg2
+    import ohlcv_store
+
+    timeframes = timeframes or ohlcv_store.TIMEFRAMES
+    pool = None
+    conn = None
+    try:
+        pool = get_db_pool(db_url)
+        conn = pool.getconn()
+        shared = [tf for tf in timeframes if tf in ohlcv_store.TIMEFRAMES]
+        for symbol in dict.fromkeys(symbols):
+            available = ohlcv_store.available_timeframes(conn, symbol, start_date)
+            shared = [tf for tf in shared if tf in available]
+        if not shared:
+            return '1d'
+        return ohlcv_store.pick_timeframe(start_date, end_date, max_bars, shared)
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if conn:
+            pool.putconn(conn)
+
+
+def fetch_data_from_supabase(db_url, symbol, start_date, end_date, timeframe='1d', max_bars=None,
+                             timeframes=None):
+    """Fetches OHLCV data from Supabase for a given symbol and date range.
+
+    timeframe is one of ohlcv_store.TIMEFRAMES, or 'auto' to let pick_series_timeframe()
+    choose from `timeframes` for max_bars. Rows are (period start, open, high, low, close,
+    volume) whatever the timeframe. Returns None on a database error.
+    """
+    if timeframe == 'auto':
+        timeframe = pick_series_timeframe(db_url, [symbol], start_date, end_date, max_bars, timeframes)
+        if timeframe is None:
+            return None
+    if timeframe == '1d':
+        series = fetch_multi_from_supabase(db_url, [symbol], start_date, end_date)
+        return None if series is None else series[symbol]
+
+    import psycopg2
+    import ohlcv_store
+
+    pool = None
+    conn = None
+    try:
+        pool = get_db_pool(db_url)
+        conn = pool.getconn()
+        print(f"Fetching {timeframe} bars for {symbol} from {start_date} to {end_date}...")
+        rows = ohlcv_store.fetch_bars(conn, symbol, start_date, end_date, timeframe)
+        print(f"✅ Found {len(rows)} {timeframe} records for {symbol}.")
         return rows
     except psycopg2.Error as e:
         print(f"Database error: {e}")
+        if conn:
+            conn.rollback()
         return None
     finally:
         if conn:
-            cur.close()
-            conn.close()
-            print("✅ Database connection closed.")
+            pool.putconn(conn)
+
 
 def format_data_for_prompt(data, symbol):
     """Formats the fetched data into a string for the Gemini prompt."""
     if not data:
         return f"No data available for {symbol} in the specified range."
 
-    header = f"{symbol} Data:\nDate        Open    High    Low     Close   Volume\n"
-    data_str = header + "-" * (len(header.split('\n')[1]) -1) + "\n"
+    columns = "Date        Open    High    Low     Close   Volume"
+    lines = [f"{symbol} Data:", columns, "-" * (len(columns) - 1)]
+    lines.extend(
+        f"{row[0].strftime('%Y-%m-%d')}  {row[1]:<7.2f} {row[2]:<7.2f} {row[3]:<7.2f} {row[4]:<7.2f} {row[5]:<10}"
+        for row in data
+    )
+    return "\n".join(lines).strip()
 
-    for row in data:
-        date_str = row[0].strftime('%Y-%m-%d')
-        open_p = f"{row[1]:<7.2f}"
-        high_p = f"{row[2]:<7.2f}"
-        low_p = f"{row[3]:<7.2f}"
-        close_p = f"{row[4]:<7.2f}"
-        volume = f"{row[5]:<10}"
-        data_str += f"{date_str}  {open_p} {high_p} {low_p} {close_p} {volume}\n"
 
-    return data_str.strip()
+def get_wbtc_usdt_price(api_key, session=None):
+    """Returns the current WBTC/USDT price from the shared price oracle (see price_oracle.py).
 
+    The oracle answers from memory while its last price is recent enough and otherwise
+    asks MEXC's ticker or CoinAPI (with api_key), whichever answers first. session is
+    used to reach the oracle process when PRICE_ORACLE_URL is set. Returns None when
+    no source has a price.
+    """
+    import price_oracle
 
-def get_wbtc_usdt_price(api_key):
-    """Fetches the current WBTC/USDT price from CoinAPI."""
-    url = 'https://rest.coinapi.io/v1/exchangerate/WBTC/USDT'
-    headers = {'X-CoinAPI-Key': api_key}
-    
     try:
-        print("Fetching current WBTC/USDT price from CoinAPI...")
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        price = data.get('rate')
-        if price:
-            print(f"✅ Current WBTC/USDT Price: {price}")
-            return price
-        else:
-            print("⚠️ Price data not found in response.")
-            return None
-    except requests.exceptions.HTTPError as http_err:
-        print(f"❌ HTTP error occurred: {http_err}")
-        return None
+        print("Fetching current WBTC/USDT price...")
+        price = float(price_oracle.get_price("WBTCUSDT", coinapi_key=api_key, session=session))
+        print(f"✅ Current WBTC/USDT Price: {price}")
+        return price
     except Exception as err:
         print(f"❌ Error fetching WBTC/USDT price: {err}")
         return None
 
 
-def analyze_with_gemini(api_key, stock_data_str, btc_data_str, btc_price=None):
-    """Sends the data to Gemini API for analysis."""
-    if "No data available" in stock_data_str and "No data available" in btc_data_str:
-        return "No data available for analysis." 
+_gemini_models = {}
+
+
+def get_gemini_model(api_key):
+    """Configures the Gemini client once per API key and returns the (reused) model."""
+    model = _gemini_models.get(api_key)
+    if model is None:
+        # The SDK alone takes most of this script's start-up time, so it's only imported here
+        import google.generativeai as genai
 
-    try:
         print("Configuring Gemini API...")
-        genai.configure(api_key=api_key)
+        if GEMINI_API_ENDPOINT:
+            genai.configure(api_key=api_key, transport='rest',
+                            client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+        else:
+            genai.configure(api_key=api_key)
         # Use the preferred model
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        _gemini_models[api_key] = model
         print("✅ Gemini API configured with the chosen model")
+    return model
 
-        btc_info = ""
-        if btc_price is not None:
-            btc_info = f"\n\nThe current WBTC/USDT price is: {btc_price}"
 
-        # Prepare the prompt for AI analysis    
-        prompt = f"""You are a financial data analyst. Analyze the following data sets:
+PROMPT_TEMPLATE = """You are a financial data analyst. Analyze the following data sets:
 
 {stock_data_str}
 
-{btc_data_str}{btc_info}
+{btc_data_str}{btc_info}{summary_info}
 
 Please provide:
 1. Independent analysis of both datasets, highlighting key trends and price action patterns
-2. Make comparative trend analysis between the stock and Bitcoin during this period, including correlation analysis
-3. How this comparison might help predict or explain the current Bitcoin price of {btc_price if btc_price else 'N/A'}
+2. Make comparative trend analysis between the stock and Bitcoin during this period, including correlation analysis (use the precomputed statistics and indicators above where given)
+3. How this comparison might help predict or explain the current Bitcoin price of {btc_price}
 4. If the trends that you see from both datasets may suggest any potential prediction of future Bitcoin price, please include that as well."""
 
+
+DECISION_INSTRUCTIONS = """
+
+Finally, decide whether it's a good time to buy Bitcoin now, and set take profit and stop loss levels even if you decide not to buy. Keep both levels within {max_distance:.0%} of the current Bitcoin price, and give exact prices, not ranges.
+Reply with JSON only: "analysis" (a concise, 3 sentence analysis), "take_profit", "stop_loss" and "buy" ("yes" or "no")."""
+
+# Structured output for the single-call mode: the model returns this object instead of prose
+DECISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string"},
+        "take_profit": {"type": "number"},
+        "stop_loss": {"type": "number"},
+        "buy": {"type": "string"},
+    },
+    "required": ["analysis", "take_profit", "stop_loss", "buy"],
+}
+DECISION_CONFIG = {"response_mime_type": "application/json", "response_schema": DECISION_SCHEMA}
+# Take profit / stop loss may be at most this far from the current price (as the agent prompt asked)
+MAX_LEVEL_DISTANCE = 0.05
+
+
+def build_prompt(stock_data_str, btc_data_str, btc_price=None, summary_str=""):
+    """Fills PROMPT_TEMPLATE."""
+    btc_info = ""
+    if btc_price is not None:
+        btc_info = f"\n\nThe current WBTC/USDT price is: {btc_price}"
+    summary_info = f"\n\n{summary_str}" if summary_str else ""
+    return PROMPT_TEMPLATE.format(stock_data_str=stock_data_str, btc_data_str=btc_data_str,
+                                  btc_info=btc_info, summary_info=summary_info,
+                                  btc_price=btc_price if btc_price else 'N/A')
+
+
+def parse_decision(text, btc_price=None, max_distance=MAX_LEVEL_DISTANCE):
+    """Validates the model's JSON decision; returns {'analysis', 'take_profit', 'stop_loss', 'buy'}.
+
+    Raises ValueError when a field is missing or malformed, the stop loss isn't below the
+    take profit, or (with a btc_price) a level is more than max_distance from the price.
+    """
+    try:
+        reply = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"not JSON ({e})")
+    if not isinstance(reply, dict):
+        raise ValueError("not a JSON object")
+    decision = {"analysis": reply.get("analysis")}
+    if not isinstance(decision["analysis"], str) or not decision["analysis"].strip():
+        raise ValueError("missing analysis")
+    for field in ("take_profit", "stop_loss"):
+        value = reply.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+            raise ValueError(f"{field} must be a positive number, got {value!r}")
+        decision[field] = float(value)
+    decision["buy"] = str(reply.get("buy", "")).strip().lower()
+    if decision["buy"] not in ("yes", "no"):
+        raise ValueError(f"buy must be 'yes' or 'no', got {reply.get('buy')!r}")
+    check_levels(decision, btc_price, max_distance)
+    return decision
+
+
+def check_levels(decision, btc_price=None, max_distance=MAX_LEVEL_DISTANCE):
+    """Raises ValueError unless stop_loss < take_profit and (with a btc_price) both are within max_distance."""
+    if decision["stop_loss"] >= decision["take_profit"]:
+        raise ValueError(f"stop loss {decision['stop_loss']} is not below take profit {decision['take_profit']}")
+    if btc_price:
+        for field in ("take_profit", "stop_loss"):
+            if abs(decision[field] - float(btc_price)) > max_distance * float(btc_price):
+                raise ValueError(f"{field} {decision[field]} is more than {max_distance:.0%} from {btc_price}")
+
+
+def analyze_with_gemini(api_key, stock_data_str, btc_data_str, btc_price=None, model=None, summary_str="",
+                        response_cache=None):
+    """Sends the data to Gemini API for analysis.
+
+    With a response_cache (see analysis_cache.py), an identical prompt (BTC price within
+    the cache's bucket) is answered from the cache and successful answers are stored.
+    """
+    if "No data available" in stock_data_str and "No data available" in btc_data_str:
+        return "No data available for analysis." 
+
+    cache_key = None
+    if response_cache:
+        cache_key = response_cache.key(GEMINI_MODEL_NAME, PROMPT_TEMPLATE, stock_data_str, btc_data_str,
+                                       summary_str, btc_price=btc_price)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            print("✅ Analysis served from the response cache.")
+            return cached
+
+    try:
+        model = model or get_gemini_model(api_key)
+
+        # Prepare the prompt for AI analysis
+        prompt = build_prompt(stock_data_str, btc_data_str, btc_price, summary_str)
+
         print("Sending data to AI for analysis...")
         response = model.generate_content(prompt)
         print("✅ Analysis received from Gemini.")
-        return response.text
+        analysis = response.text
     except Exception as e:
         print(f"Gemini API error: {e}")
         return f"Error during Gemini analysis: {e}"
 
+    if cache_key:
+        try:
+            response_cache.put(cache_key, analysis)
+        except OSError as e:
+            print(f"⚠️ Could not store the analysis in the response cache: {e}")
+    return analysis
+
+
+def decide_with_gemini(api_key, stock_data_str, btc_data_str, btc_price=None, model=None, summary_str="",
+                       response_cache=None, max_distance=MAX_LEVEL_DISTANCE):
+    """Gets the analysis and the trade decision from one structured-output model call.
+
+    Replaces the second round trip through n8n's AI Agent node and the regex parsing in
+    ai_agent_trade.py. Returns the validated decision (see parse_decision()); raises
+    AnalysisError when the model fails or its reply doesn't validate. Only validated
+    replies are stored in the response_cache.
+    """
+    if "No data available" in stock_data_str and "No data available" in btc_data_str:
+        raise AnalysisError("No data available for analysis.")
+
+    instructions = DECISION_INSTRUCTIONS.format(max_distance=max_distance)
+    cache_key = None
+    if response_cache:
+        cache_key = response_cache.key(GEMINI_MODEL_NAME, PROMPT_TEMPLATE + instructions, stock_data_str,
+                                       btc_data_str, summary_str, btc_price=btc_price)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            print("✅ Decision served from the response cache.")
+            # Checked against the price it was made for when it was stored
+            return parse_decision(cached)
+
+    try:
+        model = model or get_gemini_model(api_key)
+        prompt = build_prompt(stock_data_str, btc_data_str, btc_price, summary_str) + instructions
+        print("Sending data to AI for analysis and a decision...")
+        response = model.generate_content(prompt, generation_config=DECISION_CONFIG)
+        text = response.text
+    except Exception as e:
+        print(f"Gemini API error: {e}")
+        raise AnalysisError(f"Error during Gemini analysis: {e}")
+    try:
+        with tracing.span("parse"):
+            decision = parse_decision(text, btc_price, max_distance)
+    except ValueError as e:
+        raise AnalysisError(f"Gemini returned an invalid decision: {e}")
+    print("✅ Analysis and decision received from Gemini.")
+
+    if cache_key:
+        try:
+            response_cache.put(cache_key, text)
+        except OSError as e:
+            print(f"⚠️ Could not store the decision in the response cache: {e}")
+    return decision
+
+
+STREAM_DECISION_INSTRUCTIONS = """
+
+Finally, decide whether it's a good time to buy Bitcoin now, and set take profit and stop loss levels even if you decide not to buy. Keep both levels within {max_distance:.0%} of the current Bitcoin price, and give exact prices, not ranges.
+Keep the analysis concise, and end your reply with exactly this line (no extra text):
+Take Profit X, Stop Loss Y, Buy Z
+where X and Y are your levels and Z is "Yes" or "No"."""
+
+# The decision line, up to the newline (or the end of the reply) that completes it; only
+# punctuation or markdown may follow Z, so a partial "Buy no" isn't taken for "Buy nothing"
+DECISION_LINE_RE = re.compile(r'take profit(?:s| level)?\s*:?\s*([0-9]+(?:\.[0-9]+)?)[\s,;]*'
+                              r'stop loss(?:es| level)?\s*:?\s*([0-9]+(?:\.[0-9]+)?)[\s,;]*'
+                              r'buy\s*:?\s*(yes|no)[^\w\n]*(?:\n|$)', re.IGNORECASE)
+
+
+def stream_with_gemini(api_key, stock_data_str, btc_data_str, btc_price=None, model=None, summary_str="",
+                       on_chunk=None, on_decision=None, timings=None, max_distance=MAX_LEVEL_DISTANCE):
+    """Streams the analysis and the trade decision from one model call.
+
+    on_chunk(text) is called with each piece of text as it arrives, and on_decision(decision)
+    as soon as the "Take Profit X, Stop Loss Y, Buy Z" line is complete and valid, before
+    the rest of the response. Both run on the calling thread, so keep them quick. The
+    seconds from sending the prompt to the first text and to the decision are stored in
+    timings["first token"] and timings["decision"]. Returns the decision with the full
+    text (minus the decision line) as "analysis"; raises AnalysisError when the model
+    fails or never gives a valid decision. Streamed answers aren't cached.
+    """
+    if "No data available" in stock_data_str and "No data available" in btc_data_str:
+        raise AnalysisError("No data available for analysis.")
+    timings = {} if timings is None else timings
+    prompt = (build_prompt(stock_data_str, btc_data_str, btc_price, summary_str)
+              + STREAM_DECISION_INSTRUCTIONS.format(max_distance=max_distance))
+
+    text, decision, match = "", None, None
+
+    def decide(found):
+        decision = {"take_profit": float(found.group(1)), "stop_loss": float(found.group(2)),
+                    "buy": found.group(3).lower()}
+        try:
+            check_levels(decision, btc_price, max_distance)
+        except ValueError as e:
+            raise AnalysisError(f"Gemini returned an invalid decision: {e}")
+        timings["decision"] = time.perf_counter() - start
+        if on_decision:
+            on_decision(decision)
+        return decision
+
+    try:
+        model = model or get_gemini_model(api_key)
+        print("Streaming analysis and decision from AI...")
+        start = time.perf_counter()
+        for chunk in model.generate_content(prompt, stream=True):
+            piece = chunk.text
+            if not piece:
+                continue
+            if not text:
+                timings["first token"] = time.perf_counter() - start
+            text += piece
+            if on_chunk:
+                on_chunk(piece)
+            if decision is None:
+                # Only the lines finished so far; the last one may still be growing
+                match = DECISION_LINE_RE.search(text, 0, text.rfind("\n") + 1)
+                if match:
+                    decision = decide(match)
+    except AnalysisError:
+        raise
+    except Exception as e:
+        print(f"Gemini API error: {e}")
+        raise AnalysisError(f"Error during Gemini analysis: {e}")
+    if decision is None:
+        # The reply may end on the decision line itself
+        match = DECISION_LINE_RE.search(text)
+        if match:
+            decision = decide(match)
+    if decision is None:
+        raise AnalysisError("Gemini's reply has no 'Take Profit X, Stop Loss Y, Buy Z' line.")
+    print("✅ Analysis and decision streamed from Gemini.")
+    tracing.record("model first token", timings["first token"])
+    tracing.record("model decision", timings["decision"])
+    analysis = (text[:match.start()] + text[match.end():]).replace("```", "").strip()
+    return dict(decision, analysis=analysis)
+
+
+class ChunkPoster:
+    """POSTs streamed text to a URL ({"text": ...}, e.g. a Slack incoming webhook) from a background thread.
+
+    Text is sent a paragraph at a time, so the channel gets readable messages instead of
+    one per model chunk, and the model stream never waits on the HTTP call.
+    """
+
+    def __init__(self, url, session=None):
+        import requests
+
+        self.url = url
+        self.session = session or requests
+        self.buffer = ""
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, text):
+        self.buffer += text
+        head, sep, self.buffer = self.buffer.rpartition("\n\n")
+        if head.strip():
+            self.queue.put(head.strip())
+
+    def close(self):
+        """Sends what's left and waits for the pending posts."""
+        if self.buffer.strip():
+            self.queue.put(self.buffer.strip())
+        self.buffer = ""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            text = self.queue.get()
+            if text is None:
+                return
+            try:
+                self.session.post(self.url, json={"text": text}, timeout=10).raise_for_status()
+            except Exception as e:
+                print(f"⚠️ Could not post analysis text to {self.url}: {e}")
+
+
+def format_decision(decision):
+    """The decision as the agent used to phrase it, e.g. "Take Profit 70000, Stop Loss 66000, Buy Yes"."""
+    return (f"Take Profit {decision['take_profit']:g}, Stop Loss {decision['stop_loss']:g}, "
+            f"Buy {decision['buy'].capitalize()}")
+
+async def timed_step(timings, name, func, *args):
+    """Runs a blocking step in a worker thread and records its wall time in timings[name] and a span."""
+    start = time.perf_counter()
+    try:
+        with tracing.span(name):
+            return await asyncio.to_thread(func, *args)
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+async def fetch_series_async(symbols, start_date, end_date, cache, timings, max_bars=None):
+    """Fetches every symbol's rows with one multi-symbol query, through the cache if there is one
+    (which queries only the symbols and dates it lacks).
+
+    With max_bars, all symbols are instead read from the one timeframe of PROMPT_TIMEFRAMES
+    that pick_series_timeframe() chooses. Returns (series, timeframe), series being None
+    on a database error.
+    """
+    timeframe = '1d'
+    if max_bars:
+        timeframe = await timed_step(timings, "pick timeframe", pick_series_timeframe, DATABASE_URL, symbols,
+                                     start_date, end_date, max_bars, PROMPT_TIMEFRAMES)
+        if timeframe is None:
+            return None, None
+    if timeframe == '1d':
+        fetch = cache.get_many if cache else partial(fetch_multi_from_supabase, DATABASE_URL)
+        series = await timed_step(timings, "fetch ohlcv", fetch, symbols, start_date, end_date)
+        return series, timeframe
+    results = await asyncio.gather(*(
+        timed_step(timings, f"fetch {s}", fetch_data_from_supabase, DATABASE_URL, s, start_date, end_date,
+                   timeframe) for s in symbols
+    ))
+    if any(rows is None for rows in results):
+        return None, timeframe
+    return dict(zip(symbols, results)), timeframe
+
+
+def build_prompt_data(stock_rows, symbol, btc_rows, token_budget=PROMPT_TOKEN_BUDGET, timeframe='1d'):
+    """Returns (stock_text, btc_text, summary_text) for the prompt.
+
+    With a positive token_budget the series are downsampled to fit it and summary
+    statistics are added, labelled for the rows' timeframe; with 0 the full tables are
+    sent verbatim, as before.
+    """
+    if token_budget:
+        from prompt_encoding import encode_prompt_data
+        return encode_prompt_data(stock_rows, symbol, btc_rows, BTC_SYMBOL, token_budget, timeframe)
+    return format_data_for_prompt(stock_rows, symbol), format_data_for_prompt(btc_rows, BTC_SYMBOL), ""
+
+
+def check_request(start_date, end_date):
+    """Raises AnalysisError for malformed dates or a missing DATABASE_URL / GEMINI_API_KEY."""
+    # Validate date format
+    try:
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
+    except ValueError:
+        raise AnalysisError("Error: Dates must be in YYYY-MM-DD format.")
+
+    # Check if environment variables are properly set
+    if not DATABASE_URL:
+        raise AnalysisError("Error: DATABASE_URL environment variable not set.")
+    if not GEMINI_API_KEY:
+        raise AnalysisError("Error: GEMINI_API_KEY environment variable not set.")
+
+
+async def run_analysis_async(symbol, start_date, end_date, cache=None, session=None, timings=None,
+                             token_budget=PROMPT_TOKEN_BUDGET, response_cache=None, max_bars=None, decide=False,
+                             stream=False, on_chunk=None, on_decision=None):
+    """Fetches the symbol and BTC series, the live WBTC price, and returns Gemini's analysis.
+
+    The independent I/O steps (OHLCV reads, CoinAPI price, model setup) run concurrently,
+    so the wait is the slowest step instead of their sum. Per-step wall times are stored
+    in `timings` when a dict is given. Database connections stay in the shared pool, so
+    callers that run many analyses (see analysis_service.py) keep them warm; call
+    close_db_pools() when done. Pass an AnalysisCache as response_cache to reuse earlier
+    answers for identical data. With max_bars, long ranges are read from the weekly or
+    monthly rollups (bypassing the daily cache) instead of every daily row, at the same
+    timeframe for both symbols. With decide,
+    the same model call also returns the trade decision, and the result is the
+    decision dict from decide_with_gemini() instead of the analysis text. stream does the
+    same through stream_with_gemini(), calling on_chunk/on_decision (from a worker thread)
+    as the text and the decision arrive.
+    Raises AnalysisError for invalid input, missing configuration or database errors.
+    """
+    check_request(start_date, end_date)
+
+    timings = {} if timings is None else timings
+    symbols = list(dict.fromkeys([symbol, BTC_SYMBOL]))
+    print(f"Fetching {symbol} and {BTC_SYMBOL} data, the WBTC/USDT price and the model concurrently...")
+    # An answer from the response cache never needs the model, so with a cache the Gemini
+    # SDK is only imported and configured on a miss (analyze/decide_with_gemini do that)
+    model_setup = (timed_step(timings, "model setup", get_gemini_model, GEMINI_API_KEY)
+                   if stream or not response_cache else asyncio.sleep(0))
+    gather_start = time.perf_counter()
+    (series, timeframe), btc_price, model = await asyncio.gather(
+        fetch_series_async(symbols, start_date, end_date, cache, timings, max_bars),
+        # Get current BTC (WBTC) price through the shared price oracle
+        timed_step(timings, "wbtc price", get_wbtc_usdt_price, COINAPI_KEY, session),
+        model_setup,
+    )
+    timings["gather"] = time.perf_counter() - gather_start
+
+    if series is None:
+        raise AnalysisError("Exiting due to database error when fetching stock and BTC data.")
+    if cache:
+        stats = cache.stats()
+        print(f"✅ OHLCV cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+              f"{stats['rows_fetched']} row(s) fetched from the database.")
+
+    # Format both datasets
+    encode_start = time.perf_counter()
+    formatted_stock_data, formatted_btc_data, summary = build_prompt_data(
+        series[symbol], symbol, series[BTC_SYMBOL], token_budget, timeframe)
+    timings["prompt encode"] = time.perf_counter() - encode_start
+    prompt_data = formatted_stock_data + formatted_btc_data + summary
+    tracing.record("prompt build", timings["prompt encode"], chars=len(prompt_data))
+    from prompt_encoding import estimate_tokens
+    print(f"✅ Prompt data: {len(prompt_data)} chars (~{estimate_tokens(prompt_data)} tokens, "
+          f"budget {token_budget or 'unlimited'}) encoded in {timings['prompt encode'] * 1000:.1f} ms.")
+
+    # Analyze both datasets together
+    if stream:
+        analyze = partial(stream_with_gemini, on_chunk=on_chunk, on_decision=on_decision, timings=timings)
+        cache_arg = ()
+    else:
+        analyze = decide_with_gemini if decide else analyze_with_gemini
+        cache_arg = (response_cache,)
+    analysis = await timed_step(timings, "model call", analyze, GEMINI_API_KEY,
+                                formatted_stock_data, formatted_btc_data, btc_price, model, summary,
+                                *cache_arg)
+    if response_cache and not stream:
+        stats = response_cache.stats()
+        print(f"✅ Response cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+              f"hit rate {stats['hit_rate']:.0%}.")
+    print("⏱️ Stage timings: " + ", ".join(f"{name} {secs:.3f}s" for name, secs in timings.items()))
+    return analysis
+
+
+def run_analysis(symbol, start_date, end_date, cache=None, session=None, timings=None,
+                 token_budget=PROMPT_TOKEN_BUDGET, response_cache=None, max_bars=None, decide=False,
+                 stream=False, on_chunk=None, on_decision=None):
+    """Synchronous wrapper around run_analysis_async() for command-line use."""
+    return asyncio.run(run_analysis_async(symbol, start_date, end_date, cache, session, timings, token_budget,
+                                          response_cache, max_bars, decide, stream, on_chunk, on_decision))
+
+
+def make_ohlcv_cache():
+    """Returns the local OHLCV cache, or None (with a warning) when pyarrow is unavailable."""
+    from ohlcv_cache import OhlcvCache, DEFAULT_CACHE_DIR
+
+    try:
+        return OhlcvCache(partial(fetch_data_from_supabase, DATABASE_URL), OHLCV_CACHE_DIR or DEFAULT_CACHE_DIR,
+                          fetch_many=partial(fetch_multi_from_supabase, DATABASE_URL))
+    except ImportError as e:
+        print(f"⚠️ {e}; reading straight from the database.")
+        return None
+
+
+def make_response_cache():
+    """Returns the on-disk cache of model answers (see analysis_cache.py)."""
+    return AnalysisCache(ANALYSIS_CACHE_DIR, ttl=ANALYSIS_CACHE_TTL)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Fetch stock data and BTC data, then analyze with Gemini.")
     parser.add_argument("--symbol", required=True, help="Stock symbol (e.g., AAPL)")
     parser.add_argument("--start-date", required=True, help="Start date (YYYY-MM-DD)")
     parser.add_argument("--end-date", required=True, help="End date (YYYY-MM-DD)")
+    parser.add_argument("--no-cache", action="store_true", help="Always read OHLCV data straight from the database")
+    parser.add_argument("--no-response-cache", action="store_true",
+                        help="Always ask the model, even if the same data was analyzed recently")
+    parser.add_argument("--token-budget", type=int, default=PROMPT_TOKEN_BUDGET,
+                        help=f"Approximate prompt tokens for the price data, 0 sends every daily row "
+                             f"(default: {PROMPT_TOKEN_BUDGET})")
+    parser.add_argument("--max-bars", type=int,
+                        help="Read both series from the finest of the daily, weekly and monthly tables "
+                             "that covers the range in at most this many bars (default: always daily)")
+    parser.add_argument("--decide", action="store_true",
+                        help="Also get the Take Profit / Stop Loss / Buy decision from the same model call "
+                             "and store it like ai_agent_trade.py does")
+    parser.add_argument("--run-id", help="With --decide, also store the parameters under this run id "
+                                         "(the n8n execution id)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Like --decide, but print the analysis as it streams in and store the decision "
+                             "as soon as its line arrives")
+    parser.add_argument("--post-url", help='With --stream, also POST the analysis a paragraph at a time as '
+                                           '{"text": ...} to this URL (e.g. a Slack incoming webhook)')
     args = parser.parse_args()
+    if args.run_id is not None:
+        from ai_agent_trade import RUN_ID_RE
+        if not RUN_ID_RE.fullmatch(args.run_id):
+            parser.error(f"invalid run id {args.run_id!r} (use letters, digits, '-' and '_')")
+    if args.run_id:
+        tracing.set_run_id(args.run_id)
 
-    # Validate date format
+    # Fail on bad input before the caches (and pyarrow) are loaded
     try:
-        datetime.strptime(args.start_date, '%Y-%m-%d')
-        datetime.strptime(args.end_date, '%Y-%m-%d')
-    except ValueError:
-        print("Error: Dates must be in YYYY-MM-DD format.")
+        check_request(args.start_date, args.end_date)
+    except AnalysisError as e:
+        print(e)
         return
+    # The parameter store (and sqlite3) is only loaded for a request that gets this far
+    from ai_agent_trade import save_params
 
-    # Check if environment variables are properly set
-    if not DATABASE_URL:
-        print("Error: DATABASE_URL environment variable not set.")
-        return
-    if not GEMINI_API_KEY:
-        print("Error: GEMINI_API_KEY environment variable not set.")
-        return
+    # Serve OHLCV rows from the local cache when possible, falling back to plain database reads
+    cache = None if args.no_cache else make_ohlcv_cache()
+    response_cache = None if args.no_response_cache else make_response_cache()
+    poster = ChunkPoster(args.post_url) if args.stream and args.post_url else None
+    timings = {}
 
-    # Fetch data for the user-specified symbol
-    stock_data = fetch_data_from_supabase(DATABASE_URL, args.symbol, args.start_date, args.end_date)
-    if stock_data is None:
-        print("Exiting due to database error when fetching stock data.")
-        return
-    
-    # Automatically fetch BTC data for the same date range
-    btc_symbol = "BTCUSD"
-    print(f"Also fetching {btc_symbol} data for the same time period...")
-    btc_data = fetch_data_from_supabase(DATABASE_URL, btc_symbol, args.start_date, args.end_date)
-    if btc_data is None:
-        print(f"Exiting due to database error when fetching {btc_symbol} data.")
+    def on_chunk(text):
+        if poster:
+            poster.add(text)
+        print(text, end="", flush=True)
+
+    def on_decision(decision):
+        # Stored before the rest of the reply arrives, so the monitors can pick it up right away
+        save_params(decision, args.run_id)
+
+    try:
+        if args.stream:
+            print("\nAI Analysis Result:")
+        analysis = run_analysis(args.symbol, args.start_date, args.end_date, cache, timings=timings,
+                                token_budget=args.token_budget, response_cache=response_cache,
+                                max_bars=args.max_bars, decide=args.decide, stream=args.stream,
+                                on_chunk=on_chunk, on_decision=on_decision)
+    except AnalysisError as e:
+        print(e)
         return
+    finally:
+        close_db_pools()
+        if poster:
+            poster.close()
 
-    # Format both datasets
-    formatted_stock_data = format_data_for_prompt(stock_data, args.symbol)
-    formatted_btc_data = format_data_for_prompt(btc_data, btc_symbol)
-    
-    # Get current BTC (WBTC) price from CoinAPI
-    btc_price = get_wbtc_usdt_price(COINAPI_KEY)
-    
-    # Analyze both datasets together
-    analysis = analyze_with_gemini(GEMINI_API_KEY, formatted_stock_data, formatted_btc_data, btc_price)
+    if args.stream:
+        print(f"\n⏱️ First token after {timings['first token']:.3f}s, decision after {timings['decision']:.3f}s "
+              f"({format_decision(analysis)}), full reply after {timings['model call']:.3f}s")
+        return
+    if args.decide:
+        decision = analysis
+        save_params({k: decision[k] for k in ('take_profit', 'stop_loss', 'buy')}, args.run_id)
+        analysis = f"{decision['analysis']}\n\n{format_decision(decision)}"
 
     print("\nAI Analysis Result:")
     print(analysis)
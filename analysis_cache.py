@@ -0,0 +1,123 @@
+"""Local disk cache of model analyses, keyed by a fingerprint of everything in the prompt.
+
+The key is a SHA-256 of the model name, the prompt template, the formatted datasets
+and the BTC price rounded to `price_bucket`, so repeated /analyze calls over unchanged
+daily_ohlcv data are answered without another model call, while any new row, a
+different model or an edited prompt produces a new key. Entries are JSON files that
+expire after `ttl` seconds; once the directory grows past `max_bytes` the least
+recently used entries (by file mtime, refreshed on every hit) are removed.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = ".analysis_cache"
+DEFAULT_TTL = 3600  # seconds
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_PRICE_BUCKET = 500.0  # USD
+
+
+def price_bucket(price, bucket=DEFAULT_PRICE_BUCKET):
+    """Rounds price to the nearest multiple of bucket (None stays None)."""
+    if price is None or not bucket:
+        return price
+    return round(float(price) / bucket) * bucket
+
+
+class AnalysisCache:
+    """Content-addressed, TTL + LRU bounded store of analysis texts."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES,
+                 price_bucket=DEFAULT_PRICE_BUCKET):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.price_bucket = price_bucket
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, model_name, template, *datasets, btc_price=None):
+        """Fingerprint of one prompt; datasets are the formatted strings that fill the template."""
+        payload = json.dumps([model_name, template, list(datasets), price_bucket(btc_price, self.price_bucket)])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached analysis for key, or None if missing or older than ttl."""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if time.time() - entry['created_at'] > self.ttl:
+            with self._lock:
+                self.misses += 1
+                self.expired += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        try:
+            # Touch the file so eviction sees it as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return entry['analysis']
+
+    def put(self, key, analysis):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'created_at': time.time(), 'analysis': analysis}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'expired': self.expired,
+                'evictions': self.evictions,
+            }
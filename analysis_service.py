@@ -0,0 +1,210 @@
+"""Long-running HTTP front end for the analysis in ai_analyze_supabase_coinapi.py.
+
+Keeps the database pool, the Gemini client and the CoinAPI HTTP session warm between
+requests, so n8n no longer pays interpreter start-up, imports and connection setup on
+every /analyze. Endpoints:
+
+    POST /analyze  {"symbol": "AAPL", "start_date": "2024-01-01", "end_date": "2024-06-30"}
+                   -> {"symbol", "analysis", "stdout", "elapsed", "timings"}
+                   with "decide": true (and optionally "run_id"), the same model call
+                   also returns the trade decision, which is stored like
+                   ai_agent_trade.py does and added as "decision": {take_profit, stop_loss, buy}
+                   with "stream": true, the reply is streamed and the response is sent as
+                   soon as the decision line arrives ("complete": false while the model
+                   is still writing); with "post_url", the text is also POSTed there a
+                   paragraph at a time as it streams (see ChunkPoster); only URLs listed
+                   in POST_URL_ALLOWLIST are accepted
+    GET  /health   -> {"status": "ok", "response_cache": {hits, misses, hit_rate, ...}}
+
+Run it next to n8n with `python3 analysis_service.py` (see --help for host/port).
+"""
+import os
+import time
+import asyncio
+import argparse
+import requests
+from dotenv import load_dotenv
+
+import ai_analyze_supabase_coinapi as analyzer
+import tracing
+from ai_agent_trade import save_params, RUN_ID_RE
+from json_http import handle_request, parse_json
+
+# Load environment variables
+load_dotenv()
+
+HOST = os.getenv("ANALYSIS_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.getenv("ANALYSIS_SERVICE_PORT", "8765"))
+MAX_CONCURRENT_ANALYSES = analyzer.DB_POOL_MAX_CONNECTIONS
+# Comma-separated URLs a request's "post_url" may name (e.g. the Slack incoming webhook); none by default
+POST_URL_ALLOWLIST = {url.strip() for url in os.getenv("POST_URL_ALLOWLIST", "").split(",") if url.strip()}
+
+
+class AnalysisService:
+    """Serves analyses over HTTP, reusing one set of warm clients for every request."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_ANALYSES, use_cache=True, use_response_cache=True,
+                 post_urls=POST_URL_ALLOWLIST):
+        self.session = requests.Session()
+        self.post_urls = post_urls
+        self.cache = analyzer.make_ohlcv_cache() if use_cache else None
+        self.response_cache = analyzer.make_response_cache() if use_response_cache else None
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+    def warm_up(self):
+        """Opens the database pool and configures the model before the first request arrives."""
+        if not analyzer.DATABASE_URL or not analyzer.GEMINI_API_KEY:
+            raise RuntimeError("Please set DATABASE_URL and GEMINI_API_KEY in your .env")
+        analyzer.get_db_pool(analyzer.DATABASE_URL)
+        analyzer.get_gemini_model(analyzer.GEMINI_API_KEY)
+
+    async def analyze(self, payload):
+        try:
+            symbol = payload['symbol']
+            start_date = payload['start_date']
+            end_date = payload['end_date']
+        except (KeyError, TypeError):
+            return 400, {'error': "Body must be JSON with 'symbol', 'start_date' and 'end_date'"}
+        decide = bool(payload.get('decide'))
+        run_id = payload.get('run_id')
+        if run_id is not None:
+            run_id = str(run_id)
+            if not RUN_ID_RE.fullmatch(run_id):
+                return 400, {'error': f"Invalid run_id {run_id!r} (use letters, digits, '-' and '_')"}
+        post_url = payload.get('post_url')
+        if post_url is not None and post_url not in self.post_urls:
+            # The service would otherwise POST the analysis to any address a caller names
+            return 400, {'error': "post_url is not in POST_URL_ALLOWLIST"}
+        # Each request is handled in its own task, so this only tags this request's spans
+        tracing.set_run_id(run_id)
+
+        if payload.get('stream'):
+            return await self.analyze_streaming(symbol, start_date, end_date, run_id, post_url)
+
+        started = time.perf_counter()
+        timings = {}
+        async with self.semaphore:
+            try:
+                # Blocking steps run in worker threads, so the event loop stays free for other requests
+                analysis = await analyzer.run_analysis_async(
+                    symbol, start_date, end_date, self.cache, self.session, timings,
+                    response_cache=self.response_cache, decide=decide)
+            except analyzer.AnalysisError as e:
+                return 400, {'error': str(e)}
+        result = {'symbol': symbol}
+        if decide:
+            decision = {k: analysis[k] for k in ('take_profit', 'stop_loss', 'buy')}
+            await asyncio.to_thread(save_params, decision, run_id)
+            result['decision'] = decision
+            analysis = f"{analysis['analysis']}\n\n{analyzer.format_decision(analysis)}"
+        result.update({
+            'analysis': analysis,
+            'stdout': f"AI Analysis Result:\n{analysis}",
+            'elapsed': round(time.perf_counter() - started, 3),
+            'timings': {name: round(secs, 3) for name, secs in timings.items()},
+        })
+        return 200, result
+
+    async def analyze_streaming(self, symbol, start_date, end_date, run_id=None, post_url=None):
+        """Answers as soon as the streamed decision is stored; the rest of the reply finishes in the background."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        timings = {}
+        chunks = []
+        decided = loop.create_future()
+        poster = analyzer.ChunkPoster(post_url) if post_url else None
+
+        def on_chunk(text):
+            chunks.append(text)
+            if poster:
+                poster.add(text)
+
+        def on_decision(decision):
+            # Called on the worker thread, before the rest of the reply arrives
+            save_params(decision, run_id)
+            loop.call_soon_threadsafe(decided.set_result, (decision, "".join(chunks), dict(timings)))
+
+        async def run():
+            async with self.semaphore:
+                try:
+                    return await analyzer.run_analysis_async(
+                        symbol, start_date, end_date, self.cache, self.session, timings,
+                        stream=True, on_chunk=on_chunk, on_decision=on_decision)
+                finally:
+                    if poster:
+                        await asyncio.to_thread(poster.close)
+
+        def report(task):
+            if not task.cancelled() and task.exception() is not None and decided.done():
+                print(f"❌ Streaming analysis of {symbol} failed after the decision: {task.exception()}")
+
+        task = asyncio.ensure_future(run())
+        task.add_done_callback(report)
+        await asyncio.wait([task, decided], return_when=asyncio.FIRST_COMPLETED)
+        if not decided.done():
+            try:
+                task.result()
+            except analyzer.AnalysisError as e:
+                return 400, {'error': str(e)}
+
+        decision, text, decision_timings = decided.result()
+        analysis = text.strip()
+        return 200, {
+            'symbol': symbol,
+            'decision': decision,
+            'complete': task.done(),
+            'analysis': analysis,
+            'stdout': f"AI Analysis Result:\n{analysis}",
+            'elapsed': round(time.perf_counter() - started, 3),
+            'timings': {name: round(secs, 3) for name, secs in decision_timings.items()},
+        }
+
+    async def route(self, method, path, body):
+        if path == '/health':
+            health = {'status': 'ok'}
+            if self.response_cache:
+                health['response_cache'] = self.response_cache.stats()
+            return 200, health
+        if path != '/analyze':
+            return 404, {'error': f'Unknown path {path}'}
+        if method != 'POST':
+            return 405, {'error': 'Use POST'}
+        payload, error = parse_json(body)
+        if error:
+            return error
+        return await self.analyze(payload)
+
+    async def handle(self, reader, writer):
+        await handle_request(reader, writer, self.route)
+
+
+async def serve(host, port, use_cache=True, use_response_cache=True):
+    service = AnalysisService(use_cache=use_cache, use_response_cache=use_response_cache)
+    service.warm_up()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"✅ Analysis service listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        analyzer.close_db_pools()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stock/BTC analyses over HTTP with warm connections.")
+    parser.add_argument("--host", default=HOST, help=f"Interface to bind (default: {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port to listen on (default: {PORT})")
+    parser.add_argument("--no-cache", action="store_true", help="Always read OHLCV data straight from the database")
+    parser.add_argument("--no-response-cache", action="store_true",
+                        help="Always ask the model, even if the same data was analyzed recently")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, use_cache=not args.no_cache,
+                          use_response_cache=not args.no_response_cache))
+    except KeyboardInterrupt:
+        print("Analysis service stopped.")
+
+
+if __name__ == "__main__":
+    main()
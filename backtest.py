@@ -0,0 +1,236 @@
+"""Vectorised backtest of the agent's Take Profit / Stop Loss exits on daily OHLC bars.
+
+Every entry day x TP% x SL% combination is one simulated trade, following the sell
+monitor: buy at the entry day's close, then sell at market on the first later bar
+whose high reaches the TP price (>= TP) or whose low reaches the SL price (<= SL).
+A bar that opens beyond a level fills at its open (a gap). A bar that touches both
+levels is resolved by its direction, o -> l -> h -> c when it closed up and
+o -> h -> l -> c otherwise (the path benchmarks/mexc_stub.py replays). The buy and
+the sell each pay FEE_RATE on the asset received. Trades still open after `horizon`
+bars, or at the end of the data, are marked to that bar's close.
+
+Running maxima of the highs (and minima of the lows) after an entry are monotone, so
+the first touch of every TP (or SL) level of every entry comes from one
+np.searchsorted. Entries are simulated in chunks, optionally in worker processes:
+
+    python3 backtest.py --tp 1:30:1 --sl 1:30:1 --horizon 365 --workers 4
+    python3 backtest.py --symbol BTCUSD --start 2020-01-01   # from daily_ohlcv instead
+"""
+import os
+import time
+import argparse
+import multiprocessing
+
+import numpy as np
+
+DEFAULT_CSV = "bitcoin_daily_ohlc/BTCUSD_Daily_OHLC.csv"
+FEE_RATE = 0.001            # per side, charged on the asset received (MEXC spot taker)
+DEFAULT_HORIZON = 365       # bars a trade may stay open
+MAX_CHUNK_TRADES = 2000000  # trades per chunk, bounds the (entries, tp, sl) arrays
+LOG_BOUND = 8.0             # log price ratios are clipped to +-LOG_BOUND
+
+EXIT_TP, EXIT_SL, EXIT_OPEN = 0, 1, 2
+
+
+def _select(dates, columns, start_date=None, end_date=None):
+    keep = np.ones(len(dates), dtype=bool)
+    if start_date:
+        keep &= dates >= np.datetime64(start_date)
+    if end_date:
+        keep &= dates <= np.datetime64(end_date)
+    return (dates[keep],) + tuple(np.ascontiguousarray(c[keep], dtype=float) for c in columns)
+
+
+def load_csv(path=DEFAULT_CSV, start_date=None, end_date=None):
+    """Reads a Kraken daily OHLC CSV into (dates, open, high, low, close) arrays."""
+    data = np.genfromtxt(path, delimiter=',', names=True)
+    dates = data['timestamp'].astype('int64').astype('datetime64[s]').astype('datetime64[D]')
+    order = np.argsort(dates, kind='stable')
+    return _select(dates[order], [data[k][order] for k in ('open', 'high', 'low', 'close')],
+                   start_date, end_date)
+
+
+def load_daily_ohlcv(symbol, start_date=None, end_date=None, db_url=None):
+    """Reads one symbol's rows from the daily_ohlcv table into (dates, open, high, low, close) arrays."""
+    import ohlcv_ingest  # Only this source needs psycopg2
+
+    conn = ohlcv_ingest.connect(db_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+            SELECT trade_date, open_price, high_price, low_price, close_price
+            FROM daily_ohlcv WHERE symbol = %s ORDER BY trade_date ASC;
+            """, (symbol,))
+            rows = cur.fetchall()
+    finally:
+        conn.close()
+    dates = np.array([r[0] for r in rows], dtype='datetime64[D]')
+    prices = np.array([r[1:] for r in rows], dtype=float).reshape(-1, 4)
+    return _select(dates, prices.T, start_date, end_date)
+
+
+def parse_levels(spec):
+    """'1:30:1' (start:stop:step, inclusive) or '2,5,10', in percent -> fractions."""
+    if ':' in spec:
+        start, stop, step = (float(v) for v in spec.split(':'))
+        values = np.arange(start, stop + step / 2, step)
+    else:
+        values = np.array([float(v) for v in spec.split(',')])
+    return values / 100
+
+
+def first_touch(path, levels):
+    """Index of the first column at which each row of `path` reaches each level.
+
+    `path` (rows, horizon) must be non-decreasing along rows and within +-LOG_BOUND;
+    returns (rows, levels) ints, `horizon` where a row never reaches the level.
+    Rows are shifted apart so one searchsorted over the flattened array serves them all.
+    """
+    rows, horizon = path.shape
+    offsets = np.arange(rows)[:, None] * (2 * LOG_BOUND + 1)
+    idx = np.searchsorted((path + offsets).ravel(), levels[None, :] + offsets, side='left')
+    return idx - np.arange(rows)[:, None] * horizon
+
+
+def simulate(open_, high, low, close, entries, tp, sl, horizon=DEFAULT_HORIZON, fee_rate=FEE_RATE):
+    """Simulates every entry x tp x sl trade.
+
+    entries are bar indices; tp and sl are fractions (0.05 = 5%). Returns (returns,
+    exit_kind, bars_held), each shaped (entries, tp, sl); exit_kind is EXIT_TP, EXIT_SL
+    or EXIT_OPEN (still open at the horizon / end of data, marked to close).
+    """
+    n = len(close)
+    entries = np.asarray(entries)
+    tp, sl = np.asarray(tp, dtype=float), np.asarray(sl, dtype=float)
+    entry_price = close[entries]
+
+    # Bars after each entry; past the end of the data, values that never trigger
+    cols = entries[:, None] + 1 + np.arange(horizon)
+    inside = cols < n
+    cols = np.minimum(cols, n - 1)
+    ratio_bound = (-LOG_BOUND, LOG_BOUND)
+    up = np.where(inside, np.log(high[cols] / entry_price[:, None]), -LOG_BOUND).clip(*ratio_bound)
+    down = np.where(inside, -np.log(low[cols] / entry_price[:, None]), -LOG_BOUND).clip(*ratio_bound)
+    tp_bar = first_touch(np.maximum.accumulate(up, axis=1), np.log1p(tp))[:, :, None]
+    sl_bar = first_touch(np.maximum.accumulate(down, axis=1), -np.log1p(-sl))[:, None, :]
+
+    exit_offset = np.minimum(tp_bar, sl_bar)
+    hit = exit_offset < horizon
+    last = np.minimum(entries + horizon, n - 1)[:, None, None]
+    bar = np.where(hit, entries[:, None, None] + 1 + exit_offset, last)
+
+    entry_price = entry_price[:, None, None]
+    tp_price = entry_price * (1 + tp)[None, :, None]
+    sl_price = entry_price * (1 - sl)[None, None, :]
+    o, c = open_[bar], close[bar]
+    # Both levels on the same bar: a gap decides, otherwise the bar's direction does
+    sl_first = np.where(o <= sl_price, True, np.where(o >= tp_price, False, c >= o))
+    is_tp = hit & ((tp_bar < sl_bar) | ((tp_bar == sl_bar) & ~sl_first))
+    is_sl = hit & ~is_tp
+    exit_price = np.where(is_tp, np.maximum(tp_price, o), np.where(is_sl, np.minimum(sl_price, o), c))
+
+    returns = exit_price / entry_price * (1 - fee_rate) ** 2 - 1
+    kind = np.where(is_tp, EXIT_TP, np.where(is_sl, EXIT_SL, EXIT_OPEN))
+    return returns, kind, bar - entries[:, None, None]
+
+
+def _chunk_stats(args):
+    """Per-(tp, sl) sums over one chunk of entries (small enough to send back from a worker)."""
+    bars, entries, tp, sl, horizon, fee_rate = args
+    returns, kind, held = simulate(*bars, entries, tp, sl, horizon, fee_rate)
+    return {
+        'count': len(entries),
+        'return': returns.sum(axis=0),
+        'return_sq': (returns ** 2).sum(axis=0),
+        'wins': (returns > 0).sum(axis=0),
+        'tp': (kind == EXIT_TP).sum(axis=0),
+        'sl': (kind == EXIT_SL).sum(axis=0),
+        'held': held.sum(axis=0),
+    }
+
+
+def run_grid(bars, tp, sl, entries=None, horizon=DEFAULT_HORIZON, fee_rate=FEE_RATE, workers=1, chunk_size=None):
+    """Backtests the tp x sl grid over all entries (default: every bar but the last).
+
+    bars is (open, high, low, close). Returns per-(tp, sl) statistics: 'mean_return',
+    'std_return', 'win_rate', 'tp_rate', 'sl_rate', 'open_rate', 'mean_held' and 'trades'.
+    """
+    open_, high, low, close = bars
+    if entries is None:
+        entries = np.arange(len(close) - 1)
+    chunk_size = chunk_size or max(1, MAX_CHUNK_TRADES // (len(tp) * len(sl)))
+    tasks = [((open_, high, low, close), entries[i:i + chunk_size], tp, sl, horizon, fee_rate)
+             for i in range(0, len(entries), chunk_size)]
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            chunks = pool.map(_chunk_stats, tasks)
+    else:
+        chunks = [_chunk_stats(task) for task in tasks]
+
+    totals = {key: sum(chunk[key] for chunk in chunks) for key in chunks[0]}
+    count = totals['count']
+    mean = totals['return'] / count
+    return {
+        'trades': count * len(tp) * len(sl),
+        'mean_return': mean,
+        'std_return': np.sqrt(np.maximum(totals['return_sq'] / count - mean ** 2, 0)),
+        'win_rate': totals['wins'] / count,
+        'tp_rate': totals['tp'] / count,
+        'sl_rate': totals['sl'] / count,
+        'open_rate': 1 - (totals['tp'] + totals['sl']) / count,
+        'mean_held': totals['held'] / count,
+    }
+
+
+def print_top(stats, tp, sl, top):
+    order = np.argsort(stats['mean_return'], axis=None)[::-1][:top]
+    print(f"{'TP%':>6} {'SL%':>6} {'mean':>8} {'std':>7} {'win':>6} {'TP hit':>7} {'SL hit':>7} {'open':>6} {'days':>6}")
+    for i, j in zip(*np.unravel_index(order, stats['mean_return'].shape)):
+        print(f"{tp[i] * 100:6.1f} {sl[j] * 100:6.1f} {stats['mean_return'][i, j] * 100:7.2f}% "
+              f"{stats['std_return'][i, j] * 100:6.1f}% {stats['win_rate'][i, j] * 100:5.1f}% "
+              f"{stats['tp_rate'][i, j] * 100:6.1f}% {stats['sl_rate'][i, j] * 100:6.1f}% "
+              f"{stats['open_rate'][i, j] * 100:5.1f}% {stats['mean_held'][i, j]:6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest TP/SL settings on daily OHLC history')
+    parser.add_argument('--file', default=DEFAULT_CSV, help=f'Kraken daily OHLC CSV (default: {DEFAULT_CSV})')
+    parser.add_argument('--symbol', help='Read this symbol from daily_ohlcv (DATABASE_URL) instead of the CSV')
+    parser.add_argument('--start', help='First entry date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='Last date of data used (YYYY-MM-DD)')
+    parser.add_argument('--tp', default='1:30:1', help="Take profit levels in percent, 'start:stop:step' or 'a,b,c'")
+    parser.add_argument('--sl', default='1:30:1', help="Stop loss levels in percent, 'start:stop:step' or 'a,b,c'")
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON, help='Bars a trade may stay open')
+    parser.add_argument('--fee', type=float, default=FEE_RATE, help='Fee per side (fraction)')
+    parser.add_argument('--entry-every', type=int, default=1, help='Enter on every Nth bar')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (0: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, help='Entries per chunk (default: sized to the grid)')
+    parser.add_argument('--top', type=int, default=10, help='Best settings to show')
+    args = parser.parse_args()
+
+    if args.symbol:
+        dates, *bars = load_daily_ohlcv(args.symbol, end_date=args.end)
+        source = args.symbol
+    else:
+        dates, *bars = load_csv(args.file, end_date=args.end)
+        source = os.path.basename(args.file)
+    tp, sl = parse_levels(args.tp), parse_levels(args.sl)
+    first = np.searchsorted(dates, np.datetime64(args.start)) if args.start else 0
+    entries = np.arange(first, len(dates) - 1, args.entry_every)
+    if len(entries) == 0:
+        print("No entry dates in range.")
+        return
+    workers = args.workers or os.cpu_count()
+
+    print(f"Backtesting {source}: {len(dates)} bars {dates[0]}..{dates[-1]}, "
+          f"{len(entries)} entries x {len(tp)} TP x {len(sl)} SL, horizon {args.horizon} bars")
+    t0 = time.perf_counter()
+    stats = run_grid(bars, tp, sl, entries, args.horizon, args.fee, workers, args.chunk_size)
+    elapsed = time.perf_counter() - t0
+    print(f"✅ {stats['trades']:,} trades in {elapsed:.2f}s ({stats['trades'] / elapsed:,.0f} simulations/s, "
+          f"{workers} worker{'s' if workers > 1 else ''})")
+    print_top(stats, tp, sl, args.top)
+
+
+if __name__ == "__main__":
+    main()
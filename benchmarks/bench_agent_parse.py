@@ -0,0 +1,96 @@
+"""Throughput of ai_agent_trade.py's parser over a synthetic corpus of archived agent outputs.
+
+The corpus mixes the phrasings the parser accepts ("Take Profit", "Take Profits",
+"Take Profit Level", ...), long analysis text before the verdict and a share of
+outputs with no usable TP/SL. It compares the previous per-message parse (up to six
+uncompiled re.search calls) with parse_agent_output(), checks that both agree, and
+times the JSONL batch mode end to end:
+
+    python3 benchmarks/bench_agent_parse.py --messages 50000
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from ai_agent_trade import parse_agent_output, parse_batch
+
+FILLER = ("AAPL closed higher for the third session while BTC consolidated below resistance; "
+          "the 30-day correlation of daily returns is moderate and volatility has eased. ")
+VERDICTS = [
+    "Take Profit {tp}, Stop Loss {sl}, Buy {buy}",
+    "Take Profits {tp}\nStop Losses {sl}\nBuy: {buy}",
+    "Take Profit Level {tp} and Stop Loss Level {sl}. Buy: {buy}",
+    "I recommend: Take Profit {tp}, Stop Loss {sl}. Buy {buy}.",
+    "No clear signal today, so I would not set levels. Buy: {buy}",
+]
+
+
+def legacy_parse(agent_msg):
+    """The parser as it was: sequential uncompiled searches per field."""
+    tp_match = re.search(r'Take Profit\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
+    if not tp_match:
+        tp_match = re.search(r'Take Profits\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
+        if not tp_match:
+            tp_match = re.search(r'Take Profit Level\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
+    sl_match = re.search(r'Stop Loss\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
+    if not sl_match:
+        sl_match = re.search(r'Stop Losses\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
+        if not sl_match:
+            sl_match = re.search(r'Stop Loss Level\s*([0-9]+(?:\.[0-9]+)?)', agent_msg)
+    if not tp_match or not sl_match:
+        return None
+    buy = "yes" if re.search(r'Buy\s*(?:\:|)\s*yes', agent_msg, re.IGNORECASE) else "no"
+    return {"take_profit": float(tp_match.group(1)), "stop_loss": float(sl_match.group(1)), "buy": buy}
+
+
+def synthetic_corpus(n, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(n):
+        verdict = rng.choice(VERDICTS).format(tp=round(rng.uniform(60000, 130000), rng.choice([0, 2])),
+                                              sl=round(rng.uniform(40000, 90000), rng.choice([0, 2])),
+                                              buy=rng.choice(["yes", "no", "Yes", "NO"]))
+        messages.append(FILLER * rng.randint(2, 20) + verdict)
+    return messages
+
+
+def timed(func, items):
+    t0 = time.perf_counter()
+    results = [func(item) for item in items]
+    return time.perf_counter() - t0, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark agent-output parsing')
+    parser.add_argument('--messages', type=int, default=50000)
+    args = parser.parse_args()
+
+    messages = synthetic_corpus(args.messages)
+    size_mb = sum(len(m) for m in messages) / 1e6
+    print(f"{len(messages)} agent outputs, {size_mb:.1f} MB of text:")
+
+    legacy_s, expected = timed(legacy_parse, messages)
+    compiled_s, got = timed(parse_agent_output, messages)
+    agree = sum(a == b for a, b in zip(expected, got))
+    print(f"  legacy searches     {len(messages) / legacy_s:10,.0f} messages/s")
+    print(f"  parse_agent_output  {len(messages) / compiled_s:10,.0f} messages/s "
+          f"({legacy_s / compiled_s:.1f}x), agrees on {agree}/{len(messages)}")
+
+    jsonl = "".join(json.dumps({"id": i, "output": m}) + "\n" for i, m in enumerate(messages))
+    out = io.StringIO()
+    t0 = time.perf_counter()
+    parsed, failed = parse_batch(io.StringIO(jsonl), out)
+    batch_s = time.perf_counter() - t0
+    print(f"  --batch JSONL       {len(messages) / batch_s:10,.0f} messages/s "
+          f"({size_mb / batch_s:.0f} MB/s), {parsed} parsed, {failed} failure records")
+
+
+if __name__ == "__main__":
+    main()
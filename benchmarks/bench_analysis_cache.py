@@ -0,0 +1,96 @@
+"""Replays a burst of repeated /analyze commands with and without the response cache.
+
+A busy channel asks for the same few symbol/date combinations again and again while
+the BTC price drifts a little. The Postgres fetch is replaced in-process by canned rows,
+and CoinAPI and the Gemini endpoint are local stand-ins (the model one counts its calls):
+
+    python3 benchmarks/bench_analysis_cache.py --commands 40 --model-delay 1.0
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import datetime
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from local_server import start_server
+
+
+def canned_rows(seed, days=365):
+    start = datetime.date(2023, 1, 1)
+    return [(start + datetime.timedelta(days=i), 100.0 + seed + i % 50, 101.0 + seed + i % 50,
+             99.0 + seed + i % 50, 100.5 + seed + i % 50, 1000 + i) for i in range(days)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Gemini response cache')
+    parser.add_argument('--commands', type=int, default=40)
+    parser.add_argument('--model-delay', type=float, default=1.0, help='Stand-in model response delay (s)')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    model_calls = []
+    price = {'rate': 65000.0}
+
+    def coinapi(method, query, body):
+        # Random walk of about +-0.1% per call, mostly staying inside one price bucket
+        price['rate'] *= 1 + rng.uniform(-0.001, 0.001)
+        return 200, dict(price)
+
+    def model(method, query, body):
+        model_calls.append(1)
+        time.sleep(args.model_delay)
+        return 200, {'candidates': [{
+            'content': {'role': 'model', 'parts': [{'text': 'Trend analysis ...'}]},
+            'finishReason': 'STOP',
+        }]}
+
+    server, base_url = start_server({
+        '/v1/exchangerate/WBTC/USDT': coinapi,
+        '/v1beta/models/gemini-2.0-flash:generateContent': model,
+    })
+    cache_dir = tempfile.mkdtemp(prefix='analysis_cache_bench_')
+    os.environ.update(DATABASE_URL='postgresql://stand-in', GEMINI_API_KEY='bench', COINAPI_KEY='bench',
+                      COINAPI_URL=base_url, GEMINI_API_ENDPOINT=base_url,
+                      # Every call goes to the CoinAPI stand-in, as before price_oracle.py
+                      PRICE_SOURCES='coinapi', PRICE_MAX_AGE='0')
+
+    import ai_analyze_supabase_coinapi as analyzer
+    from analysis_cache import AnalysisCache
+
+    rows = {s: canned_rows(n) for n, s in enumerate(['AAPL', 'MSFT', 'NVDA', 'BTCUSD'])}
+    analyzer.fetch_multi_from_supabase = lambda db_url, symbols, start, end: {s: rows[s] for s in symbols}
+
+    windows = [('2023-01-01', '2023-06-30'), ('2023-03-01', '2023-12-31')]
+    burst = [(rng.choice(['AAPL', 'MSFT', 'NVDA']), *rng.choice(windows)) for _ in range(args.commands)]
+
+    results = {}
+    try:
+        for name, response_cache in (('no cache', None), ('response cache', AnalysisCache(cache_dir))):
+            del model_calls[:]
+            latencies = []
+            for symbol, start, end in burst:
+                t0 = time.perf_counter()
+                analyzer.run_analysis(symbol, start, end, response_cache=response_cache)
+                latencies.append(time.perf_counter() - t0)
+            results[name] = (latencies, len(model_calls), response_cache.stats() if response_cache else None)
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"\n{args.commands} commands over 3 symbols x 2 ranges, model delay {args.model_delay}s:")
+    for name, (latencies, calls, stats) in results.items():
+        line = (f"  {name:<15} total {sum(latencies):7.2f}s  median {statistics.median(latencies) * 1000:8.1f} ms  "
+                f"model calls {calls:3d}")
+        if stats:
+            line += f"  hit rate {stats['hit_rate']:.0%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Checks that the analysis pipeline overlaps its independent I/O steps.
+
+Every dependency is a local stand-in with a fixed delay: the Postgres fetch is replaced
+in-process by a function that sleeps and returns canned rows, while CoinAPI and the
+Gemini endpoint are served by a local HTTP server. The same steps are then run one
+after another (the old behaviour) and through run_analysis_async():
+
+    python3 benchmarks/bench_analysis_pipeline.py --db-delay 0.3 --coinapi-delay 0.4 --model-delay 0.5
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from local_server import start_server
+
+
+def canned_rows(days):
+    start = datetime.date(2023, 1, 1)
+    return [(start + datetime.timedelta(days=i), 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 1000 + i)
+            for i in range(days)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sequential vs concurrent analysis I/O')
+    parser.add_argument('--db-delay', type=float, default=0.3, help='Stand-in Postgres query delay (s)')
+    parser.add_argument('--coinapi-delay', type=float, default=0.4, help='Stand-in CoinAPI delay (s)')
+    parser.add_argument('--setup-delay', type=float, default=0.2, help='Stand-in model setup delay (s)')
+    parser.add_argument('--model-delay', type=float, default=0.5, help='Stand-in model response delay (s)')
+    args = parser.parse_args()
+
+    def delayed(seconds, payload):
+        def handler(method, query, body):
+            time.sleep(seconds)
+            return 200, payload
+        return handler
+
+    server, base_url = start_server({
+        '/v1/exchangerate/WBTC/USDT': delayed(args.coinapi_delay, {'rate': 65000.0}),
+        '/v1beta/models/gemini-2.0-flash:generateContent': delayed(args.model_delay, {'candidates': [{
+            'content': {'role': 'model', 'parts': [{'text': 'Take Profit 70000, Stop Loss 60000, Buy No'}]},
+            'finishReason': 'STOP',
+        }]}),
+    })
+    os.environ.update(DATABASE_URL='postgresql://stand-in', GEMINI_API_KEY='bench', COINAPI_KEY='bench',
+                      COINAPI_URL=base_url, GEMINI_API_ENDPOINT=base_url,
+                      # Every call goes to the CoinAPI stand-in, as before price_oracle.py
+                      PRICE_SOURCES='coinapi', PRICE_MAX_AGE='0')
+
+    import ai_analyze_supabase_coinapi as analyzer
+
+    rows = canned_rows(180)
+
+    def fake_fetch(db_url, symbols, start_date, end_date):
+        time.sleep(args.db_delay)
+        return {symbol: rows for symbol in symbols}
+
+    real_get_model = analyzer.get_gemini_model
+    # The analyzer imports and configures the SDK on first use; keep that one-off cost out of both timings
+    real_get_model('bench')
+
+    def slow_get_model(api_key):
+        time.sleep(args.setup_delay)
+        return real_get_model(api_key)
+
+    analyzer.fetch_multi_from_supabase = fake_fetch
+    analyzer.get_gemini_model = slow_get_model
+
+    # Sequential: the order main() used before the pipeline became concurrent
+    t0 = time.perf_counter()
+    series = analyzer.fetch_multi_from_supabase(None, ['AAPL', 'BTCUSD'], '2023-01-01', '2023-06-30')
+    price = analyzer.get_wbtc_usdt_price('bench')
+    model = analyzer.get_gemini_model('bench')
+    analyzer.analyze_with_gemini('bench', analyzer.format_data_for_prompt(series['AAPL'], 'AAPL'),
+                                 analyzer.format_data_for_prompt(series['BTCUSD'], 'BTCUSD'), price, model)
+    sequential = time.perf_counter() - t0
+
+    timings = {}
+    t0 = time.perf_counter()
+    analyzer.run_analysis('AAPL', '2023-01-01', '2023-06-30', timings=timings)
+    concurrent = time.perf_counter() - t0
+    server.shutdown()
+
+    io_steps = [args.db_delay, args.coinapi_delay, args.setup_delay]
+    print(f"\nstand-in delays: db {args.db_delay}s, coinapi {args.coinapi_delay}s, "
+          f"model setup {args.setup_delay}s, model call {args.model_delay}s")
+    print(f"  sequential  {sequential:6.3f}s  (expected ~{sum(io_steps) + args.model_delay:.3f}s)")
+    print(f"  concurrent  {concurrent:6.3f}s  (expected ~{max(io_steps) + args.model_delay:.3f}s)")
+    for name, secs in timings.items():
+        print(f"    {name:<14} {secs:6.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Throughput of backtest.py on the Kraken BTCUSD history, checked against a per-bar loop.
+
+The loop walks each trade bar by bar along the same o -> l/h -> c path and sells at the
+first price at or beyond a level, like the monitor. It runs on a random sample of
+trades, which the vectorised results must match; then the full grid runs with 1 and
+--workers processes:
+
+    python3 benchmarks/bench_backtest.py --tp 1:30:1 --sl 1:30:1 --workers 4
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import backtest
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, backtest.DEFAULT_CSV)
+
+
+def loop_trade(open_, high, low, close, entry, tp, sl, horizon, fee_rate):
+    entry_price = close[entry]
+    tp_price, sl_price = entry_price * (1 + tp), entry_price * (1 - sl)
+    last = min(entry + horizon, len(close) - 1)
+    for bar in range(entry + 1, last + 1):
+        o, h, l, c = open_[bar], high[bar], low[bar], close[bar]
+        for k, price in enumerate([o, l, h, c] if c >= o else [o, h, l, c]):
+            if price >= tp_price:
+                exit_price = price if k == 0 else tp_price
+                break
+            if price <= sl_price:
+                exit_price = price if k == 0 else sl_price
+                break
+        else:
+            continue
+        break
+    else:
+        exit_price = close[last]
+    return exit_price / entry_price * (1 - fee_rate) ** 2 - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vectorised TP/SL backtester')
+    parser.add_argument('--file', default=DEFAULT_CSV)
+    parser.add_argument('--tp', default='1:30:1')
+    parser.add_argument('--sl', default='1:30:1')
+    parser.add_argument('--horizon', type=int, default=backtest.DEFAULT_HORIZON)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--samples', type=int, default=2000, help='Trades checked against the loop')
+    args = parser.parse_args()
+
+    dates, *bars = backtest.load_csv(args.file)
+    tp, sl = backtest.parse_levels(args.tp), backtest.parse_levels(args.sl)
+    entries = np.arange(len(dates) - 1)
+    trades = len(entries) * len(tp) * len(sl)
+    print(f"{len(dates)} bars, {len(entries)} entries x {len(tp)} TP x {len(sl)} SL = {trades:,} trades, "
+          f"horizon {args.horizon}")
+
+    rng = np.random.default_rng(0)
+    sample = np.column_stack([rng.integers(0, n, args.samples) for n in (len(entries), len(tp), len(sl))])
+    t0 = time.perf_counter()
+    expected = np.array([loop_trade(*bars, entries[e], tp[i], sl[j], args.horizon, backtest.FEE_RATE)
+                         for e, i, j in sample])
+    loop_rate = args.samples / (time.perf_counter() - t0)
+    returns, _, _ = backtest.simulate(*bars, entries, tp, sl, args.horizon)
+    got = returns[sample[:, 0], sample[:, 1], sample[:, 2]]
+    matches = np.isclose(got, expected, rtol=0, atol=1e-9).sum()
+    print(f"  matches the per-bar loop on {matches}/{args.samples} sampled trades")
+
+    print(f"  per-bar loop     {loop_rate:12,.0f} simulations/s")
+    for workers in sorted({1, args.workers}):
+        t0 = time.perf_counter()
+        backtest.run_grid(bars, tp, sl, entries, args.horizon, workers=workers)
+        elapsed = time.perf_counter() - t0
+        print(f"  vectorised x{workers:<3} {trades / elapsed:12,.0f} simulations/s ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Start-up import cost of the scripts n8n spawns, checked against per-script budgets.
+
+Every case runs a script in a fresh interpreter with `python -X importtime`, on a path
+that ends before any real work: a missing argument, a bad date, a missing file, a
+"no" buy. It reports the summed cumulative time of the top-level imports (the
+interpreter's own start-up imports included) and the process wall time, and fails
+when a case goes over its import budget or loads a module it must not (the heavy
+dependencies are only imported on the paths that use them):
+
+    python3 benchmarks/bench_import_time.py --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+HEAVY = ['google.generativeai', 'psycopg2', 'requests', 'pyarrow', 'pandas', 'numpy']
+
+# (name, script and arguments, extra environment, import budget in ms, modules that must not load)
+CASES = [
+    ('analysis, no arguments', ['ai_analyze_supabase_coinapi.py'], {}, 400, HEAVY),
+    ('analysis, bad date', ['ai_analyze_supabase_coinapi.py', '--symbol', 'AAPL', '--start-date', '2024-13-01',
+                            '--end-date', '2024-12-31'], {}, 400, HEAVY),
+    ('analysis, no DATABASE_URL', ['ai_analyze_supabase_coinapi.py', '--symbol', 'AAPL',
+                                   '--start-date', '2024-01-01', '--end-date', '2024-12-31'], {}, 400, HEAVY),
+    ('kraken, missing file', ['kraken_csv_extract.py', '--file', 'missing.csv'],
+     {'DATABASE_URL': 'postgresql://bench@127.0.0.1:1/bench'}, 300, ['psycopg2', 'pandas']),
+    ('buy, "no"', ['mexc_buy.py', 'no'], {}, 100, ['requests', 'mexc_client']),
+    ('buy, no API keys', ['mexc_buy.py', 'yes'], {}, 100, ['requests', 'mexc_client']),
+    ('agent parse, usage', ['ai_agent_trade.py'], {}, 100, HEAVY),
+]
+
+# Variables that would let a case get past the failure it is meant to hit
+CLEARED_ENV = ['DATABASE_URL', 'GEMINI_API_KEY', 'COINAPI_KEY', 'MEXC_API_KEY', 'MEXC_API_SECRET', 'TRACE_FILE']
+
+
+def run_case(argv, extra_env, work_dir):
+    """Runs one case; returns (import ms, wall s, set of imported module names)."""
+    env = {k: v for k, v in os.environ.items() if k not in CLEARED_ENV}
+    env.update(extra_env, PYTHONDONTWRITEBYTECODE='1')
+    t0 = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(ROOT, argv[0])] + argv[1:],
+                            env=env, cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - t0
+    total_us, modules = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        # Only top-level imports (not indented further), so nested ones aren't counted twice
+        if name.startswith(' ') and not name.startswith('  '):
+            total_us += int(cumulative)
+    return total_us / 1000, wall, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the scripts\' start-up import time against budgets')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case (the best run is reported)')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='import_time_')
+    print(f"\nbest of {args.repeat} runs per case:")
+    print(f"  {'case':<28} {'imports':>10} {'budget':>8} {'wall':>9}  heavy modules loaded")
+    failed = 0
+    for name, argv, extra_env, budget, forbidden in CASES:
+        runs = [run_case(argv, extra_env, work_dir) for _ in range(args.repeat)]
+        import_ms = min(run[0] for run in runs)
+        wall = min(run[1] for run in runs)
+        loaded = sorted(m for m in forbidden if m in runs[0][2])
+        ok = import_ms <= budget and not loaded
+        failed += not ok
+        print(f"  {name:<28} {import_ms:7.1f} ms {budget:5d} ms {wall * 1000:6.0f} ms  "
+              f"{', '.join(loaded) or '-'}{'' if ok else '   <-- FAIL'}")
+    if failed:
+        print(f"\n❌ {failed} case(s) over budget or loading heavy modules")
+        sys.exit(1)
+    print("\n✅ All cases within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Peak memory and rows/sec of kraken_csv_extract.py's streaming reader on a large trade export.
+
+Generates a synthetic Kraken trade file (timestamp,price,volume, no header, in time
+order) of --size-gb, unless --file is given, then aggregates it into daily bars
+three ways, each in a fresh subprocess so peak RSS is measured per mode:
+
+  * full          - pd.read_csv of the whole file, then the old full-column passes and
+                    a groupby by day (what loading it with load_csv()'s approach needs)
+  * stream        - stream_bars() over the whole file in --chunk-rows chunks
+  * stream, since - stream_bars() with the latest stored day --since-days before the
+                    end, so the binary search skips most of the file
+
+Nothing is written to a database.
+
+    python3 benchmarks/bench_kraken_stream.py --size-gb 2 --chunk-rows 1000000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import kraken_csv_extract as kraken
+
+
+def generate_trades(path, size_gb, seed=0, rows_per_chunk=2000000):
+    """Writes a random-walk trade file of roughly size_gb; returns the row count."""
+    rng = np.random.default_rng(seed)
+    ts, price, rows, written = 1381017600.0, 120.0, 0, 0
+    with open(path, 'w') as f:
+        while written < size_gb * 1e9:
+            # About one trade every 5 seconds on average
+            times = ts + np.cumsum(rng.exponential(5.0, rows_per_chunk))
+            prices = price * np.exp(np.cumsum(rng.normal(0, 0.0005, rows_per_chunk)))
+            chunk = pd.DataFrame({'t': times.astype('int64'), 'p': prices.round(1),
+                                  'v': rng.exponential(0.05, rows_per_chunk).round(8)})
+            text = chunk.to_csv(header=False, index=False)
+            f.write(text)
+            written += len(text)
+            rows += rows_per_chunk
+            ts, price = times[-1], prices[-1]
+    return rows
+
+
+def run_full(path):
+    df = pd.read_csv(path, header=None, names=kraken.TRADE_COLUMNS)
+    df['trade_date'] = pd.to_datetime(df['timestamp'], unit='s').dt.date
+    for col in ['price', 'volume']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df = df.sort_values('timestamp')
+    bars = df.groupby('trade_date').agg(open_price=('price', 'first'), high_price=('price', 'max'),
+                                        low_price=('price', 'min'), close_price=('price', 'last'),
+                                        volume=('volume', 'sum'))
+    return len(df), len(bars)
+
+
+def run_stream(path, chunk_rows, since=None):
+    rows = days = 0
+    for bars, rows_read in kraken.stream_bars(path, since, chunk_rows):
+        rows += rows_read
+        days += 0 if bars is None else len(bars['trade_date'])
+    return rows, days
+
+
+def child(args):
+    start = time.perf_counter()
+    if args.mode == 'full':
+        rows, days = run_full(args.file)
+    else:
+        rows, days = run_stream(args.file, args.chunk_rows, args.since)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'rows': rows, 'days': days, 'seconds': elapsed, 'peak_mb': peak_rss_mb()}))
+
+
+def peak_rss_mb():
+    # VmHWM starts over at exec; ru_maxrss can carry the parent's peak from before the fork
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def last_day(path):
+    with open(path, 'rb') as f:
+        f.seek(max(0, f.seek(0, os.SEEK_END) - 4096))
+        last = f.read().splitlines()[-1]
+    return np.datetime64(int(float(last.split(b',', 1)[0])), 's').astype('datetime64[D]')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming Kraken CSV ingest')
+    parser.add_argument('--file', help='Existing Kraken trade CSV (default: generate one)')
+    parser.add_argument('--size-gb', type=float, default=2.0, help='Size of the generated file')
+    parser.add_argument('--chunk-rows', type=int, default=kraken.DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--since-days', type=int, default=30)
+    parser.add_argument('--skip-full', action='store_true', help="Don't run the whole-file read")
+    parser.add_argument('--mode', choices=['full', 'stream'], help=argparse.SUPPRESS)
+    parser.add_argument('--since', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        return child(args)
+
+    path = args.file
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='kraken_stream_bench_'), 'trades.csv')
+        t0 = time.perf_counter()
+        rows = generate_trades(path, args.size_gb)
+        print(f"Generated {rows:,} trades ({os.path.getsize(path) / 1e9:.2f} GB) in {time.perf_counter() - t0:.0f}s")
+
+    since = str(last_day(path) - args.since_days)
+    runs = [('stream', ['--mode', 'stream']), (f'stream, since {since}', ['--mode', 'stream', '--since', since])]
+    if not args.skip_full:
+        runs.insert(0, ('full', ['--mode', 'full']))
+    print(f"\n{path}, chunks of {args.chunk_rows:,} rows:")
+    try:
+        for name, extra in runs:
+            out = subprocess.run([sys.executable, __file__, '--file', path, '--chunk-rows', str(args.chunk_rows)]
+                                 + extra, capture_output=True, text=True)
+            if out.returncode < 0:
+                # SIGKILL here is usually the kernel's OOM killer
+                print(f"  {name:<24} killed by signal {-out.returncode}")
+                continue
+            if out.returncode:
+                print(f"  {name:<24} failed: {out.stderr.strip().splitlines()[-1]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"  {name:<24} {r['seconds']:7.1f}s  {r['rows'] / r['seconds']:12,.0f} rows/s  "
+                  f"peak RSS {r['peak_mb']:7.0f} MB  {r['days']} days")
+    finally:
+        if args.file is None:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
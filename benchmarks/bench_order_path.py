@@ -0,0 +1,105 @@
+"""Order-path latency of mexc_buy.py and mexc_check_balance_and_sell.py against the MEXC stub.
+
+The scripts are pointed at benchmarks/mexc_stub.py through MEXC_BASE_URL, with a fixed
+per-request latency standing in for the network round trip. Each scenario runs
+--iterations times and reports wall time and exchange round trips per operation:
+
+  * buy, key check   - an account request then place_market_buy() (mexc_buy.py's old path)
+  * buy              - place_market_buy() alone (mexc_buy.py's path now)
+  * sell             - place_market_sell() of the whole WBTC balance
+  * sell, Oversold   - the first sell attempt is rejected with "Oversold" (retry path)
+
+The sign/send/ack split of the last signed request of each operation comes from
+MexcClient.last_timings.
+
+    python3 benchmarks/bench_order_path.py --latency 0.05 --iterations 20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import contextlib
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from mexc_stub import MexcStub, PriceReplay
+
+
+def measure(stub, client, iterations, setup, operation):
+    times, round_trips, stages = [], [], []
+    for _ in range(iterations):
+        setup()
+        requests_before = stub.requests
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            operation()
+        times.append(time.perf_counter() - t0)
+        round_trips.append(stub.requests - requests_before)
+        stages.append(client.last_timings)
+    return times, round_trips, stages
+
+
+def report(name, times, round_trips, stages):
+    times = sorted(times)
+    p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+    split = " / ".join(f"{statistics.mean(s[stage] for s in stages) * 1000:.2f}" for stage in ('sign', 'send', 'ack'))
+    print(f"  {name:<16} p50 {statistics.median(times) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+          f"round trips {statistics.mean(round_trips):.1f}  sign/send/ack {split} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the MEXC order path against a local stub')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub delay per request (s)')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--start-date', default='2023-01-01', help='First CSV day the stub replays')
+    parser.add_argument('--speed', type=float, default=86400.0 * 30, help='Simulated seconds per real second')
+    args = parser.parse_args()
+
+    stub = MexcStub(PriceReplay.from_csv(speed=args.speed, start_date=args.start_date),
+                    balances={'USDT': 1000000, 'WBTC': 0}, latency=args.latency)
+    server, base_url = stub.start()
+    os.environ.update(MEXC_BASE_URL=base_url, MEXC_API_KEY=stub.api_key, MEXC_API_SECRET=stub.api_secret,
+                      MEXC_FILTERS_CACHE=os.path.join(tempfile.mkdtemp(prefix='mexc_filters_'), 'filters.json'))
+
+    import mexc_buy
+    import mexc_check_balance_and_sell as sell
+
+    def fund_wbtc():
+        # Sells leave dust below the step size, which market_sell() won't send on its own
+        stub.balances['WBTC'] = max(stub.balances['WBTC'], Decimal('0.001'))
+
+    def oversold_once():
+        fund_wbtc()
+        stub.oversold_next = 1
+
+    def sell_all():
+        sell.place_market_sell(str(sell.client.sellable_quantity(sell.SYMBOL, stub.balances['WBTC'])))
+
+    def checked_buy():
+        # The key check mexc_buy.py used to make before every buy
+        if 'makerCommission' in buy_client.signed_request('GET', '/api/v3/account', {}):
+            mexc_buy.place_market_buy()
+
+    # Like main() does before it starts monitoring
+    sell.client.symbol_filters(sell.SYMBOL)
+    sell.client.warm_up()
+    buy_client = mexc_buy.get_client()
+    buy_client.warm_up()
+
+    print(f"\nstub at {base_url}, {args.latency * 1000:.0f} ms per request, {args.iterations} iterations:")
+    try:
+        report('buy, key check', *measure(stub, buy_client, args.iterations, lambda: None, checked_buy))
+        report('buy', *measure(stub, buy_client, args.iterations, lambda: None, mexc_buy.place_market_buy))
+        report('sell', *measure(stub, sell.client, args.iterations, fund_wbtc, sell_all))
+        report('sell, Oversold', *measure(stub, sell.client, args.iterations, oversold_once, sell_all))
+    finally:
+        server.shutdown()
+    print(f"  {len(stub.orders)} orders filled, balances now "
+          + ", ".join(f"{asset} {value:.6f}" for asset, value in stub.balances.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Parameter handoff between the analysis and the monitors: the SQLite store vs the JSON file.
+
+Measures the monitor's per-tick cost of looking up the current TP/SL - re-parsing
+ai_agent_param.json every tick (the old loop), checking its mtime, and
+ParamsWatcher.get() on the store (PRAGMA data_version) - and then runs --writers
+processes that each store --writes versions under their own run key while a reader
+polls every key, counting torn or lost updates:
+
+    python3 benchmarks/bench_param_store.py --lookups 100000 --writers 4 --writes 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from param_store import ParamStore, DEFAULT_KEY, export_json
+
+
+def per_lookup(func, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - t0) / n
+
+
+def writer(path, key, writes):
+    store = ParamStore(path)
+    for i in range(1, writes + 1):
+        # take_profit - stop_loss always equals 1000, so a torn row would show up
+        store.put(key, 70000 + i, 69000 + i, 'yes')
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parameter store')
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=500)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='param_store_bench_')
+    db_path = os.path.join(work_dir, 'params.db')
+    json_path = os.path.join(work_dir, 'ai_agent_param.json')
+    os.environ['PARAM_STORE_DB'] = db_path
+    os.environ.setdefault('MEXC_API_KEY', 'bench')
+    os.environ.setdefault('MEXC_API_SECRET', 'bench')
+    import mexc_check_balance_and_sell as monitor_module
+    from contextlib import redirect_stdout
+
+    export_json({'take_profit': 70000.0, 'stop_loss': 60000.0, 'buy': 'yes'}, json_path)
+    ParamStore(db_path).put(DEFAULT_KEY, 70000, 60000, 'yes')
+
+    def parse_json():
+        with open(json_path) as f:
+            json.load(f)
+
+    file_watcher = monitor_module.ParamsWatcher(path=json_path, store=ParamStore(os.path.join(work_dir, 'empty.db')))
+    store_watcher = monitor_module.ParamsWatcher(store=ParamStore(db_path))
+    with redirect_stdout(open(os.devnull, 'w')):
+        file_watcher.get()
+        store_watcher.get()
+
+    print(f"\nper-tick parameter lookup ({args.lookups} lookups):")
+    for name, func in [('re-parse JSON', parse_json), ('JSON mtime check', file_watcher.get_from_file),
+                       ('store version check', store_watcher.get)]:
+        print(f"  {name:<20} {per_lookup(func, args.lookups) * 1e6:7.2f} us")
+
+    keys = [f"run{i}" for i in range(args.writers)]
+    procs = [multiprocessing.Process(target=writer, args=(db_path, key, args.writes)) for key in keys]
+    reader = ParamStore(db_path)
+    torn = reads = 0
+    last_seen = {}
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+    while any(p.is_alive() for p in procs):
+        if reader.changed():
+            for key, row in reader.get_many(keys).items():
+                reads += 1
+                torn += row['take_profit'] - row['stop_loss'] != 1000
+                last_seen[key] = row['version']
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - t0
+    final = reader.get_many(keys)
+    lost = sum(final.get(key, {}).get('version') != args.writes for key in keys)
+    print(f"\n{args.writers} writers x {args.writes} versions, one polling reader:")
+    print(f"  {args.writers * args.writes / elapsed:,.0f} writes/s, {reads} rows read while writing, "
+          f"{torn} torn, {lost} keys missing versions")
+
+
+if __name__ == "__main__":
+    main()
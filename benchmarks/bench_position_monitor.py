@@ -0,0 +1,134 @@
+"""Runs position_monitor.py with thousands of simulated positions against a local exchange stub.
+
+The stub lists --exchange-symbols symbols whose prices random-walk on every ticker
+call and accepts market orders. Positions (TP/SL within 5% of the starting price)
+are added through the monitor's HTTP API, then the monitor polls until every position
+has been sold or --polls is reached. For comparison, the old approach - one ticker
+request per position per check - is timed over the same positions:
+
+    python3 benchmarks/bench_position_monitor.py --positions 5000 --symbols 300
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from local_server import start_server
+
+
+class ExchangeStub:
+    def __init__(self, n_symbols, seed=11):
+        self.rng = random.Random(seed)
+        self.prices = {f"C{i:04d}USDT": self.rng.uniform(1, 1000) for i in range(n_symbols)}
+        self.orders = 0
+        self.lock = threading.Lock()
+
+    def routes(self):
+        def ticker(method, query, body):
+            with self.lock:
+                if 'symbol' in query:
+                    return 200, {'symbol': query['symbol'], 'price': f"{self.prices[query['symbol']]:.6f}"}
+                for symbol in self.prices:
+                    self.prices[symbol] *= 1 + self.rng.uniform(-0.01, 0.01)
+                return 200, [{'symbol': s, 'price': f"{p:.6f}"} for s, p in self.prices.items()]
+
+        def order(method, query, body):
+            with self.lock:
+                self.orders += 1
+            return 200, {'symbol': query.get('symbol'), 'orderId': str(self.orders), 'type': 'MARKET'}
+
+        def exchange_info(method, query, body):
+            symbol = query['symbol']
+            return 200, {'symbols': [{'symbol': symbol, 'baseAsset': symbol[:-4], 'quoteAsset': 'USDT',
+                                      'baseAssetPrecision': 6, 'quoteAssetPrecision': 6}]}
+
+        return {'/api/v3/ticker/price': ticker, '/api/v3/order': order, '/api/v3/exchangeInfo': exchange_info}
+
+
+async def run(args, pm, stub, symbols):
+    monitor = pm.PositionMonitor(poll_interval=args.poll_interval, positions_file=args.positions_file)
+    server = await asyncio.start_server(monitor.handle, '127.0.0.1', 0)
+    api = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    rng = random.Random(5)
+
+    def add_positions():
+        session = requests.Session()
+        for _ in range(args.positions):
+            symbol = rng.choice(symbols)
+            price = stub.prices[symbol]
+            r = session.post(f"{api}/positions", json={
+                'symbol': symbol, 'quantity': '1',
+                'take_profit': round(price * rng.uniform(1.005, 1.05), 6),
+                'stop_loss': round(price * rng.uniform(0.95, 0.995), 6),
+            })
+            r.raise_for_status()
+
+    t0 = time.perf_counter()
+    await asyncio.to_thread(add_positions)
+    add_seconds = time.perf_counter() - t0
+
+    poll_times, eval_times = [], []
+    for _ in range(args.polls):
+        if not len(monitor.book):
+            break
+        t0 = time.perf_counter()
+        await monitor.poll_once()
+        poll_times.append(time.perf_counter() - t0)
+        eval_times.append(monitor.last_poll_seconds)
+        await asyncio.sleep(args.poll_interval)
+    while monitor.orders:
+        await asyncio.wait(set(monitor.orders))
+    server.close()
+    return monitor, add_seconds, poll_times, eval_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the multi-position monitor')
+    parser.add_argument('--positions', type=int, default=5000)
+    parser.add_argument('--symbols', type=int, default=300, help='Distinct symbols the positions are spread over')
+    parser.add_argument('--exchange-symbols', type=int, default=2000, help='Symbols listed by the stub ticker')
+    parser.add_argument('--polls', type=int, default=40)
+    parser.add_argument('--poll-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub = ExchangeStub(args.exchange_symbols)
+    server, base_url = start_server(stub.routes())
+    os.environ.update(MEXC_API_KEY='bench', MEXC_API_SECRET='bench', MEXC_BASE_URL=base_url,
+                      MEXC_FILTERS_CACHE=os.path.join(tempfile.mkdtemp(prefix='mexc_filters_'), 'filters.json'))
+    import position_monitor as pm
+    args.positions_file = os.path.join(tempfile.mkdtemp(prefix='position_monitor_bench_'), 'positions.json')
+
+    symbols = list(stub.prices)[:args.symbols]
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        monitor, add_seconds, poll_times, eval_times = asyncio.run(run(args, pm, stub, symbols))
+
+    # The old approach: one ticker request per position on every check
+    session = requests.Session()
+    sample = min(args.positions, 500)
+    t0 = time.perf_counter()
+    for i in range(sample):
+        session.get(f"{base_url}/api/v3/ticker/price", params={'symbol': symbols[i % len(symbols)]}).json()
+    per_position = (time.perf_counter() - t0) / sample
+    server.shutdown()
+
+    print(f"\n{args.positions} positions over {len(symbols)} symbols ({args.exchange_symbols} listed):")
+    print(f"  added via API      {add_seconds:7.2f}s  ({args.positions / add_seconds:.0f} positions/s)")
+    print(f"  polls              {len(poll_times):7d}   one ticker request each, "
+          f"median {sorted(poll_times)[len(poll_times) // 2] * 1000:.1f} ms incl. fetch")
+    print(f"  trigger evaluation max {max(eval_times) * 1000:.2f} ms per poll")
+    print(f"  orders placed      {monitor.orders_placed:7d}   still open {len(monitor.book)}, stub saw {stub.orders}")
+    print(f"  per-position polling would take {per_position * args.positions:.2f}s per check "
+          f"({args.positions} requests)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Trigger-to-order latency of mexc_check_balance_and_sell.py against local stand-ins.
+
+A WebSocket stand-in replays ticks on the MEXC deals channel while a REST stand-in
+serves the ticker and order endpoints; both follow the same replay clock,
+so the take-profit is crossed at a known time. Measured from that moment until the
+sell order reaches the stand-in, for:
+
+  * stream            - the WebSocket feed stays up
+  * stream, dropped   - the feed drops shortly before the crossing, REST fallback takes over
+  * REST polling      - no stream, ticker polled every --poll-interval (the old loop used 120 s)
+
+Ticks come from --ticks (one price per line, e.g. recorded from the live feed) or a
+synthetic walk. Needs `pip install websockets`:
+
+    python3 benchmarks/bench_price_monitor.py --tick-interval 0.05 --poll-interval 2
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+import contextlib
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from local_server import start_server
+
+TAKE_PROFIT = 66000.0
+STOP_LOSS = 60000.0
+
+
+def synthetic_ticks(count=200, cross_at=150, seed=3):
+    """Random walk below TAKE_PROFIT that jumps above it at tick cross_at."""
+    rng = random.Random(seed)
+    price, ticks = 65000.0, []
+    for i in range(count):
+        price = min(price * (1 + rng.uniform(-0.0005, 0.0005)), TAKE_PROFIT - 50)
+        ticks.append(TAKE_PROFIT + 25 if i >= cross_at else price)
+    return ticks
+
+
+class Replay:
+    """Replay clock shared by the WebSocket and REST stand-ins."""
+
+    def __init__(self, ticks, interval, outage=None):
+        self.ticks = ticks
+        self.interval = interval
+        self.outage = outage  # (first_tick, last_tick) during which the stream is down
+        self.cross_index = next(i for i, p in enumerate(ticks) if p >= TAKE_PROFIT or p <= STOP_LOSS)
+        self.start = None
+        self.order_at = None
+
+    def begin(self):
+        self.start = time.perf_counter()
+        self.order_at = None
+
+    def index(self):
+        return min(int((time.perf_counter() - self.start) / self.interval), len(self.ticks) - 1)
+
+    def cross_time(self):
+        return self.start + self.cross_index * self.interval
+
+    def stream_down(self, i):
+        return self.outage is not None and self.outage[0] <= i <= self.outage[1]
+
+    async def ws_handler(self, ws):
+        try:
+            await ws.recv()  # subscription
+            channel = "spot@public.deals.v3.api@WBTCUSDT"
+            i = self.index()
+            while i < len(self.ticks):
+                if self.stream_down(i):
+                    return  # closes the connection; reconnects are refused until the outage ends
+                await asyncio.sleep(max(0.0, self.start + i * self.interval - time.perf_counter()))
+                await ws.send(json.dumps({'c': channel, 's': 'WBTCUSDT', 't': int(time.time() * 1000),
+                                          'd': {'deals': [{'p': f"{self.ticks[i]:.2f}", 'v': '0.001', 'S': 1,
+                                                           't': int(time.time() * 1000)}],
+                                                'e': 'spot@public.deals.v3.api'}}))
+                i += 1
+            await ws.wait_closed()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def routes(self):
+        def ticker(method, query, body):
+            return 200, {'symbol': 'WBTCUSDT', 'price': f"{self.ticks[self.index()]:.2f}"}
+
+        def order(method, query, body):
+            if self.order_at is None:
+                self.order_at = time.perf_counter()
+            return 200, {'symbol': 'WBTCUSDT', 'orderId': 'bench', 'side': 'SELL', 'type': 'MARKET'}
+
+        def exchange_info(method, query, body):
+            return 200, {'symbols': [{'symbol': 'WBTCUSDT', 'baseAsset': 'WBTC', 'quoteAsset': 'USDT',
+                                      'baseAssetPrecision': 6, 'quoteAssetPrecision': 2}]}
+
+        return {'/api/v3/ticker/price': ticker, '/api/v3/order': order, '/api/v3/exchangeInfo': exchange_info}
+
+
+async def run_once(monitor_module, replay, port):
+    # The previous run ended above the take-profit; its price must not count as fresh
+    monitor_module.price_oracle.get_oracle().prices.clear()
+    async with websockets.serve(replay.ws_handler, '127.0.0.1', port):
+        replay.begin()
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            await asyncio.wait_for(monitor_module.monitor('0.00100'), timeout=120)
+    return replay.order_at - replay.cross_time()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TP/SL trigger-to-order latency')
+    parser.add_argument('--ticks', help='File with one recorded price per line')
+    parser.add_argument('--tick-interval', type=float, default=0.05, help='Seconds between replayed ticks')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='REST polling interval for the fallback')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.ticks:
+        with open(args.ticks) as f:
+            ticks = [float(line) for line in f if line.strip()]
+    else:
+        ticks = synthetic_ticks()
+
+    params_dir = tempfile.mkdtemp(prefix='price_monitor_bench_')
+    os.environ.update(MEXC_API_KEY='bench', MEXC_API_SECRET='bench',
+                      MEXC_FILTERS_CACHE=os.path.join(params_dir, 'filters.json'),
+                      PARAM_STORE_DB=os.path.join(params_dir, 'params.db'))
+    import mexc_check_balance_and_sell as monitor_module
+    from param_store import ParamStore, DEFAULT_KEY
+
+    ParamStore().put(DEFAULT_KEY, TAKE_PROFIT, STOP_LOSS, 'yes')
+    monitor_module.POLL_INTERVAL = args.poll_interval
+    monitor_module.RECONNECT_DELAY = args.poll_interval * 3
+    # Like the default 5 s against 10 s polls: a lone monitor never reuses its own last poll
+    monitor_module.PRICE_MAX_AGE = args.poll_interval / 2
+    oracle = monitor_module.price_oracle.get_oracle()
+
+    port = 18766
+    monitor_module.WS_URL = f"ws://127.0.0.1:{port}"
+    cross_at = next(i for i, p in enumerate(ticks) if p >= TAKE_PROFIT or p <= STOP_LOSS)
+    scenarios = {
+        'stream': (None, True),
+        'stream, dropped': ((cross_at - 10, cross_at + 40), True),
+        'REST polling': (None, False),
+    }
+    ws_module = monitor_module.websockets
+
+    print(f"\n{len(ticks)} ticks every {args.tick_interval * 1000:.0f} ms, TP crossed at tick {cross_at}, "
+          f"REST poll interval {args.poll_interval}s:")
+    for name, (outage, use_stream) in scenarios.items():
+        replay = Replay(ticks, args.tick_interval, outage)
+        server, base_url = start_server(replay.routes())
+        monitor_module.client.base_url = base_url
+        oracle.sources = [monitor_module.price_oracle.MexcTicker(base_url)]
+        monitor_module.client.symbol_filters('WBTCUSDT')  # as main() does before monitoring
+        monitor_module.websockets = ws_module if use_stream else None
+        try:
+            latencies = [asyncio.run(run_once(monitor_module, replay, port)) for _ in range(args.runs)]
+        finally:
+            server.shutdown()
+        print(f"  {name:<16} median {statistics.median(latencies) * 1000:8.1f} ms  "
+              f"max {max(latencies) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Upstream price requests and read latency with and without price_oracle.py.
+
+MEXC's ticker and CoinAPI are local stand-ins with a fixed delay that count their
+calls. --rounds times, --callers threads ask for the WBTC/USDT price at once (like
+concurrent analyses and monitors), --interval seconds apart:
+
+  * direct       - a new CoinAPI request per caller, as get_wbtc_usdt_price() did
+  * oracle       - one in-process PriceOracle shared by the callers
+  * process      - `python3 price_oracle.py` in its own process, read over HTTP
+  * fallback     - the in-process oracle with the MEXC stand-in failing
+
+    python3 benchmarks/bench_price_oracle.py --callers 8 --rounds 10 --interval 0.5 --delay 0.2
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import requests
+
+from local_server import start_server
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run_rounds(read, callers, rounds, interval):
+    """Runs `callers` concurrent reads per round; returns every read's latency in seconds."""
+    latencies = []
+    lock = threading.Lock()
+
+    def one():
+        t0 = time.perf_counter()
+        read()
+        with lock:
+            latencies.append(time.perf_counter() - t0)
+
+    for _ in range(rounds):
+        threads = [threading.Thread(target=one) for _ in range(callers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        time.sleep(interval)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the shared price oracle against direct requests')
+    parser.add_argument('--callers', type=int, default=8, help='Concurrent price reads per round')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--interval', type=float, default=0.5, help='Seconds between rounds')
+    parser.add_argument('--delay', type=float, default=0.2, help='Stand-in API delay (s)')
+    parser.add_argument('--max-age', type=float, default=2.0, help='Staleness bound for the oracle (s)')
+    parser.add_argument('--port', type=int, default=8798, help='Port for the oracle process')
+    args = parser.parse_args()
+
+    calls = {'mexc': 0, 'coinapi': 0}
+    mexc_down = [False]
+
+    def mexc(method, query, body):
+        calls['mexc'] += 1
+        time.sleep(args.delay)
+        if mexc_down[0]:
+            return 500, {'msg': 'stand-in outage'}
+        return 200, {'symbol': 'WBTCUSDT', 'price': '65000.00'}
+
+    def coinapi(method, query, body):
+        calls['coinapi'] += 1
+        time.sleep(args.delay)
+        return 200, {'rate': 65010.0}
+
+    server, base_url = start_server({'/api/v3/ticker/price': mexc, '/v1/exchangerate/WBTC/USDT': coinapi})
+    os.environ.update(MEXC_BASE_URL=base_url, COINAPI_URL=base_url, COINAPI_KEY='bench')
+    os.environ.pop('PRICE_ORACLE_URL', None)
+
+    import price_oracle
+
+    def direct():
+        r = requests.get(f'{base_url}/v1/exchangerate/WBTC/USDT', headers={'X-CoinAPI-Key': 'bench'})
+        r.raise_for_status()
+        return r.json()['rate']
+
+    def fresh_oracle():
+        sources = [price_oracle.MexcTicker(base_url), price_oracle.CoinApiRate('bench', base_url)]
+        return price_oracle.PriceOracle(sources, max_age=args.max_age)
+
+    results = []
+
+    def measure(name, read):
+        calls.update(mexc=0, coinapi=0)
+        latencies = run_rounds(read, args.callers, args.rounds, args.interval)
+        results.append((name, latencies, dict(calls)))
+
+    measure('direct', direct)
+
+    oracle = fresh_oracle()
+    measure('oracle', lambda: oracle.get('WBTCUSDT'))
+    oracle_stats = oracle.stats()
+
+    process = subprocess.Popen(
+        [sys.executable, 'price_oracle.py', '--port', str(args.port), '--max-age', str(args.max_age),
+         '--refresh', str(args.max_age / 2)],
+        cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir),
+        env=dict(os.environ, PYTHONWARNINGS='ignore'), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    oracle_url = f'http://127.0.0.1:{args.port}'
+    try:
+        for _ in range(100):
+            try:
+                requests.get(f'{oracle_url}/health', timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.1)
+        price_oracle.ORACLE_URL = oracle_url
+        session = requests.Session()
+        measure('process', lambda: price_oracle.get_price('WBTCUSDT', session=session))
+        process_stats = requests.get(f'{oracle_url}/health', timeout=1).json()
+    finally:
+        price_oracle.ORACLE_URL = None
+        process.terminate()
+        process.wait()
+
+    mexc_down[0] = True
+    oracle = fresh_oracle()
+    measure('fallback', lambda: oracle.get('WBTCUSDT'))
+    fallback_stats = oracle.stats()
+    server.shutdown()
+
+    reads = args.callers * args.rounds
+    print(f"\n{args.rounds} rounds of {args.callers} concurrent reads, {args.interval}s apart, "
+          f"stand-in delay {args.delay}s, max age {args.max_age}s:")
+    for name, latencies, counted in results:
+        print(f"  {name:<9} p50 {percentile(latencies, 50) * 1000:7.1f} ms  p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+              f"upstream: mexc {counted['mexc']:3d}, coinapi {counted['coinapi']:3d}  ({reads} reads)")
+    print(f"  oracle:   {oracle_stats['hits']} hits, {oracle_stats['coalesced']} coalesced")
+    print(f"  process:  {process_stats['hits']} hits, {process_stats['coalesced']} coalesced "
+          f"(upstream counts include its background refreshes)")
+    print(f"  fallback: {fallback_stats['fallbacks']} prices from CoinAPI after MEXC failed")
+
+
+if __name__ == "__main__":
+    main()
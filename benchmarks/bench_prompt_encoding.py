@@ -0,0 +1,65 @@
+"""Prompt size and encode time for the old string-concatenation table, the join-based
+table and the token-budgeted encoder, over the full Kraken BTCUSD history (~10 years).
+
+The "stock" series is BTCUSD restricted to weekdays, so no database is needed:
+
+    python3 benchmarks/bench_prompt_encoding.py --token-budget 8000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from kraken_csv_extract import load_csv
+from prompt_encoding import estimate_tokens
+from ai_analyze_supabase_coinapi import format_data_for_prompt, build_prompt_data
+
+
+def legacy_format(data, symbol):
+    """format_data_for_prompt as it was before the prompt-encoding change (repeated +=)."""
+    header = f"{symbol} Data:\nDate        Open    High    Low     Close   Volume\n"
+    data_str = header + "-" * (len(header.split('\n')[1]) - 1) + "\n"
+    for row in data:
+        date_str = row[0].strftime('%Y-%m-%d')
+        data_str += f"{date_str}  {row[1]:<7.2f} {row[2]:<7.2f} {row[3]:<7.2f} {row[4]:<7.2f} {row[5]:<10}\n"
+    return data_str.strip()
+
+
+def best_of(repeat, func):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark prompt encoding')
+    parser.add_argument('--file', default="bitcoin_daily_ohlc/BTCUSD_Daily_OHLC.csv")
+    parser.add_argument('--token-budget', type=int, default=8000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = load_csv(args.file)
+    btc = list(df[['trade_date', 'open_price', 'high_price', 'low_price', 'close_price', 'volume']]
+               .itertuples(index=False, name=None))
+    stock = [row for row in btc if row[0].weekday() < 5]
+
+    variants = {
+        'legacy +=': lambda: (legacy_format(stock, 'STOCK'), legacy_format(btc, 'BTCUSD'), ''),
+        'join table': lambda: (format_data_for_prompt(stock, 'STOCK'), format_data_for_prompt(btc, 'BTCUSD'), ''),
+        'budgeted': lambda: build_prompt_data(stock, 'STOCK', btc, args.token_budget),
+    }
+
+    print(f"\n{len(stock)} stock rows + {len(btc)} BTC rows, token budget {args.token_budget}:")
+    for name, func in variants.items():
+        elapsed, parts = best_of(args.repeat, func)
+        text = "".join(parts)
+        print(f"  {name:<11} {len(text):9d} chars  ~{estimate_tokens(text):8d} tokens  {elapsed * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Two model round trips (analysis, then n8n's AI Agent) vs one structured-output call.
+
+Gemini is a local stand-in with a fixed per-call delay. The two-call path is what the
+workflow did before: analyze_with_gemini() for the prose, the AI Agent prompt on top
+of it, and ai_agent_trade.parse_agent_output() on the agent's reply. The single-call
+path is decide_with_gemini(), which asks for DECISION_SCHEMA and validates the JSON.
+Both paths must end with the same levels:
+
+    python3 benchmarks/bench_single_call.py --model-delay 1.5 --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from local_server import start_server
+
+ANALYSIS = "AAPL trended up while BTC ranged; the two were weakly correlated over the period."
+DECISION = {"take_profit": 67500.0, "stop_loss": 63000.0, "buy": "yes"}
+# The AI Agent node's instructions, minus the n8n expression
+AGENT_PROMPT = ("Based on the analysis in the input, I need you to tell me whether it's a good timing or not "
+                "to buy Bitcoin. Make sure your take profit and stop loss levels do not exceed 5% from the "
+                "current Bitcoin price.\n{analysis}\nOnly output a 3 sentences analysis, and exactly this at "
+                "the end: Take Profit X, Stop Loss Y, Buy Z")
+
+
+def canned_rows(days):
+    start = datetime.date(2023, 1, 1)
+    return [(start + datetime.timedelta(days=i), 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 1000 + i)
+            for i in range(days)]
+
+
+def model_reply(text):
+    return 200, {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the two-call analysis + agent path vs one call')
+    parser.add_argument('--model-delay', type=float, default=1.5, help='Stand-in model response delay (s)')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    calls = []
+
+    def generate(method, query, body):
+        request = json.loads(body)
+        calls.append(request)
+        time.sleep(args.model_delay)
+        if request.get('generationConfig', {}).get('responseMimeType') == 'application/json':
+            return model_reply(json.dumps(dict(DECISION, analysis=ANALYSIS)))
+        prompt = request['contents'][0]['parts'][0]['text']
+        if prompt.startswith('Based on the analysis'):
+            return model_reply(f"{ANALYSIS}\n```\nTake Profit {DECISION['take_profit']:g}, "
+                               f"Stop Loss {DECISION['stop_loss']:g}, Buy Yes\n```")
+        return model_reply(ANALYSIS)
+
+    server, base_url = start_server({'/v1beta/models/gemini-2.0-flash:generateContent': generate})
+    os.environ.update(GEMINI_API_KEY='bench', GEMINI_API_ENDPOINT=base_url)
+
+    import ai_analyze_supabase_coinapi as analyzer
+    from ai_agent_trade import parse_agent_output
+
+    rows = canned_rows(180)
+    stock = analyzer.format_data_for_prompt(rows, 'AAPL')
+    btc = analyzer.format_data_for_prompt(rows, 'BTCUSD')
+    price = 65000.0
+    model = analyzer.get_gemini_model('bench')
+
+    def two_calls():
+        analysis = analyzer.analyze_with_gemini('bench', stock, btc, price, model)
+        reply = model.generate_content(AGENT_PROMPT.format(analysis=analysis)).text
+        return parse_agent_output(reply.replace('```', ''))
+
+    def one_call():
+        decision = analyzer.decide_with_gemini('bench', stock, btc, price, model)
+        return {k: decision[k] for k in ('take_profit', 'stop_loss', 'buy')}
+
+    from contextlib import redirect_stdout
+    results = {}
+    for name, func in [('analysis + agent', two_calls), ('single call', one_call)]:
+        times = []
+        calls.clear()
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            with redirect_stdout(open(os.devnull, 'w')):
+                params = func()
+            times.append(time.perf_counter() - t0)
+        results[name] = (min(times), sum(times) / len(times), len(calls) / args.runs, params)
+    server.shutdown()
+
+    print(f"\nstand-in model delay {args.model_delay}s, {args.runs} runs:")
+    base = results['analysis + agent'][1]
+    for name, (best, mean, per_run, params) in results.items():
+        print(f"  {name:<17} mean {mean:6.3f}s  best {best:6.3f}s  {per_run:.0f} model call(s)  "
+              f"{base / mean:.2f}x  -> {params}")
+    same = results['analysis + agent'][3] == results['single call'][3]
+    print(f"  same decision: {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Time to first token and time to decision of the streamed model call vs the blocking one.
+
+Gemini is a local stand-in that streams canned chunks, each after --chunk-delay seconds:
+--chunks pieces of analysis, the "Take Profit X, Stop Loss Y, Buy Z" line, then
+--tail-chunks of closing text. The blocking call (generate_content, as
+analyze_with_gemini() does) only returns after the last chunk; stream_with_gemini()
+reports the first text and the decision as they arrive. A second stand-in endpoint
+takes the paragraphs ChunkPoster forwards, to show when each reached the channel:
+
+    python3 benchmarks/bench_stream_decision.py --chunks 20 --tail-chunks 5 --chunk-delay 0.1
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from local_server import start_server
+
+DECISION_LINE = "Take Profit 67500, Stop Loss 63000, Buy Yes"
+
+
+def canned_chunks(chunks, tail_chunks):
+    body = [f"Point {i + 1}: AAPL and BTC moved together this week. " + ("\n\n" if i % 5 == 4 else "")
+            for i in range(chunks)]
+    tail = [f"Closing remark {i + 1}. " for i in range(tail_chunks)]
+    return body + [f"\n\n{DECISION_LINE}\n\n"] + tail
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streamed vs blocking model output')
+    parser.add_argument('--chunks', type=int, default=20, help='Analysis chunks before the decision line')
+    parser.add_argument('--tail-chunks', type=int, default=5, help='Chunks after the decision line')
+    parser.add_argument('--chunk-delay', type=float, default=0.1, help='Seconds before each chunk')
+    args = parser.parse_args()
+
+    pieces = canned_chunks(args.chunks, args.tail_chunks)
+
+    def response(text):
+        return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}]}
+
+    def generate(method, query, body):
+        time.sleep(args.chunk_delay * len(pieces))
+        return 200, response("".join(pieces))
+
+    def stream(method, query, body):
+        def chunks():
+            # streamGenerateContent without alt=sse returns one JSON array, element by element
+            for i, piece in enumerate(pieces):
+                time.sleep(args.chunk_delay)
+                yield (b'[' if i == 0 else b',\r\n') + json.dumps(response(piece)).encode()
+            yield b']'
+        return 200, chunks()
+
+    posts = []
+    t0 = [0.0]
+
+    def receive(method, query, body):
+        posts.append((time.perf_counter() - t0[0], json.loads(body)['text']))
+        return 200, {'ok': True}
+
+    server, base_url = start_server({
+        '/v1beta/models/gemini-2.0-flash:generateContent': generate,
+        '/v1beta/models/gemini-2.0-flash:streamGenerateContent': stream,
+        '/post': receive,
+    })
+    os.environ.update(GEMINI_API_KEY='bench', GEMINI_API_ENDPOINT=base_url)
+
+    import ai_analyze_supabase_coinapi as analyzer
+
+    model = analyzer.get_gemini_model('bench')
+    stock, btc, price = "AAPL Data: ...", "BTCUSD Data: ...", 65000.0
+
+    with redirect_stdout(open(os.devnull, 'w')):
+        start = time.perf_counter()
+        analyzer.analyze_with_gemini('bench', stock, btc, price, model)
+        blocking = time.perf_counter() - start
+
+        timings = {}
+        decided_at = []
+        poster = analyzer.ChunkPoster(f"{base_url}/post")
+        t0[0] = start = time.perf_counter()
+        decision = analyzer.stream_with_gemini(
+            'bench', stock, btc, price, model, on_chunk=poster.add,
+            on_decision=lambda d: decided_at.append(time.perf_counter() - start), timings=timings)
+        streamed = time.perf_counter() - start
+        poster.close()
+    server.shutdown()
+
+    print(f"\n{len(pieces)} chunks, {args.chunk_delay}s apart (decision line is chunk {args.chunks + 1}):")
+    print(f"  blocking   full reply        {blocking:6.3f}s")
+    print(f"  streaming  first token       {timings['first token']:6.3f}s")
+    print(f"             decision          {timings['decision']:6.3f}s  (callback at {decided_at[0]:.3f}s, "
+          f"{blocking - timings['decision']:.3f}s before the blocking call returned)")
+    print(f"             full reply        {streamed:6.3f}s")
+    print(f"  decision: {analyzer.format_decision(decision)}")
+    print(f"  {len(posts)} paragraph posts, first at {posts[0][0]:.3f}s, last at {posts[-1][0]:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Cost of tracing.py's spans, and an end-to-end trace of the agent -> order steps.
+
+First times an empty `with tracing.span(...)` with tracing off and on (writing to a
+temporary file). Then runs --runs simulated n8n executions, each as the workflow's
+separate processes - ai_agent_trade.py "<reply>" <run id> and mexc_buy.py yes <run id>
+against the local MEXC stub - with TRACE_FILE set, and prints tracing.py's per-stage
+summary of the spans they wrote:
+
+    python3 benchmarks/bench_tracing.py --runs 20 --latency 0.05
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+import tracing
+from mexc_stub import MexcStub, PriceReplay
+
+
+def per_span(n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        with tracing.span("bench", i=1):
+            pass
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tracing overhead and summarise a traced run')
+    parser.add_argument('--spans', type=int, default=100000, help='Spans for the overhead measurement')
+    parser.add_argument('--runs', type=int, default=20, help='Simulated n8n executions')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub delay per exchange request (s)')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='tracing_bench_')
+    trace_file = os.path.join(work_dir, 'traces.jsonl')
+
+    tracing.configure(None)
+    off = per_span(args.spans)
+    tracing.configure(os.path.join(work_dir, 'overhead.jsonl'))
+    on = per_span(args.spans)
+    tracing.configure(None)
+    print(f"\nper span ({args.spans} spans): off {off * 1e6:.2f} us, on {on * 1e6:.2f} us")
+
+    stub = MexcStub(PriceReplay.from_csv(), balances={'USDT': 1000000, 'WBTC': 0}, latency=args.latency)
+    server, base_url = stub.start()
+    env = dict(os.environ, TRACE_FILE=trace_file, MEXC_BASE_URL=base_url, MEXC_API_KEY=stub.api_key,
+               MEXC_API_SECRET=stub.api_secret, MEXC_FILTERS_CACHE=os.path.join(work_dir, 'filters.json'),
+               PARAM_STORE_DB=os.path.join(work_dir, 'params.db'))
+    env.pop('TRACE_RUN_ID', None)
+    reply = "BTC is ranging.\nTake Profit 67500, Stop Loss 63000, Buy Yes"
+    t0 = time.perf_counter()
+    for i in range(args.runs):
+        run_id = f"bench{i}"
+        for script_args in (['ai_agent_trade.py', reply, run_id], ['mexc_buy.py', 'yes', run_id]):
+            subprocess.run([sys.executable, os.path.join(ROOT, script_args[0])] + script_args[1:], env=env,
+                           cwd=work_dir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+
+    spans = tracing.load([trace_file])
+    print(f"\n{args.runs} runs of ai_agent_trade.py + mexc_buy.py in {elapsed:.1f}s, "
+          f"stub latency {args.latency * 1000:.0f} ms, {len(spans)} spans:\n")
+    tracing.print_summary(tracing.summarize(spans))
+
+
+if __name__ == "__main__":
+    main()
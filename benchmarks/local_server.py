@@ -0,0 +1,69 @@
+"""Tiny threaded HTTP stand-in used by the benchmarks in place of external APIs."""
+import json
+import time
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def start_server(routes, latency=0.0, port=0, pass_headers=False):
+    """Serves `routes` ({path: handler(method, query, body) -> (status, payload)}) on localhost.
+
+    Every response is delayed by `latency` seconds to mimic a remote API. payload is
+    JSON-encoded unless it is already bytes; a generator of bytes is streamed with chunked
+    transfer encoding, one chunk per item, so handlers can pace a streamed reply. With
+    pass_headers, handlers get the request headers as a fourth argument. Returns
+    (server, base_url); call server.shutdown() when done.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        disable_nagle_algorithm = True
+
+        def _handle(self, method):
+            parsed = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(parsed.query))
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            handler = routes.get(parsed.path)
+            if handler is None:
+                status, payload = 404, {'error': f'unknown path {parsed.path}'}
+            else:
+                args = (method, query, body, self.headers) if pass_headers else (method, query, body)
+                status, payload = handler(*args)
+            if latency:
+                time.sleep(latency)
+            if hasattr(payload, '__next__'):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for piece in payload:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+                    self.wfile.flush()
+                self.wfile.write(b'0\r\n\r\n')
+                return
+            data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def do_DELETE(self):
+            self._handle('DELETE')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,244 @@
+"""Local MEXC-compatible exchange stub for exercising mexc_buy.py and the sell scripts.
+
+Serves the spot endpoints the scripts use - signed /api/v3/account and /api/v3/order,
+public /api/v3/ticker/price, /api/v3/exchangeInfo and /api/v3/ping - checking the
+X-MEXC-APIKEY header and HMAC signature like the real API. Prices replay the Kraken daily CSV (open -> low/high -> close per
+day, `speed` simulated seconds per real second) or a tick file (one price per line)
+at a fixed interval. Market orders fill at the current replay price, charge `fee_rate`
+in the received asset and move the balances, so a sell larger than the free balance
+fails with MEXC's "Oversold" error.
+
+Latency, random 503s and forced "Oversold" rejections can be injected on the object
+(in-process) or through POST /stub/control; GET /stub/state shows balances and orders.
+Run standalone and point the scripts at it:
+
+    python3 benchmarks/mexc_stub.py --speed 86400 --latency 0.05
+    MEXC_BASE_URL=http://127.0.0.1:8900 MEXC_API_KEY=stub MEXC_API_SECRET=stub python3 mexc_buy.py yes
+"""
+import os
+import sys
+import csv
+import hmac
+import json
+import time
+import random
+import hashlib
+import argparse
+import datetime
+import threading
+import urllib.parse
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_server import start_server
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                           "bitcoin_daily_ohlc", "BTCUSD_Daily_OHLC.csv")
+DEFAULT_PORT = 8900
+SYMBOL = "WBTCUSDT"
+BASE_ASSET_PRECISION = 6
+QUOTE_ASSET_PRECISION = 2
+
+
+class PriceReplay:
+    """Steps through `prices`, one every `interval` real seconds, then holds the last one."""
+
+    def __init__(self, prices, interval):
+        self.prices = prices
+        self.interval = interval
+        self.start = time.monotonic()
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_CSV, speed=86400.0, start_date=None):
+        start_ts = datetime.datetime.strptime(start_date, '%Y-%m-%d').replace(
+            tzinfo=datetime.timezone.utc).timestamp() if start_date else 0
+        prices = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                if int(row['timestamp']) < start_ts:
+                    continue
+                o, h, l, c = (float(row[k]) for k in ('open', 'high', 'low', 'close'))
+                # Visit the extreme nearer the close last, like a typical intraday path
+                prices.extend([o, l, h, c] if c >= o else [o, h, l, c])
+        return cls(prices, 86400.0 / speed / 4)
+
+    @classmethod
+    def from_tick_file(cls, path, interval):
+        with open(path) as f:
+            return cls([float(line) for line in f if line.strip()], interval)
+
+    def index(self):
+        return min(int((time.monotonic() - self.start) / self.interval), len(self.prices) - 1)
+
+    def price(self):
+        return Decimal(f"{self.prices[self.index()]:.2f}")
+
+
+class MexcStub:
+    def __init__(self, replay, api_key="stub", api_secret="stub", balances=None, fee_rate=Decimal('0.001'),
+                 latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.replay = replay
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.balances = {k: Decimal(str(v)) for k, v in (balances or {'USDT': 1000, 'WBTC': 0}).items()}
+        self.fee_rate = Decimal(str(fee_rate))
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.oversold_next = 0
+        self.orders = []
+        self.requests = 0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.rng.uniform(0, self.jitter))
+
+    def _check_signature(self, query, headers):
+        if headers.get('X-MEXC-APIKEY') != self.api_key:
+            return {'code': 10072, 'msg': 'Api key info invalid'}
+        signed = urllib.parse.urlencode([(k, v) for k, v in query.items() if k != 'signature'])
+        expected = hmac.new(self.api_secret.encode(), signed.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, query.get('signature', '')):
+            return {'code': 700002, 'msg': 'Signature for this request is not valid.'}
+        return None
+
+    def _wrap(self, handler, signed=False):
+        def route(method, query, body, headers):
+            with self.lock:
+                self.requests += 1
+            self._delay()
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return 503, {'code': 503, 'msg': 'Service unavailable (injected)'}
+            if signed:
+                error = self._check_signature(query, headers)
+                if error:
+                    return 400, error
+            with self.lock:
+                return handler(method, query, body)
+        return route
+
+    def account(self, method, query, body):
+        return 200, {
+            'makerCommission': 0, 'takerCommission': 10, 'canTrade': True, 'accountType': 'SPOT',
+            'balances': [{'asset': a, 'free': f"{v:.8f}", 'locked': '0'} for a, v in self.balances.items()],
+        }
+
+    def ticker(self, method, query, body):
+        price = str(self.replay.price())
+        if 'symbol' in query:
+            if query['symbol'] != SYMBOL:
+                return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+            return 200, {'symbol': SYMBOL, 'price': price}
+        return 200, [{'symbol': SYMBOL, 'price': price}]
+
+    def exchange_info(self, method, query, body):
+        return 200, {'timezone': 'CST', 'serverTime': int(time.time() * 1000), 'symbols': [{
+            'symbol': SYMBOL, 'status': '1', 'baseAsset': 'WBTC', 'quoteAsset': 'USDT',
+            'baseAssetPrecision': BASE_ASSET_PRECISION, 'quotePrecision': QUOTE_ASSET_PRECISION,
+            'quoteAssetPrecision': QUOTE_ASSET_PRECISION, 'baseSizePrecision': '0', 'quoteAmountPrecision': '1',
+            'orderTypes': ['LIMIT', 'MARKET'], 'isSpotTradingAllowed': True, 'filters': [],
+        }]}
+
+    def order(self, method, query, body):
+        if method != 'POST':
+            return 405, {'code': -1, 'msg': 'Use POST'}
+        if query.get('symbol') != SYMBOL or query.get('type') != 'MARKET':
+            return 400, {'code': -1121, 'msg': 'Only MARKET orders on WBTCUSDT are simulated.'}
+        price = self.replay.price()
+        base, quote = 'WBTC', 'USDT'
+        if query.get('side') == 'BUY':
+            spend = Decimal(query['quoteOrderQty']) if 'quoteOrderQty' in query else Decimal(query['quantity']) * price
+            if spend > self.balances.get(quote, 0):
+                return 400, {'code': 30004, 'msg': 'Insufficient position'}
+            qty = spend / price
+            self.balances[quote] -= spend
+            self.balances[base] = self.balances.get(base, 0) + qty * (1 - self.fee_rate)
+        elif query.get('side') == 'SELL':
+            qty = Decimal(query['quantity'])
+            if -qty.as_tuple().exponent > BASE_ASSET_PRECISION:
+                return 400, {'code': 400, 'msg': 'quantity scale is invalid'}
+            if self.oversold_next > 0 or qty > self.balances.get(base, 0):
+                self.oversold_next = max(0, self.oversold_next - 1)
+                return 400, {'code': 30005, 'msg': 'Oversold'}
+            self.balances[base] -= qty
+            self.balances[quote] = self.balances.get(quote, 0) + qty * price * (1 - self.fee_rate)
+        else:
+            return 400, {'code': -1, 'msg': 'side must be BUY or SELL'}
+
+        order = {'symbol': SYMBOL, 'orderId': f"stub{len(self.orders) + 1}", 'orderListId': -1,
+                 'price': str(price), 'origQty': str(qty.quantize(Decimal('1e-8'))), 'type': 'MARKET',
+                 'side': query['side'], 'transactTime': int(time.time() * 1000)}
+        self.orders.append(order)
+        return 200, order
+
+    def control(self, method, query, body, headers=None):
+        """POST {"latency", "jitter", "error_rate", "oversold_next", "balances"} to change behaviour."""
+        if method == 'POST':
+            settings = json.loads(body or b'{}')
+            with self.lock:
+                for name in ('latency', 'jitter', 'error_rate', 'oversold_next'):
+                    if name in settings:
+                        setattr(self, name, settings[name])
+                for asset, value in settings.get('balances', {}).items():
+                    self.balances[asset] = Decimal(str(value))
+        return self.state(method, query, body)
+
+    def state(self, method, query, body, headers=None):
+        with self.lock:
+            return 200, {
+                'price': str(self.replay.price()), 'tick': self.replay.index(),
+                'balances': {a: f"{v:.8f}" for a, v in self.balances.items()},
+                'orders': len(self.orders), 'requests': self.requests,
+                'latency': self.latency, 'jitter': self.jitter, 'error_rate': self.error_rate,
+                'oversold_next': self.oversold_next,
+            }
+
+    def routes(self):
+        return {
+            '/api/v3/account': self._wrap(self.account, signed=True),
+            '/api/v3/order': self._wrap(self.order, signed=True),
+            '/api/v3/ticker/price': self._wrap(self.ticker),
+            '/api/v3/exchangeInfo': self._wrap(self.exchange_info),
+            '/api/v3/ping': self._wrap(lambda method, query, body: (200, {})),
+            '/stub/control': self.control,
+            '/stub/state': self.state,
+        }
+
+    def start(self, port=0):
+        """Serves the stub on localhost; returns (server, base_url)."""
+        return start_server(self.routes(), port=port, pass_headers=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local MEXC spot API stub replaying historical prices')
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='Kraken daily OHLC CSV to replay')
+    parser.add_argument('--ticks', help='Tick file (one price per line) to replay instead of the CSV')
+    parser.add_argument('--speed', type=float, default=86400.0, help='Simulated seconds per real second (CSV)')
+    parser.add_argument('--start-date', help='First CSV day to replay (YYYY-MM-DD)')
+    parser.add_argument('--tick-interval', type=float, default=1.0, help='Seconds per tick (tick file)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', type=float, default=0.0, help='Added delay per request (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--usdt', default='1000')
+    parser.add_argument('--wbtc', default='0')
+    args = parser.parse_args()
+
+    replay = (PriceReplay.from_tick_file(args.ticks, args.tick_interval) if args.ticks
+              else PriceReplay.from_csv(args.csv, args.speed, args.start_date))
+    stub = MexcStub(replay, os.getenv("MEXC_API_KEY", "stub"), os.getenv("MEXC_API_SECRET", "stub"),
+                    {'USDT': args.usdt, 'WBTC': args.wbtc}, latency=args.latency, jitter=args.jitter,
+                    error_rate=args.error_rate)
+    server, base_url = stub.start(args.port)
+    print(f"MEXC stub replaying {len(replay.prices)} prices on {base_url} (MEXC_BASE_URL={base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
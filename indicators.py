@@ -0,0 +1,224 @@
+"""Vectorised price indicators and stock/BTC correlation measures.
+
+Every function works along the last axis, so it accepts one series (1-D) or many
+symbols at once (2-D, symbols x sessions). Rolling windows are computed from
+cumulative sums in O(n); the first window-1 outputs are NaN. indicator_summary()
+turns the latest values into the compact text block added to the analysis prompt.
+"""
+import numpy as np
+
+SMA_WINDOWS = (20, 50)
+EMA_SPAN = 20
+ATR_WINDOW = 14
+RETURN_WINDOW = 20
+VOLATILITY_WINDOW = 20
+CORRELATION_WINDOW = 30
+MAX_LAG = 5
+# Bar timeframe -> (name, window suffix, bar unit, periods per year for a stock and for BTC)
+BAR_UNITS = {
+    '1d': ('daily', 'd', 'session', 252, 365),
+    '1w': ('weekly', 'w', 'week', 52, 52),
+    '1mo': ('monthly', 'mo', 'month', 12, 12),
+}
+
+
+def _rolling_sum(x, window):
+    x = np.asarray(x, dtype=float)
+    out = np.full(x.shape, np.nan)
+    if window > x.shape[-1]:
+        return out
+    c = np.cumsum(x, axis=-1)
+    out[..., window - 1] = c[..., window - 1]
+    out[..., window:] = c[..., window:] - c[..., :-window]
+    return out
+
+
+def sma(x, window):
+    """Simple moving average."""
+    return _rolling_sum(x, window) / window
+
+
+def ema(x, span=None, alpha=None):
+    """Exponential moving average seeded with the first value (alpha = 2 / (span + 1) unless given).
+
+    The recursion out[t] = alpha * x[t] + (1 - alpha) * out[t - 1] is solved in closed
+    form, as a cumulative sum of x scaled by growing powers of 1 / (1 - alpha). Blocks
+    keep those powers below 1e100, each seeded with the previous block's last value.
+    """
+    x = np.asarray(x, dtype=float)
+    alpha = alpha if alpha is not None else 2.0 / (span + 1)
+    decay = 1.0 - alpha
+    n = x.shape[-1]
+    if decay == 0 or n == 0:
+        return x.copy()
+    block = max(1, min(n, int(100 * np.log(10) / -np.log(decay))))
+    powers = decay ** np.arange(block)
+    out = np.empty_like(x)
+    prev = x[..., 0]
+    for start in range(0, n, block):
+        chunk = x[..., start:start + block]
+        m = chunk.shape[-1]
+        scaled = np.cumsum(chunk / powers[:m], axis=-1)
+        out[..., start:start + m] = powers[:m] * (decay * prev[..., None] + alpha * scaled)
+        prev = out[..., start + m - 1]
+    return out
+
+
+def log_returns(close):
+    """Close-to-close log returns (one shorter than close)."""
+    return np.diff(np.log(np.asarray(close, dtype=float)), axis=-1)
+
+
+def rolling_return(close, window):
+    """Simple return over the previous `window` sessions."""
+    close = np.asarray(close, dtype=float)
+    out = np.full(close.shape, np.nan)
+    out[..., window:] = close[..., window:] / close[..., :-window] - 1
+    return out
+
+
+def true_range(high, low, close):
+    """Daily true range; the first session falls back to high - low."""
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    prev_close = np.concatenate([close[..., :1], close[..., :-1]], axis=-1)
+    return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def atr(high, low, close, window=ATR_WINDOW):
+    """Average true range with Wilder's smoothing."""
+    return ema(true_range(high, low, close), alpha=1.0 / window)
+
+
+def rolling_std(x, window):
+    """Rolling sample standard deviation from cumulative sums of x and x**2."""
+    s1 = _rolling_sum(x, window)
+    s2 = _rolling_sum(np.square(x), window)
+    var = (s2 - s1 * s1 / window) / (window - 1)
+    return np.sqrt(np.clip(var, 0, None))
+
+
+def realized_volatility(close, window=VOLATILITY_WINDOW, periods_per_year=252):
+    """Annualized rolling volatility of log returns, aligned with close (first value NaN)."""
+    r = log_returns(close)
+    vol = rolling_std(r, window) * np.sqrt(periods_per_year)
+    pad = np.full(vol.shape[:-1] + (1,), np.nan)
+    return np.concatenate([pad, vol], axis=-1)
+
+
+def rolling_pearson(x, y, window=CORRELATION_WINDOW):
+    """Rolling Pearson correlation from five cumulative sums."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    sx, sy = _rolling_sum(x, window), _rolling_sum(y, window)
+    sxx, syy, sxy = _rolling_sum(x * x, window), _rolling_sum(y * y, window), _rolling_sum(x * y, window)
+    cov = sxy - sx * sy / window
+    var = (sxx - sx * sx / window) * (syy - sy * sy / window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return cov / np.sqrt(np.clip(var, 0, None))
+
+
+def _ranks(windows):
+    return np.argsort(np.argsort(windows, axis=-1), axis=-1).astype(float)
+
+
+def rolling_spearman(x, y, window=CORRELATION_WINDOW):
+    """Rolling Spearman rank correlation (ties broken by order).
+
+    Ranks have to be recomputed per window, so this is O(n * window log window) rather
+    than O(n); 2-D input is processed one symbol at a time to bound memory.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if x.ndim > 1:
+        return np.stack([rolling_spearman(a, b, window) for a, b in zip(x, y)])
+    out = np.full(x.shape, np.nan)
+    if window > len(x):
+        return out
+    rx = _ranks(np.lib.stride_tricks.sliding_window_view(x, window))
+    ry = _ranks(np.lib.stride_tricks.sliding_window_view(y, window))
+    d2 = np.square(rx - ry).sum(axis=-1)
+    out[window - 1:] = 1 - 6 * d2 / (window * (window * window - 1))
+    return out
+
+
+def _pearson(a, b):
+    a = a - a.mean(axis=-1, keepdims=True)
+    b = b - b.mean(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (a * b).sum(axis=-1) / np.sqrt((a * a).sum(axis=-1) * (b * b).sum(axis=-1))
+
+
+def lagged_cross_correlation(x, y, max_lag=MAX_LAG):
+    """Pearson correlation of x[t] with y[t + lag] for lag in -max_lag..max_lag.
+
+    A positive lag means x leads y. Returns (lags, correlations), correlations having
+    the lag axis last.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = x.shape[-1]
+    lags = np.arange(-max_lag, max_lag + 1)
+    corrs = []
+    for lag in lags:
+        if lag >= 0:
+            corrs.append(_pearson(x[..., :n - lag], y[..., lag:]))
+        else:
+            corrs.append(_pearson(x[..., -lag:], y[..., :n + lag]))
+    return lags, np.stack(corrs, axis=-1)
+
+
+def align(a, b):
+    """Restricts two to_arrays()-style column dicts to the dates they share."""
+    _, ia, ib = np.intersect1d(a['date'], b['date'], assume_unique=True, return_indices=True)
+    return ({name: values[ia] for name, values in a.items()},
+            {name: values[ib] for name, values in b.items()})
+
+
+def _last(values):
+    finite = values[np.isfinite(values)]
+    return finite[-1] if len(finite) else float('nan')
+
+
+def _series_line(symbol, arrays, periods_per_year, suffix):
+    close = arrays['close']
+    atr_value = _last(atr(arrays['high'], arrays['low'], close))
+    parts = [f"close {close[-1]:.2f}"]
+    parts += [f"SMA{w} {_last(sma(close, w)):.2f}" for w in SMA_WINDOWS]
+    parts += [
+        f"EMA{EMA_SPAN} {_last(ema(close, EMA_SPAN)):.2f}",
+        f"ATR{ATR_WINDOW} {atr_value:.2f} ({atr_value / close[-1] * 100:.1f}% of close)",
+        f"{RETURN_WINDOW}{suffix} return {_last(rolling_return(close, RETURN_WINDOW)) * 100:+.1f}%",
+        f"{VOLATILITY_WINDOW}{suffix} realized vol {_last(realized_volatility(close, VOLATILITY_WINDOW, periods_per_year)) * 100:.1f}%",
+    ]
+    return f"{symbol}: " + ", ".join(parts)
+
+
+def indicator_summary(stock, stock_symbol, btc, btc_symbol, timeframe='1d'):
+    """Compact text of the latest indicator values and stock/BTC correlation measures.
+
+    stock and btc are to_arrays()-style column dicts (either may be None) of bars in
+    timeframe (a BAR_UNITS key); windows count those bars.
+    """
+    name, suffix, unit, stock_ppy, btc_ppy = BAR_UNITS[timeframe]
+    lines = []
+    for symbol, arrays, ppy in ((stock_symbol, stock, stock_ppy), (btc_symbol, btc, btc_ppy)):
+        if arrays is not None and len(arrays['close']) > 1:
+            lines.append(_series_line(symbol, arrays, ppy, suffix))
+
+    if stock is not None and btc is not None:
+        a, b = align(stock, btc)
+        ra, rb = log_returns(a['close']), log_returns(b['close'])
+        if len(ra) >= CORRELATION_WINDOW:
+            lines.append(
+                f"{CORRELATION_WINDOW}-{unit} return correlation {stock_symbol}/{btc_symbol} (latest): "
+                f"Pearson {_last(rolling_pearson(ra, rb)):.2f}, Spearman {_last(rolling_spearman(ra, rb)):.2f}"
+            )
+        if len(ra) > 2 * MAX_LAG + 2:
+            lags, corrs = lagged_cross_correlation(ra, rb)
+            line = (f"Lagged cross-correlation of returns (positive lag = {stock_symbol} leads {btc_symbol}): "
+                    + ", ".join(f"{lag:+d}: {c:.2f}" for lag, c in zip(lags.tolist(), corrs.tolist())))
+            # A flat series has no return variance, so every correlation is NaN
+            if not np.all(np.isnan(corrs)):
+                line += f"; strongest at lag {lags[int(np.nanargmax(np.abs(corrs)))]:+d}"
+            lines.append(line)
+
+    if not lines:
+        return ""
+    return "\n".join([f"Indicators (latest values, computed from {name} data):"] + lines)
@@ -0,0 +1,58 @@
+"""Minimal JSON-over-HTTP/1.1 plumbing for the local asyncio services.
+
+Each connection carries one request: handle_request() parses it, awaits
+route(method, path, body) -> (status, payload) and writes payload back as JSON
+with Connection: close.
+"""
+import json
+
+MAX_BODY_BYTES = 64 * 1024
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+async def handle_request(reader, writer, route, max_body=MAX_BODY_BYTES):
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if len(request_line) < 2:
+            status, payload = 400, {'error': 'Malformed request'}
+        else:
+            method, path = request_line[0], request_line[1].split('?', 1)[0]
+            length = int(headers.get('content-length') or 0)
+            if length > max_body:
+                status, payload = 413, {'error': 'Request body too large'}
+            else:
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await route(method, path, body)
+    except Exception as e:
+        print(f"❌ Error handling request: {e}")
+        status, payload = 500, {'error': str(e)}
+
+    data = json.dumps(payload).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"Connection: close\r\n\r\n".encode() + data
+    )
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+def parse_json(body):
+    """Decodes a request body, returning (payload, None) or (None, (400, error))."""
+    try:
+        return json.loads(body or b'{}'), None
+    except ValueError:
+        return None, (400, {'error': 'Body is not valid JSON'})
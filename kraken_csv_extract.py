@@ -1,153 +1,383 @@
+"""Loads Kraken BTCUSD history into daily_ohlcv (or, for trade exports, minute/hour bars).
+
+Small OHLC files are read whole with pandas (the default). With --chunk-rows, or for
+raw trade exports (timestamp,price,volume - many gigabytes for the full history),
+the file is streamed instead: fixed-size chunks read with explicit dtypes, the part
+of the file before the latest stored day skipped with a binary search over byte
+offsets (Kraken exports are in time order), and trades folded into daily OHLCV
+bars as they arrive. Peak memory then depends on --chunk-rows, not on the file size.
+The latest stored day (or bar) is read and upserted again, since the file it came
+from may have ended partway through it.
+
+With --timeframe 1m or 1h, trades are aggregated into ohlcv_1m/ohlcv_1h instead, and
+the coarser tables (daily_ohlcv, weekly/monthly rollups) are refreshed from them; see
+ohlcv_store.py.
+
+pandas and psycopg2 are imported where they are first used, so a bad argument or a
+missing file fails without loading them.
+"""
 import os
-import pandas as pd
-import psycopg2
+import numpy as np
 from dotenv import load_dotenv
+import time
 import argparse
 import datetime
 from pathlib import Path
 
+import ohlcv_ingest
+import ohlcv_store
+import tracing
+
 # Load environment variables
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Import Bitcoin CSV data to Supabase')
-parser.add_argument('--file', type=str, default="bitcoin_daily_ohlc/BTCUSD_Daily_OHLC.csv",
-                   help='Path to Bitcoin CSV file (default: bitcoin_daily_ohlc/BTCUSD_Daily_OHLC.csv)')
-args = parser.parse_args()
-
 # Constants
 SYMBOL = "BTCUSD"
-CSV_PATH = args.file
-
-if not DATABASE_URL:
-    raise RuntimeError("Please set DATABASE_URL in your .env")
-
-if not Path(CSV_PATH).exists():
-    raise FileNotFoundError(f"CSV file not found: {CSV_PATH}")
-
-# Connect to Supabase
-print(f"Connecting to database...")
-conn = psycopg2.connect(DATABASE_URL)
-cur = conn.cursor()
-print("✅ Connected to database.")
-
-# Validate table existence
-print("Ensuring 'daily_ohlcv' table exists...")
-cur.execute("""
-CREATE TABLE IF NOT EXISTS daily_ohlcv (
-    symbol      TEXT        NOT NULL,
-    trade_date  DATE        NOT NULL,
-    open_price  NUMERIC(12,4) NOT NULL,
-    high_price  NUMERIC(12,4) NOT NULL,
-    low_price   NUMERIC(12,4) NOT NULL,
-    close_price NUMERIC(12,4) NOT NULL,
-    volume      BIGINT      NOT NULL,
-    PRIMARY KEY (symbol, trade_date)
-);
-""")
-conn.commit()
-print("✅ Table 'daily_ohlcv' is ready.")
-
-# Read the CSV file
-print(f"Reading CSV file: {CSV_PATH}...")
-df = pd.read_csv(CSV_PATH)
-print(f"✅ Loaded {len(df)} rows from CSV.")
-
-# Check latest date in database for this symbol
-latest_date = None
-cur.execute("SELECT MAX(trade_date) FROM daily_ohlcv WHERE symbol = %s", (SYMBOL,))
-result = cur.fetchone()
-if result[0] is not None:
-    latest_date = result[0]
-    print(f"Found existing data for {SYMBOL} up to {latest_date}")
-else:
-    print(f"No existing data found for {SYMBOL}, will import all available history")
-
-# Process the data
-print("Processing data...")
-
-df['trade_date'] = pd.to_datetime(df['timestamp'], unit='s').dt.date
-
-for col in ['open', 'high', 'low', 'close', 'volume']:
-    df[col] = pd.to_numeric(df[col], errors='coerce')
-
-df['volume'] = df['volume'].round().astype('int64')
-
-# Drop the original timestamp and trades columns, rename the rest to match our schema
-df = df.drop(columns=['timestamp', 'trades'])
-df = df.rename(columns={
-    'open': 'open_price',
-    'high': 'high_price',
-    'low': 'low_price',
-    'close': 'close_price'
-})
-
-# Add the symbol column
-df['symbol'] = SYMBOL
-
-# Filter data to only include new entries
-if latest_date:
-    df = df[df['trade_date'] > latest_date]
-    print(f"Found {len(df)} new entries to upload (after {latest_date})")
-else:
-    print(f"All {len(df)} entries will be uploaded")
-
-if len(df) == 0:
-    print("No new data to upload!")
-    cur.close()
+DAY_SECONDS = 86400
+DEFAULT_CHUNK_ROWS = 1000000
+# Kraken's downloadable files have no header; the sample CSV in this repo has one
+OHLC_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trades']
+TRADE_COLUMNS = ['timestamp', 'price', 'volume']
+DTYPES = {'timestamp': 'float64', 'open': 'float64', 'high': 'float64', 'low': 'float64',
+          'close': 'float64', 'price': 'float64', 'volume': 'float64', 'trades': 'int64'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Import Bitcoin CSV data to Supabase')
+    parser.add_argument('--file', type=str, default="bitcoin_daily_ohlc/BTCUSD_Daily_OHLC.csv",
+                       help='Path to Bitcoin CSV file (default: bitcoin_daily_ohlc/BTCUSD_Daily_OHLC.csv)')
+    parser.add_argument('--loader', choices=['copy', 'batch'], default='copy',
+                       help="'copy' streams into a staging table and merges in one statement, "
+                            "'batch' upserts pages of rows with execute_values (default: copy)")
+    parser.add_argument('--page-size', type=int, default=ohlcv_ingest.DEFAULT_PAGE_SIZE,
+                       help=f'Rows per statement for the batch loader (default: {ohlcv_ingest.DEFAULT_PAGE_SIZE})')
+    parser.add_argument('--chunk-rows', type=int,
+                       help='Stream the file in chunks of this many rows instead of loading it whole '
+                            f'(always on for trade exports, default {DEFAULT_CHUNK_ROWS})')
+    parser.add_argument('--timeframe', choices=['1m', '1h', '1d'], default='1d',
+                       help='Bar size to aggregate trade exports into; 1m and 1h go to ohlcv_1m/ohlcv_1h '
+                            'and are rolled up into daily_ohlcv (default: 1d)')
+    return parser.parse_args()
+
+
+def load_csv(csv_path, symbol=SYMBOL):
+    """Reads a Kraken OHLC CSV and returns a DataFrame matching the daily_ohlcv schema."""
+    import pandas as pd
+
+    print(f"Reading CSV file: {csv_path}...")
+    with tracing.span("csv read", path=csv_path):
+        df = pd.read_csv(csv_path)
+    print(f"✅ Loaded {len(df)} rows from CSV.")
+
+    print("Processing data...")
+    df['trade_date'] = pd.to_datetime(df['timestamp'], unit='s').dt.date
+
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    df['volume'] = df['volume'].round().astype('int64')
+
+    # Drop the original timestamp and trades columns, rename the rest to match our schema
+    df = df.drop(columns=['timestamp', 'trades'])
+    df = df.rename(columns={
+        'open': 'open_price',
+        'high': 'high_price',
+        'low': 'low_price',
+        'close': 'close_price'
+    })
+
+    # Add the symbol column
+    df['symbol'] = symbol
+
+    # Sort by date to ensure chronological insertion
+    return df.sort_values('trade_date')
+
+
+def sniff_csv(csv_path):
+    """Returns (format, column names, has_header) of a Kraken OHLC or trade CSV from its first line."""
+    with open(csv_path) as f:
+        first = f.readline().strip().split(',')
+    has_header = not first[0].replace('.', '', 1).isdigit()
+    if has_header:
+        names = [name.strip() for name in first]
+        return ('trades' if 'price' in names else 'ohlc'), names, True
+    if len(first) == len(TRADE_COLUMNS):
+        return 'trades', TRADE_COLUMNS, False
+    if len(first) in (len(OHLC_COLUMNS), len(OHLC_COLUMNS) - 1):
+        return 'ohlc', OHLC_COLUMNS[:len(first)], False
+    raise ValueError(f"Unrecognised CSV layout in {csv_path}: {len(first)} columns")
+
+
+def seek_offset(csv_path, min_timestamp, data_start=0):
+    """Byte offset of a line start at or before the first row with timestamp >= min_timestamp.
+
+    Binary search over byte offsets, reading one line per step; assumes rows are in time order.
+    """
+    with open(csv_path, 'rb') as f:
+        lo, hi = data_start, f.seek(0, os.SEEK_END)
+        while hi - lo > 65536:
+            mid = (lo + hi) // 2
+            f.seek(mid)
+            f.readline()  # Skip to the next line start
+            line = f.readline()
+            if not line or float(line.split(b',', 1)[0]) >= min_timestamp:
+                hi = mid
+            else:
+                lo = mid
+        if lo == data_start:
+            return data_start
+        f.seek(lo)
+        f.readline()
+        return f.tell()
+
+
+class BarAggregator:
+    """Folds time-ordered trades into OHLCV bars of `interval` seconds, one chunk at a time.
+
+    A chunk's last bar may continue in the next chunk, so it is held back until a later
+    bar starts (or flush() is called).
+    """
+
+    def __init__(self, interval=DAY_SECONDS):
+        self.interval = interval
+        self.pending = None
+
+    def add(self, timestamps, prices, volumes):
+        """Returns the bars completed by this chunk as a dict of arrays (bucket, open, high, low, close, volume)."""
+        if not len(timestamps):
+            return None
+        buckets = (timestamps // self.interval).astype('int64')
+        if np.any(buckets[1:] < buckets[:-1]) or (self.pending and buckets[0] < self.pending['bucket'][0]):
+            raise ValueError("Trades are not in time order")
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+        bars = {
+            'bucket': buckets[starts],
+            'open': prices[starts],
+            'high': np.maximum.reduceat(prices, starts),
+            'low': np.minimum.reduceat(prices, starts),
+            'close': prices[ends],
+            'volume': np.add.reduceat(volumes, starts),
+        }
+        pending = self.pending
+        if pending is not None:
+            if pending['bucket'][0] == bars['bucket'][0]:
+                # The held-back bar continues in this chunk: merge it into the first bar
+                bars['open'][0] = pending['open'][0]
+                bars['high'][0] = max(bars['high'][0], pending['high'][0])
+                bars['low'][0] = min(bars['low'][0], pending['low'][0])
+                bars['volume'][0] += pending['volume'][0]
+            else:
+                bars = {k: np.concatenate([pending[k], v]) for k, v in bars.items()}
+        self.pending = {k: v[-1:].copy() for k, v in bars.items()}
+        return {k: v[:-1] for k, v in bars.items()}
+
+    def flush(self):
+        pending, self.pending = self.pending, None
+        return pending
+
+
+def _bars(bar_start, open_, high, low, close, volume):
+    """A batch of bars (dict of arrays) from bar start timestamps (epoch seconds) and columns."""
+    bar_start = np.asarray(bar_start, dtype='int64').astype('datetime64[s]')
+    return {
+        'bar_start': bar_start,
+        'trade_date': bar_start.astype('datetime64[D]'),
+        'open_price': open_,
+        'high_price': high,
+        'low_price': low,
+        'close_price': close,
+        'volume': volume,
+    }
+
+
+def stream_bars(csv_path, since_date=None, chunk_rows=DEFAULT_CHUNK_ROWS, interval=DAY_SECONDS, min_timestamp=None):
+    """Yields (bars, rows_read) from a Kraken OHLC or trade CSV, one chunk at a time.
+
+    bars is a dict of arrays - bar_start, trade_date, open/high/low/close_price and
+    (unrounded) volume - or None when nothing in the chunk is new. Only rows from
+    since_date (or min_timestamp, in epoch seconds) on are used, so the bar stored
+    last is rebuilt whole. Trades are aggregated into bars of `interval` seconds.
+    """
+    import pandas as pd
+
+    fmt, names, has_header = sniff_csv(csv_path)
+    min_ts = min_timestamp or 0
+    if since_date is not None and min_timestamp is None:
+        min_ts = np.datetime64(since_date, 'D').astype('datetime64[s]').astype('int64')
+    with open(csv_path, 'rb') as f:
+        data_start = len(f.readline()) if has_header else 0
+    offset = seek_offset(csv_path, min_ts, data_start) if min_ts else data_start
+
+    aggregator = BarAggregator(interval)
+    with open(csv_path, 'rb') as f:
+        f.seek(offset)
+        reader = pd.read_csv(f, header=None, names=names, chunksize=chunk_rows,
+                             dtype={k: v for k, v in DTYPES.items() if k in names})
+        for chunk in reader:
+            ts = chunk['timestamp'].to_numpy()
+            keep = ts >= min_ts
+            if not keep.any():
+                yield None, len(chunk)
+                continue
+            if fmt == 'trades':
+                done = aggregator.add(ts[keep], chunk['price'].to_numpy()[keep], chunk['volume'].to_numpy()[keep])
+                bars = None
+                if done is not None and len(done['bucket']):
+                    bars = _bars(done['bucket'] * interval, done['open'], done['high'], done['low'],
+                                 done['close'], done['volume'])
+            else:
+                bars = _bars(ts[keep], *(chunk[k].to_numpy()[keep] for k in ('open', 'high', 'low', 'close', 'volume')))
+            yield bars, len(chunk)
+    last = aggregator.flush()
+    if last is not None:
+        yield _bars(last['bucket'] * interval, last['open'], last['high'], last['low'],
+                    last['close'], last['volume']), 0
+
+
+def load_bars(conn, bars, args):
+    import psycopg2
+
+    if args.loader == 'copy':
+        try:
+            return ohlcv_ingest.copy_bars(SYMBOL, bars, conn)
+        except psycopg2.Error as e:
+            # e.g. poolers or roles that don't allow COPY; nothing was merged, so retry in batches
+            print(f"⚠️ COPY load failed ({e}), falling back to batched upserts...")
+            args.loader = 'batch'
+    return ohlcv_ingest.upsert_bars(SYMBOL, bars, conn, page_size=args.page_size)
+
+
+def stream_to_db(conn, csv_path, latest_date, args):
+    """Streams csv_path into daily_ohlcv chunk by chunk (see stream_bars). Returns the first date written.
+
+    Starts at latest_date: that day may have been stored from a file that ended partway through it.
+    """
+    chunk_rows = args.chunk_rows or DEFAULT_CHUNK_ROWS
+    fmt = sniff_csv(csv_path)[0]
+    print(f"Streaming {fmt} from {csv_path} in chunks of {chunk_rows} rows ({args.loader} loader)...")
+    start = time.perf_counter()
+    rows_read = row_count = 0
+    first_date = None
+    for bars, rows in stream_bars(csv_path, latest_date, chunk_rows):
+        rows_read += rows
+        if bars is not None and len(bars['trade_date']):
+            if first_date is None:
+                first_date = bars['trade_date'][0].item()
+            # daily_ohlcv stores whole units of volume
+            row_count += load_bars(conn, dict(bars, volume=np.round(bars['volume']).astype('int64')), args)
+    elapsed = time.perf_counter() - start
+    # Includes the loads, which also have their own db spans
+    tracing.record("csv stream", elapsed, path=csv_path, rows=rows_read)
+    print(f"✅ Read {rows_read} rows in {elapsed:.1f}s ({rows_read / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f"✅ Successfully upserted {row_count} days of {SYMBOL} into daily_ohlcv")
+    return first_date
+
+
+def stream_intraday_to_db(conn, csv_path, timeframe, args):
+    """Streams a trade export into ohlcv_1m/ohlcv_1h. Returns the first written bar's start, or None.
+
+    Starts at the latest stored bar, which may have been cut short by the end of an earlier file.
+    """
+    chunk_rows = args.chunk_rows or DEFAULT_CHUNK_ROWS
+    interval = ohlcv_store.BAR_SECONDS[timeframe]
+    table = ohlcv_store.TABLES[timeframe][0]
+    latest = ohlcv_store.latest_bar(conn, SYMBOL, timeframe)
+    min_timestamp = None
+    if latest is not None:
+        print(f"Found existing {timeframe} bars for {SYMBOL} up to {latest}")
+        min_timestamp = int(latest.timestamp())
+
+    print(f"Streaming trades from {csv_path} into {table} in chunks of {chunk_rows} rows...")
+    start = time.perf_counter()
+    rows_read = row_count = 0
+    first_bar = None
+    for bars, rows in stream_bars(csv_path, chunk_rows=chunk_rows, interval=interval, min_timestamp=min_timestamp):
+        rows_read += rows
+        if bars is not None and len(bars['bar_start']):
+            if first_bar is None:
+                first_bar = bars['bar_start'][0].item()
+            row_count += ohlcv_store.copy_intraday(conn, SYMBOL, timeframe, bars)
+    elapsed = time.perf_counter() - start
+    # Includes the loads, which also have their own db spans
+    tracing.record("csv stream", elapsed, path=csv_path, rows=rows_read)
+    print(f"✅ Read {rows_read} rows in {elapsed:.1f}s ({rows_read / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f"✅ Successfully upserted {row_count} {timeframe} bars of {SYMBOL} into {table}")
+    return first_bar
+
+
+def refresh_rollups(conn, source, since):
+    if since is None:
+        return
+    start = time.perf_counter()
+    written = ohlcv_store.refresh_rollups(conn, SYMBOL, source, since)
+    print(f"✅ Refreshed rollups from {since} in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{rows} {tf} bars" for tf, rows in written.items()))
+
+
+def main():
+    args = parse_args()
+    csv_path = args.file
+
+    if not DATABASE_URL:
+        raise RuntimeError("Please set DATABASE_URL in your .env")
+
+    if not Path(csv_path).exists():
+        raise FileNotFoundError(f"CSV file not found: {csv_path}")
+
+    conn = ohlcv_ingest.connect(DATABASE_URL)
+    ohlcv_store.ensure_tables(conn)
+
+    if args.timeframe != '1d':
+        if sniff_csv(csv_path)[0] != 'trades':
+            raise ValueError(f"--timeframe {args.timeframe} needs a trade export (timestamp,price,volume)")
+        first_bar = stream_intraday_to_db(conn, csv_path, args.timeframe, args)
+        refresh_rollups(conn, args.timeframe, first_bar)
+        conn.close()
+        print("✅ Database connection closed.")
+        return
+
+    # Check latest date in database for this symbol
+    latest_date = ohlcv_ingest.latest_trade_date(conn, SYMBOL)
+    if latest_date is not None:
+        print(f"Found existing data for {SYMBOL} up to {latest_date}")
+    else:
+        print(f"No existing data found for {SYMBOL}, will import all available history")
+
+    if args.chunk_rows or sniff_csv(csv_path)[0] == 'trades':
+        first_date = stream_to_db(conn, csv_path, latest_date, args)
+        refresh_rollups(conn, '1d', first_date)
+        conn.close()
+        print("✅ Database connection closed.")
+        return
+
+    df = load_csv(csv_path)
+
+    # Filter data to only include new entries
+    if latest_date:
+        # The latest day is loaded again, in case it was stored before the day was over
+        df = df[df['trade_date'] >= latest_date]
+        print(f"Found {len(df)} entries to upload (from {latest_date} on)")
+    else:
+        print(f"All {len(df)} entries will be uploaded")
+
+    if len(df) == 0:
+        print("No new data to upload!")
+        conn.close()
+        print("✅ Database connection closed.")
+        return
+
+    print(f"Upserting {len(df)} daily bars for {SYMBOL} ({args.loader} loader)...")
+    row_count = load_bars(conn, df, args)
+    refresh_rollups(conn, '1d', df['trade_date'].min())
+
     conn.close()
     print("✅ Database connection closed.")
-    exit(0)
-
-# Upsert each daily bar
-print(f"Upserting {len(df)} daily bars for {SYMBOL}...")
-upsert_sql = """
-INSERT INTO daily_ohlcv
-  (symbol, trade_date, open_price, high_price, low_price, close_price, volume)
-VALUES (%s, %s, %s, %s, %s, %s, %s)
-ON CONFLICT (symbol, trade_date) DO UPDATE
-  SET open_price  = EXCLUDED.open_price,
-      high_price  = EXCLUDED.high_price,
-      low_price   = EXCLUDED.low_price,
-      close_price = EXCLUDED.close_price,
-      volume      = EXCLUDED.volume;
-"""
 
-row_count = 0
-commit_interval = 500  # Commit every 500 rows
-
-first_row = True
-# Sort by date to ensure chronological insertion
-df = df.sort_values('trade_date')
-
-for _, row in df.iterrows():
-    if first_row:
-        print(f"Inserting first row for date: {row['trade_date']}...")
-        first_row = False
-        
-    cur.execute(upsert_sql, (
-        row['symbol'],
-        row['trade_date'],
-        row['open_price'],
-        row['high_price'],
-        row['low_price'],
-        row['close_price'],
-        row['volume']
-    ))
-    
-    row_count += 1
-    if row_count % commit_interval == 0:
-        conn.commit()
-        print(f"    Committed {row_count}/{len(df)} rows...")
-
-# Commit any remaining rows that didn't make a full batch
-conn.commit()
-print(f"    Committed final rows. Total: {row_count}")
-
-cur.close()
-conn.close()
-print("✅ Database connection closed.")
-
-print(f"✅ Successfully upserted {row_count} days of {SYMBOL} into daily_ohlcv")
+    print(f"✅ Successfully upserted {row_count} days of {SYMBOL} into daily_ohlcv")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,42 @@
-import time
-import hmac
-import hashlib
-import requests
-import urllib.parse
 import os
 import sys
-from decimal import Decimal, ROUND_DOWN
 from dotenv import load_dotenv
 
+import tracing
+
 # Load environment variables
 load_dotenv()
 
 API_KEY    = os.getenv("MEXC_API_KEY")
 API_SECRET = os.getenv("MEXC_API_SECRET")
-if not API_KEY or not API_SECRET:
-    print("Error - API_KEY or API_SECRET not found")
-    exit()
 
-BASE_URL        = "https://api.mexc.co"
+BASE_URL        = os.getenv("MEXC_BASE_URL") or "https://api.mexc.co"
 SYMBOL          = "WBTCUSDT"
 USDT_TO_SPEND   = 20.0
 PRICE_PRECISION = 2
 
-session = requests.Session()
-
-def format_value(value, precision):
-    return f"{Decimal(str(value)).quantize(Decimal('1e-' + str(precision)), rounding=ROUND_DOWN)}"
-
-def sign_request(params):
-    qs = urllib.parse.urlencode(params)
-    return hmac.new(API_SECRET.encode(), qs.encode(), hashlib.sha256).hexdigest()
-
-def send_signed_request(method, endpoint, params):
-    params['timestamp']   = int(time.time() * 1000)
-    params['recvWindow']  = 5000
-    params['signature']   = sign_request(params)
-    headers = {'X-MEXC-APIKEY': API_KEY}
+_client = None
 
-    if method == 'GET':
-        r = session.get(BASE_URL + endpoint, headers=headers, params=params)
-    else:
-        data_str = urllib.parse.urlencode(params)
-        r = session.post(BASE_URL + endpoint + "?" + data_str, headers=headers)
-
-    r.raise_for_status()
-    return r.json()
-
-def validate_api_keys():
-    try:
-        r = send_signed_request('GET', '/api/v3/account', {})
-        return 'makerCommission' in r
-    except Exception as e:
-        print("Error -  API key validation failed:", e)
-        return False
+def get_client():
+    # requests and the exchange client are only imported once a buy is confirmed,
+    # so the "no" runs n8n starts don't pay for them
+    global _client
+    if _client is None:
+        from mexc_client import MexcClient
+        _client = MexcClient(API_KEY, API_SECRET, BASE_URL)
+    return _client
 
 def place_market_buy():
-    qty_str = format_value(USDT_TO_SPEND, PRICE_PRECISION)
-    params = {
-        'symbol':       SYMBOL,
-        'side':         'BUY',
-        'type':         'MARKET',
-        'quoteOrderQty': qty_str
-    }
-    resp = send_signed_request('POST', '/api/v3/order', params)
+    # No separate key check first: a rejected key comes back as this order's error
+    client = get_client()
+    resp = client.market_buy(SYMBOL, USDT_TO_SPEND, PRICE_PRECISION)
     print("[+] Market BUY response:", resp)
+    print(client.format_timings())
 
 def main():
     # Check if a command-line argument was provided
     if len(sys.argv) < 2:
-        print("Usage: python3 mexc_buy.py yes|no")
+        print("Usage: python3 mexc_buy.py yes|no [run id]")
         print("You must specify 'yes' to execute the buy operation")
         return
     
@@ -76,12 +44,28 @@ def main():
     if sys.argv[1].lower() != "yes":
         print("Buy operation cancelled. Use 'yes' to confirm the buy.")
         return
-        
-    print("Buy WBTCUSDT")
-    if not validate_api_keys():
-        print("Error -  API key validation failed.")
+
+    if not API_KEY or not API_SECRET:
+        print("Error - API_KEY or API_SECRET not found")
         return
-    place_market_buy()
+
+    import requests
+    from mexc_client import exchange_error, is_auth_error
+
+    # The n8n execution id, so this order's spans line up with the analysis that decided it
+    if len(sys.argv) > 2:
+        tracing.set_run_id(sys.argv[2])
+
+    print("Buy WBTCUSDT")
+    try:
+        with tracing.span("buy", symbol=SYMBOL):
+            place_market_buy()
+    except requests.exceptions.HTTPError as e:
+        if is_auth_error(e):
+            print("Error -  API key validation failed:", exchange_error(e).get('msg', e))
+        else:
+            print(f"Failed to place order: {e}")
+            print(f"Exchange response: {e.response.text}")
 
 if __name__ == "__main__":
     main()
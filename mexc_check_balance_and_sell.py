@@ -1,14 +1,22 @@
 import time
-import hmac
-import hashlib
+import asyncio
 import requests
-import urllib.parse
 import os
 import json
-from decimal import Decimal, ROUND_DOWN
+from decimal import Decimal
 from datetime import datetime
 from dotenv import load_dotenv
 
+import tracing
+import price_oracle
+from mexc_client import MexcClient, exchange_error
+from param_store import ParamStore, DEFAULT_KEY
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
 # Load environment variables
 load_dotenv()
 
@@ -18,105 +26,207 @@ if not API_KEY or not API_SECRET:
     print("Error - API_KEY or API_SECRET not found")
     exit()
 
-BASE_URL            = "https://api.mexc.co"
+BASE_URL            = os.getenv("MEXC_BASE_URL") or "https://api.mexc.co"
+WS_URL              = os.getenv("MEXC_WS_URL", "wss://wbs.mexc.com/ws")
 SYMBOL              = "WBTCUSDT"
 PARAMS_FILE         = "ai_agent_param.json"
-PRICE_PRECISION     = 2
-QUANTITY_PRECISION  = 5
-SLEEP_INTERVAL      = 120
+PARAMS_KEY          = os.getenv("PARAMS_KEY") or DEFAULT_KEY  # Which run's parameters to follow
+POLL_INTERVAL       = 10   # REST polling interval while the price stream is down
+PRICE_MAX_AGE       = 5    # Oldest price the poll accepts from the shared price oracle
+RECONNECT_DELAY     = 30   # How long to poll before trying the stream again
+STREAM_TIMEOUT      = 30   # Treat the stream as dead after this long without a message
+PING_INTERVAL       = 20   # MEXC drops idle connections, so ping well inside its timeout
+STATUS_INTERVAL     = 120  # How often to log the current price
 MIN_BALANCE         = Decimal('0.00015')  # Minimum balance to execute trades
+TRACE_TICK_EVERY    = 100  # Trace one in this many price ticks (plus every tick that triggers a sell)
+SELL_RETRY_DELAY    = 5    # Wait after a failed sell, doubled after each further failure...
+SELL_RETRY_MAX      = 120  # ...up to this many seconds
 
-session = requests.Session()
+client = MexcClient(API_KEY, API_SECRET, BASE_URL)
 
 # Helper functions
-def sign_request(params):
-    qs = urllib.parse.urlencode(params)
-    return hmac.new(API_SECRET.encode(), qs.encode(), hashlib.sha256).hexdigest()
-
-def send_signed_request(method, endpoint, params):
-    params['timestamp']  = int(time.time() * 1000)
-    params['recvWindow'] = 5000
-    params['signature']  = sign_request(params)
-    headers = {'X-MEXC-APIKEY': API_KEY}
-
-    if method == 'POST':
-        data = urllib.parse.urlencode(params)
-        r = session.post(f"{BASE_URL}{endpoint}?{data}", headers=headers)
-    else:
-        r = session.get(f"{BASE_URL}{endpoint}", headers=headers, params=params)
-
-    r.raise_for_status()
-    return r.json()
-
 def get_wbtc_balance():
-    resp = send_signed_request('GET', '/api/v3/account', {})
-    for b in resp.get('balances', []):
-        if b['asset'] == 'WBTC':
-            return Decimal(b['free'])  # Only use free balance, not locked balance
-    return Decimal('0')
-
-def load_params():
-    with open(PARAMS_FILE) as f:
+    return client.free_balance('WBTC')
+
+def load_params(path=None):
+    with open(path or PARAMS_FILE) as f:
         p = json.load(f)
     return Decimal(str(p['take_profit'])), Decimal(str(p['stop_loss']))
 
-def get_price():
-    r = session.get(f"{BASE_URL}/api/v3/ticker/price", params={'symbol': SYMBOL})
-    r.raise_for_status()
-    return Decimal(r.json()['price'])
+class ParamsWatcher:
+    """Returns the current (tp, sl) for `key`, re-reading only when the parameter store has changed.
+
+    Until the store has an entry for the key, PARAMS_FILE is used instead (re-read when its mtime changes).
+    """
+
+    def __init__(self, key=DEFAULT_KEY, path=None, store=None):
+        self.key = key
+        self.path = path or PARAMS_FILE
+        self.store = store or ParamStore()
+        self.version = None
+        self.mtime = None
+        self.params = None
+
+    def get(self):
+        # PRAGMA data_version only: no query against the table unless something was written
+        if self.store.changed():
+            row = self.store.get(self.key)
+            if row is not None and row['version'] != self.version:
+                self.version = row['version']
+                self.params = Decimal(str(row['take_profit'])), Decimal(str(row['stop_loss']))
+                print(f"Current parameters (version {self.version}) - "
+                      f"Take-Profit @ {self.params[0]}, Stop-Loss @ {self.params[1]}")
+        if self.version is None:
+            return self.get_from_file()
+        return self.params
+
+    def get_from_file(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if self.params is None:
+                raise
+            print(f"Warning: can't stat {self.path} ({e}), keeping the current parameters")
+            return self.params
+        if mtime != self.mtime:
+            try:
+                self.params = load_params(self.path)
+                self.mtime = mtime
+                print(f"Current parameters - Take-Profit @ {self.params[0]}, Stop-Loss @ {self.params[1]}")
+            except (ValueError, KeyError) as e:
+                # The file may be caught mid-write; keep the old values and retry on the next tick
+                if self.params is None:
+                    raise
+                print(f"Warning: can't parse {self.path} ({e}), keeping the current parameters")
+        return self.params
 
-def format_value(val, prec):
-    return f"{val.quantize(Decimal('1e-' + str(prec)), rounding=ROUND_DOWN)}"
+def get_price():
+    # Shared with the analysis and other monitors through price_oracle.py, instead of a ticker call each
+    return price_oracle.get_price(SYMBOL, max_age=PRICE_MAX_AGE)
 
 def place_market_sell(qty_str):
     try:
-        # Apply a small reduction to account for possible fees
-        qty_decimal = Decimal(qty_str) * Decimal('0.995')
-        qty_str = format_value(qty_decimal, QUANTITY_PRECISION)
-        print(f"Selling quantity: {qty_str} (reduced to account for fees)")
-        
-        params = {
-            'symbol':   SYMBOL,
-            'side':     'SELL',
-            'type':     'MARKET',
-            'quantity': qty_str
-        }
-        
-        resp = send_signed_request('POST', '/api/v3/order', params)
+        # qty_str is already rounded down to the exchange's step size, so it is sold as is;
+        # market_sell() only retries (with a fresh balance) if the exchange still says "Oversold"
+        print(f"Selling quantity: {qty_str}")
+        resp = client.market_sell(SYMBOL, Decimal(qty_str), MIN_BALANCE)
         print("[+] Market SELL response:", resp)
+        print(client.format_timings())
         return True
     except requests.exceptions.HTTPError as e:
         print(f"Failed to place order: {e}")
-        if hasattr(e.response, 'text'):
+        if exchange_error(e):
             print(f"Exchange response: {e.response.text}")
-            
-            # If still oversold, try reducing the quantity
-            if "Oversold" in e.response.text:
-                print("Trying with 99% of available quantity...")
-                try:
-                    reduced_qty = Decimal(qty_str) * Decimal('0.99')
-                    reduced_qty_str = format_value(reduced_qty, QUANTITY_PRECISION)
-                    
-                    params = {
-                        'symbol':   SYMBOL,
-                        'side':     'SELL',
-                        'type':     'MARKET', 
-                        'quantity': reduced_qty_str
-                    }
-                    
-                    resp = send_signed_request('POST', '/api/v3/order', params)
-                    print("[+] Market SELL response:", resp)
-                    return True
-                except Exception as inner_e:
-                    print(f"Second attempt also failed: {inner_e}")
-                    return False
-        
         return False
     except Exception as e:
         print(f"Unexpected error: {e}")
         return False
 
 
+async def stream_prices(symbol):
+    """Yields (price, received_at) for every trade on the MEXC public deals stream."""
+    channel = f"spot@public.deals.v3.api@{symbol}"
+    async with websockets.connect(WS_URL, ping_interval=None) as ws:
+        await ws.send(json.dumps({"method": "SUBSCRIPTION", "params": [channel]}))
+        print(f"Subscribed to {channel}")
+        last_message = time.monotonic()
+        while True:
+            try:
+                message = await asyncio.wait_for(ws.recv(), PING_INTERVAL)
+            except asyncio.TimeoutError:
+                # Quiet markets can go a while without trades; a ping tells silence from a dead link
+                if time.monotonic() - last_message > STREAM_TIMEOUT:
+                    raise
+                await ws.send(json.dumps({"method": "PING"}))
+                continue
+            received_at = time.perf_counter()
+            last_message = time.monotonic()
+            data = json.loads(message)
+            deals = (data.get('d') or {}).get('deals') if data.get('c') == channel else None
+            if deals:
+                # Deals arrive oldest first; only the latest price matters for TP/SL
+                yield Decimal(str(deals[-1]['p'])), received_at
+
+async def poll_prices(duration=None):
+    """Yields (price, received_at) from the REST ticker every POLL_INTERVAL, for `duration` seconds (None: forever)."""
+    deadline = None if duration is None else time.monotonic() + duration
+    while deadline is None or time.monotonic() < deadline:
+        try:
+            price = await asyncio.to_thread(get_price)
+            yield price, time.perf_counter()
+        except (requests.exceptions.RequestException, price_oracle.PriceUnavailable) as e:
+            print(f"Failed to fetch price: {e}")
+        await asyncio.sleep(POLL_INTERVAL)
+
+async def price_ticks(symbol):
+    """Streams prices, falling back to REST polling whenever the stream is unavailable."""
+    if websockets is None:
+        print("websockets is not installed (pip install websockets), polling the REST ticker instead")
+        async for tick in poll_prices():
+            yield tick
+        return
+
+    while True:
+        try:
+            async for tick in stream_prices(symbol):
+                yield tick
+            print("Price stream closed")
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException, ValueError) as e:
+            print(f"Price stream unavailable: {e!r}")
+        print(f"Polling the REST ticker every {POLL_INTERVAL}s for {RECONNECT_DELAY}s before reconnecting...")
+        async for tick in poll_prices(RECONNECT_DELAY):
+            yield tick
+
+async def monitor(qty_str, params_key=None):
+    """Evaluates TP/SL on every price tick until a market sell succeeds.
+
+    Returns the trigger-to-order latency in seconds (tick received -> order acknowledged).
+    """
+    params_key = params_key or PARAMS_KEY
+    if params_key != DEFAULT_KEY:
+        # A run's own key is its n8n execution id
+        tracing.set_run_id(params_key)
+    params = ParamsWatcher(params_key)
+    params.get()
+    ticks = price_ticks(SYMBOL)
+    last_status = 0
+    tick_count = 0
+    retry_delay = SELL_RETRY_DELAY
+    retry_at = 0
+    try:
+        async for price, received_at in ticks:
+            # After a failed sell, ticks queued up meanwhile are drained without being evaluated
+            if time.monotonic() < retry_at:
+                continue
+            tp, sl = params.get()
+            tick_count += 1
+            if tick_count % TRACE_TICK_EVERY == 0:
+                tracing.record("monitor tick", time.perf_counter() - received_at, price=price)
+            if time.monotonic() - last_status >= STATUS_INTERVAL:
+                ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                print(f"[{ts}] Current price: {price}")
+                last_status = time.monotonic()
+
+            if price >= tp:
+                print(f"Price {price} ≥ TP ({tp}). Selling {qty_str} WBTC at market.")
+            elif price <= sl:
+                print(f"Price {price} ≤ SL ({sl}). Selling {qty_str} WBTC at market.")
+            else:
+                continue
+
+            success = await asyncio.to_thread(place_market_sell, qty_str)
+            latency = time.perf_counter() - received_at
+            tracing.record("trigger to order", latency, ok=success, price=price)
+            print(f"Trigger-to-order latency: {latency * 1000:.1f} ms")
+            if success:
+                return latency
+            print(f"Warning: Order failed. Will continue monitoring, next attempt in {retry_delay}s...")
+            retry_at = time.monotonic() + retry_delay
+            retry_delay = min(retry_delay * 2, SELL_RETRY_MAX)
+    finally:
+        await ticks.aclose()
+
+
 def main():
     print("Monitor WBTCUSDT & Market Sell")
     balance = get_wbtc_balance()
@@ -129,37 +239,16 @@ def main():
         print(f"Balance ({balance}) is too small, won't execute any market sell (minimum: {MIN_BALANCE})")
         return
 
-    qty_str = format_value(balance, QUANTITY_PRECISION)
+    # Rounded to the symbol's step size now, so the sell itself is a single request
+    qty_str = str(client.sellable_quantity(SYMBOL, balance))
+    client.warm_up()
     print(f"WBTC balance: {balance}")
     print(f"Qty to sell: {qty_str}")
 
-    while True:
-        # Reload parameters on each check
-        tp, sl = load_params()
-        print(f"Current parameters - Take-Profit @ {tp}, Stop-Loss @ {sl}")
-        
-        price = get_price()
-        ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"[{ts}] Current price: {price}")
-
-        if price >= tp:
-            print(f"Price ≥ TP ({tp}). Selling {qty_str} WBTC at market.")
-            success = place_market_sell(qty_str)
-            if success:
-                break
-            else:
-                print("Warning: Order failed. Will continue monitoring...")
-        
-        if price <= sl:
-            print(f"Price ≤ SL ({sl}). Selling {qty_str} WBTC at market.")
-            success = place_market_sell(qty_str)
-            if success:
-                break
-            else:
-                print("Warning: Order failed. Will continue monitoring...")
-
-        print(f"No trigger. Sleeping {SLEEP_INTERVAL}s...")
-        time.sleep(SLEEP_INTERVAL)
+    try:
+        asyncio.run(monitor(qty_str))
+    except KeyboardInterrupt:
+        print("Monitoring stopped.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,215 @@
+"""Shared MEXC spot order path for mexc_buy.py, mexc_check_balance_and_sell.py and
+position_monitor.py.
+
+One MexcClient keeps a keep-alive session to the exchange. It caches the symbol's
+trading rules (quantity/quote precision from /api/v3/exchangeInfo, on disk for
+FILTERS_TTL) and the balances from a single /api/v3/account snapshot, so an order
+is one round trip:
+
+  * buys go straight to /api/v3/order - a bad key shows up as the order's error,
+    instead of costing a separate validation call first;
+  * sells use the free balance rounded down to the symbol's step size, which the
+    exchange accepts as is, instead of a fixed haircut followed by a retry on
+    "Oversold". If the balance did change, one retry uses a fresh snapshot.
+
+Every signed request records how long signing, sending (until the response arrives)
+and acknowledging (status check and JSON decode) took; see last_timings. The same
+stages are written as "order sign"/"order send"/"order ack" spans ("account ..." for
+the balance snapshot) when tracing is on (see tracing.py).
+"""
+import os
+import json
+import time
+import hmac
+import hashlib
+import requests
+import threading
+import urllib.parse
+from decimal import Decimal, ROUND_DOWN
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+BASE_URL = os.getenv("MEXC_BASE_URL") or "https://api.mexc.co"
+FILTERS_CACHE_FILE = os.getenv("MEXC_FILTERS_CACHE", ".mexc_filters.json")
+FILTERS_TTL = 24 * 3600  # seconds; precisions rarely change
+RECV_WINDOW = 5000
+# Error codes MEXC answers with when the key or signature is rejected
+AUTH_ERROR_CODES = {10072, 700002, 700003, 700004}
+
+
+def format_value(val, prec):
+    return f"{Decimal(str(val)).quantize(Decimal('1e-' + str(prec)), rounding=ROUND_DOWN)}"
+
+
+def exchange_error(err):
+    """Returns the exchange's {'code', 'msg'} from a requests HTTPError, or {} if there is none."""
+    try:
+        return err.response.json()
+    except (AttributeError, ValueError):
+        return {}
+
+
+def is_oversold(err):
+    return "Oversold" in str(exchange_error(err).get('msg', ''))
+
+
+def is_auth_error(err):
+    return exchange_error(err).get('code') in AUTH_ERROR_CODES
+
+
+class MexcClient:
+    def __init__(self, api_key, api_secret, base_url=BASE_URL, filters_cache_file=FILTERS_CACHE_FILE):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.base_url = base_url
+        self.filters_cache_file = filters_cache_file
+        self.session = requests.Session()
+        # A few pooled keep-alive connections, so concurrent orders don't queue for one socket
+        self.session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        self.session.headers['X-MEXC-APIKEY'] = api_key
+        self.filters = {}
+        # position_monitor.py sells from several threads at once
+        self.filters_lock = threading.Lock()
+        self.balances = None
+        self.last_timings = {}
+
+    def warm_up(self):
+        """Opens the connection (TCP + TLS) ahead of the first order."""
+        self.session.get(f"{self.base_url}/api/v3/ping").raise_for_status()
+
+    def sign(self, params):
+        qs = urllib.parse.urlencode(params)
+        return hmac.new(self.api_secret.encode(), qs.encode(), hashlib.sha256).hexdigest()
+
+    def signed_request(self, method, endpoint, params):
+        started = time.time()
+        t0 = time.perf_counter()
+        params = dict(params, timestamp=int(time.time() * 1000), recvWindow=RECV_WINDOW)
+        params['signature'] = self.sign(params)
+        data = urllib.parse.urlencode(params)
+        t1 = time.perf_counter()
+        if method == 'POST':
+            r = self.session.post(f"{self.base_url}{endpoint}?{data}")
+        else:
+            r = self.session.get(f"{self.base_url}{endpoint}?{data}")
+        t2 = time.perf_counter()
+        ok = False
+        try:
+            r.raise_for_status()
+            resp = r.json()
+            ok = True
+            return resp
+        finally:
+            self.last_timings = {'sign': t1 - t0, 'send': t2 - t1, 'ack': time.perf_counter() - t2}
+            if tracing.enabled():
+                # "order send", "account send", ...
+                prefix, offset = endpoint.rsplit('/', 1)[-1], 0.0
+                for stage, secs in self.last_timings.items():
+                    tracing.record(f"{prefix} {stage}", secs, ok=ok or stage != 'ack', start=started + offset,
+                                   method=method, endpoint=endpoint, status=r.status_code)
+                    offset += secs
+
+    def format_timings(self):
+        return "Latency - " + ", ".join(f"{stage} {secs * 1000:.1f} ms" for stage, secs in self.last_timings.items())
+
+    def get_price(self, symbol):
+        r = self.session.get(f"{self.base_url}/api/v3/ticker/price", params={'symbol': symbol})
+        r.raise_for_status()
+        return Decimal(r.json()['price'])
+
+    def account(self, refresh=False):
+        """Returns {asset: free balance}, from one cached /api/v3/account snapshot."""
+        if self.balances is None or refresh:
+            resp = self.signed_request('GET', '/api/v3/account', {})
+            self.balances = {b['asset']: Decimal(b['free']) for b in resp.get('balances', [])}
+        return self.balances
+
+    def free_balance(self, asset, refresh=False):
+        # Only use free balance, not locked balance
+        return self.account(refresh).get(asset, Decimal('0'))
+
+    def _load_filters(self):
+        try:
+            with open(self.filters_cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if time.time() - cached.get('fetched_at', 0) > FILTERS_TTL or cached.get('base_url') != self.base_url:
+            return {}
+        return cached.get('symbols', {})
+
+    def symbol_filters(self, symbol):
+        """Returns {'base_asset', 'quote_asset', 'quantity_precision', 'quote_precision'} for symbol."""
+        if symbol in self.filters:
+            return self.filters[symbol]
+        with self.filters_lock:
+            if symbol not in self.filters:
+                self.filters.update(self._load_filters())
+            if symbol in self.filters:
+                return self.filters[symbol]
+            r = self.session.get(f"{self.base_url}/api/v3/exchangeInfo", params={'symbol': symbol})
+            r.raise_for_status()
+            info = next(s for s in r.json()['symbols'] if s['symbol'] == symbol)
+            self.filters[symbol] = {
+                'base_asset': info['baseAsset'],
+                'quote_asset': info['quoteAsset'],
+                'quantity_precision': int(info['baseAssetPrecision']),
+                'quote_precision': int(info.get('quoteAssetPrecision', info.get('quotePrecision', 2))),
+            }
+            try:
+                tmp_path = f"{self.filters_cache_file}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump({'fetched_at': time.time(), 'base_url': self.base_url, 'symbols': self.filters}, f)
+                os.replace(tmp_path, self.filters_cache_file)
+            except OSError:
+                pass
+        return self.filters[symbol]
+
+    def sellable_quantity(self, symbol, quantity=None):
+        """quantity (default: the whole free balance) rounded down to what the exchange accepts."""
+        filters = self.symbol_filters(symbol)
+        if quantity is None:
+            quantity = self.free_balance(filters['base_asset'])
+        return Decimal(format_value(quantity, filters['quantity_precision']))
+
+    def market_buy(self, symbol, quote_qty, quote_precision=2):
+        # Only use the cached rules here: fetching them would add a round trip to the buy
+        filters = self.filters.get(symbol) or self._load_filters().get(symbol) or {}
+        params = {
+            'symbol':        symbol,
+            'side':          'BUY',
+            'type':          'MARKET',
+            'quoteOrderQty': format_value(quote_qty, filters.get('quote_precision', quote_precision)),
+        }
+        resp = self.signed_request('POST', '/api/v3/order', params)
+        self.balances = None  # The fill changes them
+        return resp
+
+    def market_sell(self, symbol, quantity=None, min_quantity=None):
+        """Sells quantity (default: the whole free balance) of symbol's base asset at market.
+
+        Retries once, with a fresh balance snapshot, if the exchange still answers "Oversold".
+        Nothing is sent when the quantity rounds down below min_quantity (default: one step);
+        then ValueError is raised, or the "Oversold" error again for the retry.
+        """
+        filters = self.symbol_filters(symbol)
+        min_quantity = min_quantity or Decimal(1).scaleb(-filters['quantity_precision'])
+        qty = self.sellable_quantity(symbol, quantity)
+        if qty < min_quantity:
+            raise ValueError(f"Quantity {qty} is below the minimum of {min_quantity}")
+        params = {'symbol': symbol, 'side': 'SELL', 'type': 'MARKET', 'quantity': str(qty)}
+        try:
+            resp = self.signed_request('POST', '/api/v3/order', params)
+        except requests.exceptions.HTTPError as e:
+            if not is_oversold(e):
+                raise
+            free = self.free_balance(filters['base_asset'], refresh=True)
+            retry_qty = self.sellable_quantity(symbol, min(qty, free))
+            if retry_qty < min_quantity:
+                # The free balance is gone (e.g. already sold); a zero-quantity order would only be rejected
+                raise
+            params['quantity'] = str(retry_qty)
+            resp = self.signed_request('POST', '/api/v3/order', params)
+        self.balances = None
+        return resp
@@ -0,0 +1,216 @@
+"""Read-through local cache of daily_ohlcv rows, one Arrow IPC file per symbol.
+
+Each file holds every row of a symbol between `covered_from` and its `watermark`
+(the latest trade_date seen), so repeated analyses over overlapping ranges are
+served from a memory-mapped file. Only the missing head (dates before
+`covered_from`) and tail (dates after the watermark) are fetched from Postgres;
+dates after the watermark that were already queried (up to `checked_to`) are
+re-checked at most once per `refresh_interval` seconds, to pick up late ingests.
+get_many() plans those fetches for several symbols first and loads them all with
+one fetch_many() call.
+
+Requires pyarrow; constructing an OhlcvCache without it raises ImportError.
+"""
+import os
+import time
+import threading
+import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+DEFAULT_CACHE_DIR = ".ohlcv_cache"
+DEFAULT_REFRESH_INTERVAL = 300  # seconds between tail checks against the database
+
+COLUMNS = ['trade_date', 'open_price', 'high_price', 'low_price', 'close_price', 'volume']
+
+
+def _schema():
+    return pa.schema([
+        ('trade_date', pa.date32()),
+        ('open_price', pa.float64()),
+        ('high_price', pa.float64()),
+        ('low_price', pa.float64()),
+        ('close_price', pa.float64()),
+        ('volume', pa.int64()),
+    ])
+
+
+def _to_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class OhlcvCache:
+    """Caches fetch_rows(symbol, start_date, end_date) results on disk.
+
+    fetch_rows must return rows shaped like daily_ohlcv query results
+    (trade_date, open, high, low, close, volume), or None on error. The optional
+    fetch_many(symbols, start_date, end_date) returns {symbol: rows} the same way.
+    """
+
+    def __init__(self, fetch_rows, cache_dir=DEFAULT_CACHE_DIR, refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 fetch_many=None):
+        if pa is None:
+            raise ImportError("pyarrow is required for the OHLCV cache (pip install pyarrow)")
+        self.fetch_rows = fetch_rows
+        self.fetch_many = fetch_many
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self.hits = 0
+        self.misses = 0
+        self.rows_fetched = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, symbol):
+        return os.path.join(self.cache_dir, f"{symbol}.arrow")
+
+    def _load(self, symbol):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None, None
+        with pa.memory_map(path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+        return table, meta
+
+    def _load_meta(self, symbol):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        with pa.memory_map(path, 'r') as source:
+            metadata = pa.ipc.open_file(source).schema.metadata
+        return {k.decode(): v.decode() for k, v in (metadata or {}).items()}
+
+    def _missing(self, meta, start, end, now):
+        """The (first, last) date ranges get() has to fetch for [start, end], given the file's meta."""
+        if meta is None:
+            return [(start, end)]
+        ranges = []
+        covered_from = _to_date(meta['covered_from'])
+        watermark = _to_date(meta['watermark']) if meta.get('watermark') else None
+        tail_from = watermark + datetime.timedelta(days=1) if watermark else covered_from
+        checked_to = _to_date(meta['checked_to'])
+        stale = now - float(meta['checked_at']) > self.refresh_interval
+        if start < covered_from:
+            ranges.append((start, covered_from - datetime.timedelta(days=1)))
+        if end >= tail_from and (end > checked_to or stale):
+            ranges.append((tail_from, max(end, checked_to)))
+        return ranges
+
+    def _save(self, symbol, table, meta):
+        table = table.replace_schema_metadata({k: str(v) for k, v in meta.items()})
+        path = self._path(symbol)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # Write-then-rename so concurrent readers never see a half-written file
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def _fetch(self, symbol, start, end, prefetched=None):
+        if prefetched is not None and prefetched[1] <= start and end <= prefetched[2]:
+            rows = [row for row in prefetched[0] if start <= row[0] <= end]
+        else:
+            rows = self.fetch_rows(symbol, start.isoformat(), end.isoformat())
+        if rows is None:
+            return None
+        self.rows_fetched += len(rows)
+        columns = list(zip(*rows)) if rows else [[] for _ in COLUMNS]
+        return pa.table({
+            'trade_date': pa.array(columns[0], pa.date32()),
+            'open_price': pa.array([float(v) for v in columns[1]], pa.float64()),
+            'high_price': pa.array([float(v) for v in columns[2]], pa.float64()),
+            'low_price': pa.array([float(v) for v in columns[3]], pa.float64()),
+            'close_price': pa.array([float(v) for v in columns[4]], pa.float64()),
+            'volume': pa.array([int(v) for v in columns[5]], pa.int64()),
+        }, schema=_schema())
+
+    def get(self, symbol, start_date, end_date, prefetched=None):
+        """Returns rows for symbol in [start_date, end_date], fetching only what the cache lacks.
+
+        prefetched is (rows, first date, last date) already loaded for symbol (see
+        get_many()); needed ranges inside it are taken from there. Returns None if a
+        needed database fetch failed.
+        """
+        start, end = _to_date(start_date), _to_date(end_date)
+        table, meta = self._load(symbol)
+        now = time.time()
+
+        if table is None:
+            table = self._fetch(symbol, start, end, prefetched)
+            if table is None:
+                return None
+            meta = {'covered_from': start.isoformat(), 'checked_to': end.isoformat(), 'checked_at': now}
+            parts = None
+        else:
+            covered_from = _to_date(meta['covered_from'])
+            parts = [table]
+            for first, last in self._missing(meta, start, end, now):
+                fetched = self._fetch(symbol, first, last, prefetched)
+                if fetched is None:
+                    return None
+                if first < covered_from:
+                    parts.insert(0, fetched)
+                    meta['covered_from'] = start.isoformat()
+                else:
+                    parts.append(fetched)
+                    meta['checked_to'] = last.isoformat()
+                    meta['checked_at'] = now
+
+        if parts is not None and len(parts) == 1:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if parts:
+                table = pa.concat_tables(parts)
+            if table.num_rows:
+                meta['watermark'] = pc.max(table['trade_date']).as_py().isoformat()
+            self._save(symbol, table, meta)
+
+        mask = pc.and_(pc.greater_equal(table['trade_date'], pa.scalar(start, pa.date32())),
+                       pc.less_equal(table['trade_date'], pa.scalar(end, pa.date32())))
+        selected = table.filter(mask)
+        return list(zip(*(selected[name].to_pylist() for name in COLUMNS)))
+
+    def get_many(self, symbols, start_date, end_date):
+        """Returns {symbol: rows} like get() for each symbol, or None if a database fetch failed.
+
+        What the symbols' files lack is loaded with a single fetch_many() call over the
+        span of every missing range (each symbol's own fetch_rows() without fetch_many).
+        """
+        start, end = _to_date(start_date), _to_date(end_date)
+        now = time.time()
+        missing = {}
+        for symbol in symbols:
+            ranges = self._missing(self._load_meta(symbol), start, end, now)
+            if ranges:
+                missing[symbol] = ranges
+        prefetched = {}
+        if missing and self.fetch_many:
+            first = min(r[0] for ranges in missing.values() for r in ranges)
+            last = max(r[1] for ranges in missing.values() for r in ranges)
+            series = self.fetch_many(list(missing), first.isoformat(), last.isoformat())
+            if series is None:
+                return None
+            prefetched = {symbol: (series.get(symbol, []), first, last) for symbol in missing}
+        results = {}
+        for symbol in symbols:
+            rows = self.get(symbol, start, end, prefetched.get(symbol))
+            if rows is None:
+                return None
+            results[symbol] = rows
+        return results
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'rows_fetched': self.rows_fetched,
+        }
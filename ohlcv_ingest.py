@@ -0,0 +1,209 @@
+"""Shared ingest helpers for the daily_ohlcv table.
+
+Used by vantage_extract.py and kraken_csv_extract.py. Nothing here touches the
+database at import time; every function takes (or opens) its own connection, and
+psycopg2 is only imported once one is needed.
+"""
+import io
+import os
+import csv
+import itertools
+from dotenv import load_dotenv
+
+import tracing
+
+# Load environment variables
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+DEFAULT_PAGE_SIZE = 1000
+BAR_COLUMNS = ['trade_date', 'open_price', 'high_price', 'low_price', 'close_price', 'volume']
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS daily_ohlcv (
+    symbol      TEXT        NOT NULL,
+    trade_date  DATE        NOT NULL,
+    open_price  NUMERIC(12,4) NOT NULL,
+    high_price  NUMERIC(12,4) NOT NULL,
+    low_price   NUMERIC(12,4) NOT NULL,
+    close_price NUMERIC(12,4) NOT NULL,
+    volume      BIGINT      NOT NULL,
+    PRIMARY KEY (symbol, trade_date)
+);
+"""
+
+UPSERT_VALUES_SQL = """
+INSERT INTO daily_ohlcv
+  (symbol, trade_date, open_price, high_price, low_price, close_price, volume)
+VALUES %s
+ON CONFLICT (symbol, trade_date) DO UPDATE
+  SET open_price  = EXCLUDED.open_price,
+      high_price  = EXCLUDED.high_price,
+      low_price   = EXCLUDED.low_price,
+      close_price = EXCLUDED.close_price,
+      volume      = EXCLUDED.volume;
+"""
+
+# The staging table lives only for the current transaction
+STAGING_SQL = """
+CREATE TEMP TABLE daily_ohlcv_staging
+  (LIKE daily_ohlcv INCLUDING DEFAULTS)
+  ON COMMIT DROP;
+"""
+
+COPY_SQL = """
+COPY daily_ohlcv_staging
+  (symbol, trade_date, open_price, high_price, low_price, close_price, volume)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+# DISTINCT ON guards against duplicate dates in the input, which would otherwise make
+# ON CONFLICT DO UPDATE touch the same row twice and abort the whole merge
+MERGE_SQL = """
+INSERT INTO daily_ohlcv
+  (symbol, trade_date, open_price, high_price, low_price, close_price, volume)
+SELECT DISTINCT ON (symbol, trade_date)
+  symbol, trade_date, open_price, high_price, low_price, close_price, volume
+FROM daily_ohlcv_staging
+ORDER BY symbol, trade_date
+ON CONFLICT (symbol, trade_date) DO UPDATE
+  SET open_price  = EXCLUDED.open_price,
+      high_price  = EXCLUDED.high_price,
+      low_price   = EXCLUDED.low_price,
+      close_price = EXCLUDED.close_price,
+      volume      = EXCLUDED.volume;
+"""
+
+
+def connect(db_url=None):
+    """Opens a connection to the database (DATABASE_URL unless db_url is given)."""
+    db_url = db_url or DATABASE_URL
+    if not db_url:
+        raise RuntimeError("Please set DATABASE_URL in your .env")
+    import psycopg2
+
+    print(f"Connecting to database...")
+    with tracing.span("db connect"):
+        conn = psycopg2.connect(db_url)
+    print("✅ Connected to database.")
+    return conn
+
+
+def ensure_table(conn):
+    """Creates the daily_ohlcv table if it doesn't exist yet."""
+    print("Ensuring 'daily_ohlcv' table exists...")
+    with conn.cursor() as cur:
+        cur.execute(CREATE_TABLE_SQL)
+    conn.commit()
+    print("✅ Table 'daily_ohlcv' is ready.")
+
+
+def latest_trade_date(conn, symbol):
+    """Returns the most recent trade_date stored for symbol, or None."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(trade_date) FROM daily_ohlcv WHERE symbol = %s", (symbol,))
+        return cur.fetchone()[0]
+
+
+def latest_trade_dates(conn, symbols):
+    """Returns {symbol: most recent trade_date} for the symbols that have data, in one query."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT symbol, MAX(trade_date) FROM daily_ohlcv WHERE symbol = ANY(%s) GROUP BY symbol",
+            (list(symbols),)
+        )
+        return dict(cur.fetchall())
+
+
+def _as_list(values):
+    """Converts a column (list, NumPy array or pandas Series) to a list of plain Python values."""
+    if hasattr(values, 'to_numpy'):
+        values = values.to_numpy()
+    if hasattr(values, 'dtype'):
+        if values.dtype.kind == 'M':
+            # datetime64[ns].tolist() yields ints, day precision yields datetime.date
+            values = values.astype('datetime64[D]')
+        # tolist() also turns NumPy scalars into types psycopg2 can adapt
+        return values.tolist()
+    return list(values)
+
+
+def bar_columns(bars):
+    """Returns the BAR_COLUMNS of a columnar input (DataFrame, dict of arrays, structured array)."""
+    columns = [_as_list(bars[name]) for name in BAR_COLUMNS]
+    lengths = {len(col) for col in columns}
+    if len(lengths) > 1:
+        raise ValueError(f"Bar columns have different lengths: {sorted(lengths)}")
+    return columns
+
+
+def _bar_rows(symbol, columns):
+    n = len(columns[0])
+    return list(zip(itertools.repeat(symbol, n), *columns))
+
+
+def upsert_bars(symbol, bars, conn=None, page_size=DEFAULT_PAGE_SIZE):
+    """Upserts columnar bars for symbol with execute_values, page_size rows per statement.
+
+    bars is anything indexable by the BAR_COLUMNS names: a DataFrame, a dict of lists or
+    NumPy arrays, or a NumPy structured array. Dates must be unique within bars.
+    Opens (and closes) its own connection when conn is None. Returns the row count.
+    """
+    from psycopg2.extras import execute_values
+
+    rows = _bar_rows(symbol, bar_columns(bars))
+    if not rows:
+        return 0
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect()
+    try:
+        with conn.cursor() as cur, tracing.span("db upsert", symbol=symbol, rows=len(rows)):
+            execute_values(cur, UPSERT_VALUES_SQL, rows, page_size=page_size)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+            print("✅ Database connection closed.")
+    print(f"    Upserted {len(rows)} rows in pages of {page_size}.")
+    return len(rows)
+
+
+def copy_bars(symbol, bars, conn=None):
+    """Streams bars into a temporary staging table with COPY, then merges them in one statement.
+
+    Accepts the same inputs as upsert_bars. Returns the number of merged rows.
+    """
+    rows = _bar_rows(symbol, bar_columns(bars))
+    if not rows:
+        return 0
+
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect()
+    try:
+        with conn.cursor() as cur, tracing.span("db copy", symbol=symbol, rows=len(rows)):
+            cur.execute(STAGING_SQL)
+            cur.copy_expert(COPY_SQL, buf)
+            print(f"    Copied {len(rows)} rows into staging table.")
+            cur.execute(MERGE_SQL)
+            row_count = cur.rowcount
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+            print("✅ Database connection closed.")
+    print(f"    Merged staging table. Total: {row_count}")
+    return row_count
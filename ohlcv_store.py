@@ -0,0 +1,303 @@
+"""Multi-timeframe OHLCV storage: minute and hour bars, daily_ohlcv, and weekly/monthly rollups.
+
+TIMEFRAMES, finest first, each in its own table keyed by (symbol, <time column>):
+
+    1m   ohlcv_1m       bar_start TIMESTAMPTZ    ingested (e.g. Kraken trades)
+    1h   ohlcv_1h       bar_start TIMESTAMPTZ    ingested, or rolled up from 1m
+    1d   daily_ohlcv    trade_date DATE          ingested as before, or rolled up from 1h
+    1w   weekly_ohlcv   period_start DATE        rolled up from daily_ohlcv (weeks start on Monday)
+    1mo  monthly_ohlcv  period_start DATE        rolled up from daily_ohlcv
+
+Rollup tables are maintained incrementally: refresh_rollups(conn, symbol, source, since)
+rebuilds only the coarser bars whose period contains data from `since` on, so an
+ingest costs time proportional to the new data rather than the history. A rollup
+that is empty or behind its source is rebuilt in full instead. Intraday days are
+UTC days.
+
+fetch_bars() reads one timeframe; pick_timeframe() chooses the finest timeframe a
+range fits in max_bars at, out of those available_timeframes() finds reaching back to
+its start, so long ranges read a few hundred rollup rows instead of every daily (or
+minute) row. Minute/hour tables carry BRIN indexes on bar_start for
+cross-symbol time-range scans, and every key index covers the OHLCV columns so range
+reads are index-only scans.
+
+Like ohlcv_ingest.py, nothing here touches the database at import time.
+"""
+import io
+import csv
+import datetime
+
+import numpy as np
+
+import ohlcv_ingest
+import tracing
+
+TIMEFRAMES = ['1m', '1h', '1d', '1w', '1mo']
+# Approximate bar lengths, for estimating how many bars a range needs
+BAR_SECONDS = {'1m': 60, '1h': 3600, '1d': 86400, '1w': 7 * 86400, '1mo': 30.44 * 86400}
+TABLES = {
+    '1m': ('ohlcv_1m', 'bar_start'),
+    '1h': ('ohlcv_1h', 'bar_start'),
+    '1d': ('daily_ohlcv', 'trade_date'),
+    '1w': ('weekly_ohlcv', 'period_start'),
+    '1mo': ('monthly_ohlcv', 'period_start'),
+}
+# source timeframe -> [(target timeframe, SQL expression for a source row's target period)]
+ROLLUPS = {
+    '1m': [('1h', "date_trunc('hour', bar_start)")],
+    '1h': [('1d', "date_trunc('day', bar_start)::date")],
+    '1d': [('1w', "date_trunc('week', trade_date)::date"), ('1mo', "date_trunc('month', trade_date)::date")],
+}
+# SQL expression for the start of the timeframe's period containing a parameter
+PERIOD_START = {
+    '1m': "date_trunc('minute', {}::timestamptz)",
+    '1h': "date_trunc('hour', {}::timestamptz)",
+    '1d': "{}::date",
+    '1w': "date_trunc('week', {}::date)::date",
+    '1mo': "date_trunc('month', {}::date)::date",
+}
+
+PRICE_COLUMNS = ['open_price', 'high_price', 'low_price', 'close_price', 'volume']
+
+INTRADAY_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    symbol      TEXT             NOT NULL,
+    bar_start   TIMESTAMPTZ      NOT NULL,
+    open_price  DOUBLE PRECISION NOT NULL,
+    high_price  DOUBLE PRECISION NOT NULL,
+    low_price   DOUBLE PRECISION NOT NULL,
+    close_price DOUBLE PRECISION NOT NULL,
+    volume      DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (symbol, bar_start) INCLUDE (open_price, high_price, low_price, close_price, volume)
+);
+CREATE INDEX IF NOT EXISTS {table}_bar_start_brin ON {table} USING brin (bar_start) WITH (pages_per_range = 32);
+"""
+
+# Same column types as daily_ohlcv, which they are rolled up from
+ROLLUP_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    symbol       TEXT          NOT NULL,
+    period_start DATE          NOT NULL,
+    open_price   NUMERIC(12,4) NOT NULL,
+    high_price   NUMERIC(12,4) NOT NULL,
+    low_price    NUMERIC(12,4) NOT NULL,
+    close_price  NUMERIC(12,4) NOT NULL,
+    volume       BIGINT        NOT NULL,
+    PRIMARY KEY (symbol, period_start) INCLUDE (open_price, high_price, low_price, close_price, volume)
+);
+"""
+
+DAILY_COVERING_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS daily_ohlcv_covering
+  ON daily_ohlcv (symbol, trade_date) INCLUDE (open_price, high_price, low_price, close_price, volume);
+"""
+
+ROLLUP_SQL = """
+INSERT INTO {target} (symbol, {target_col}, open_price, high_price, low_price, close_price, volume)
+SELECT symbol, {period} AS period,
+       (array_agg(open_price ORDER BY {source_col}))[1],
+       MAX(high_price),
+       MIN(low_price),
+       (array_agg(close_price ORDER BY {source_col} DESC))[1],
+       SUM(volume)
+FROM {source}
+WHERE symbol = %(symbol)s AND {source_col} >= {since}
+GROUP BY symbol, period
+ON CONFLICT (symbol, {target_col}) DO UPDATE
+  SET open_price  = EXCLUDED.open_price,
+      high_price  = EXCLUDED.high_price,
+      low_price   = EXCLUDED.low_price,
+      close_price = EXCLUDED.close_price,
+      volume      = EXCLUDED.volume;
+"""
+
+# True when the target is missing periods the source has at either end, e.g. daily history
+# ingested before the weekly/monthly tables existed
+ROLLUP_BEHIND_SQL = """
+SELECT t.first_period IS NULL OR t.first_period > s.first_period OR t.last_period < s.last_period
+FROM (SELECT MIN({target_col}) AS first_period, MAX({target_col}) AS last_period
+      FROM {target} WHERE symbol = %(symbol)s) t,
+     (SELECT {first} AS first_period, {last} AS last_period
+      FROM (SELECT MIN({source_col}) AS lo, MAX({source_col}) AS hi
+            FROM {source} WHERE symbol = %(symbol)s) bounds) s;
+"""
+
+INTRADAY_STAGING_SQL = """
+CREATE TEMP TABLE {table}_staging (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;
+"""
+
+INTRADAY_MERGE_SQL = """
+INSERT INTO {table} (symbol, bar_start, open_price, high_price, low_price, close_price, volume)
+SELECT DISTINCT ON (symbol, bar_start)
+  symbol, bar_start, open_price, high_price, low_price, close_price, volume
+FROM {table}_staging
+ORDER BY symbol, bar_start
+ON CONFLICT (symbol, bar_start) DO UPDATE
+  SET open_price  = EXCLUDED.open_price,
+      high_price  = EXCLUDED.high_price,
+      low_price   = EXCLUDED.low_price,
+      close_price = EXCLUDED.close_price,
+      volume      = EXCLUDED.volume;
+"""
+
+
+def ensure_tables(conn):
+    """Creates daily_ohlcv and the intraday and rollup tables and indexes that don't exist yet."""
+    ohlcv_ingest.ensure_table(conn)
+    with conn.cursor() as cur:
+        for timeframe in ('1m', '1h'):
+            cur.execute(INTRADAY_TABLE_SQL.format(table=TABLES[timeframe][0]))
+        for timeframe in ('1w', '1mo'):
+            cur.execute(ROLLUP_TABLE_SQL.format(table=TABLES[timeframe][0]))
+        cur.execute(DAILY_COVERING_INDEX_SQL)
+    conn.commit()
+
+
+def copy_intraday(conn, symbol, timeframe, bars):
+    """Merges minute or hour bars (dict of arrays: bar_start as datetime64 or epoch seconds, *_price, volume).
+
+    COPY into a staging table, then one INSERT ... ON CONFLICT. Returns the merged row count.
+    """
+    table, _ = TABLES[timeframe]
+    starts = np.asarray(bars['bar_start'])
+    if starts.dtype.kind != 'M':
+        starts = starts.astype('int64').astype('datetime64[s]')
+    if not len(starts):
+        return 0
+    buf = io.StringIO()
+    csv.writer(buf).writerows(zip(
+        [symbol] * len(starts),
+        np.datetime_as_string(starts.astype('datetime64[s]'), timezone='UTC'),
+        *(np.asarray(bars[col]).tolist() for col in PRICE_COLUMNS)))
+    buf.seek(0)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(INTRADAY_STAGING_SQL.format(table=table))
+            cur.copy_expert(f"COPY {table}_staging (symbol, bar_start, {', '.join(PRICE_COLUMNS)}) "
+                            "FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute(INTRADAY_MERGE_SQL.format(table=table))
+            row_count = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row_count
+
+
+def latest_bar(conn, symbol, timeframe):
+    """Returns the start of symbol's most recent bar in timeframe (datetime or date), or None."""
+    table, col = TABLES[timeframe]
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT MAX({col}) FROM {table} WHERE symbol = %s", (symbol,))
+        return cur.fetchone()[0]
+
+
+def refresh_rollups(conn, symbol, source='1d', since=None):
+    """Rebuilds the rollups downstream of `source` for periods containing source bars from `since` on.
+
+    With since=None every period is rebuilt. A rollup that is empty or lacks periods its
+    source has is rebuilt in full whatever `since`, which backfills history ingested
+    before the rollup tables existed. Returns {timeframe: rows written}.
+    """
+    written = {}
+    pending = [source]
+    with conn.cursor() as cur, tracing.span("db rollup", symbol=symbol, source=source):
+        # Intraday periods are UTC days/hours, whatever the server's time zone
+        cur.execute("SET LOCAL TIME ZONE 'UTC'")
+        while pending:
+            source_tf = pending.pop(0)
+            source_table, source_col = TABLES[source_tf]
+            for target_tf, period in ROLLUPS.get(source_tf, []):
+                target_table, target_col = TABLES[target_tf]
+                target_since = since
+                if since is not None:
+                    cur.execute(ROLLUP_BEHIND_SQL.format(
+                        target=target_table, target_col=target_col, source=source_table, source_col=source_col,
+                        first=PERIOD_START[target_tf].format('lo'), last=PERIOD_START[target_tf].format('hi')),
+                        {'symbol': symbol})
+                    if cur.fetchone()[0]:
+                        target_since = None
+                if target_since is None:
+                    since_sql = "'-infinity'"
+                else:
+                    # Whole target periods: the first period touched is rebuilt from its start
+                    since_sql = PERIOD_START[target_tf].format('%(since)s')
+                cur.execute(ROLLUP_SQL.format(target=target_table, target_col=target_col, period=period,
+                                              source=source_table, source_col=source_col, since=since_sql),
+                            {'symbol': symbol, 'since': target_since})
+                written[target_tf] = cur.rowcount
+                pending.append(target_tf)
+    conn.commit()
+    return written
+
+
+def period_start(timeframe, day):
+    """Start of the timeframe's period containing day (a date); days stand in for intraday bars."""
+    if timeframe == '1w':
+        return day - datetime.timedelta(days=day.weekday())
+    if timeframe == '1mo':
+        return day.replace(day=1)
+    return day
+
+
+def available_timeframes(conn, symbol, start=None):
+    """Returns the timeframes whose bars for symbol reach back to start, finest first.
+
+    A timeframe counts when its first bar is no later than the period containing start,
+    or containing the symbol's first minute/hour/daily bar if that is later. Missing
+    tables count as empty.
+    """
+    first_days = {}
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL TIME ZONE 'UTC'")
+        for timeframe in TIMEFRAMES:
+            table, col = TABLES[timeframe]
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+            if not cur.fetchone()[0]:
+                continue
+            cur.execute(f"SELECT MIN({col})::date FROM {table} WHERE symbol = %s", (symbol,))
+            first_day = cur.fetchone()[0]
+            if first_day is not None:
+                first_days[timeframe] = first_day
+    conn.commit()
+    if not first_days:
+        return []
+    # Weekly/monthly bars start on their period's first day, before the first daily bar they hold
+    ingested = [day for tf, day in first_days.items() if tf not in ('1w', '1mo')]
+    reference = min(ingested or first_days.values())
+    if start is not None:
+        reference = max(reference, np.datetime64(start, 'D').astype(object))
+    return [tf for tf in TIMEFRAMES if tf in first_days and first_days[tf] <= period_start(tf, reference)]
+
+
+def pick_timeframe(start, end, max_bars, available=TIMEFRAMES):
+    """The finest available timeframe covering start..end (dates or datetimes) in at most max_bars bars.
+
+    Falls back to the coarsest available timeframe when none fits.
+    """
+    span = (np.datetime64(end, 's') - np.datetime64(start, 's')).astype('int64') + 86400
+    candidates = [tf for tf in TIMEFRAMES if tf in available]
+    for timeframe in candidates:
+        if span / BAR_SECONDS[timeframe] <= max_bars:
+            return timeframe
+    return candidates[-1]
+
+
+def fetch_bars(conn, symbol, start, end, timeframe='1d'):
+    """Returns [(period start, open, high, low, close, volume)] for symbol in timeframe.
+
+    Includes the bar whose period contains start. Rows are shaped like daily_ohlcv query
+    results, so the analysis code can use any timeframe.
+    """
+    table, col = TABLES[timeframe]
+    end_sql = "%(end)s::date + 1" if timeframe in ('1m', '1h') else "%(end)s::date"
+    op = '<' if timeframe in ('1m', '1h') else '<='
+    query = (f"SELECT {col}, {', '.join(PRICE_COLUMNS)} FROM {table} "
+             f"WHERE symbol = %(symbol)s AND {col} >= {PERIOD_START[timeframe].format('%(start)s')} "
+             f"AND {col} {op} {end_sql} ORDER BY {col} ASC")
+    with conn.cursor() as cur, tracing.span("db query", symbol=symbol, timeframe=timeframe):
+        cur.execute("SET LOCAL TIME ZONE 'UTC'")
+        cur.execute(query, {'symbol': symbol, 'start': start, 'end': end})
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
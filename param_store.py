@@ -0,0 +1,108 @@
+"""Versioned Take Profit / Stop Loss parameters shared between processes, in SQLite.
+
+ai_agent_trade.py stores each run's parameters under a key (the n8n execution id)
+and under DEFAULT_KEY; mexc_check_balance_and_sell.py and position_monitor.py read
+them. In WAL mode a write is atomic - readers see the old row or the new one, never
+a half-written file - and readers don't block the writer or each other. Every put()
+bumps the key's version, so concurrent analyses update their own keys instead of
+overwriting one file.
+
+Readers poll cheaply: PRAGMA data_version only changes after another connection
+commits, so changed() doesn't touch the table, and nothing is re-read until
+something was actually written.
+"""
+import os
+import json
+import time
+import sqlite3
+
+DEFAULT_DB = os.getenv("PARAM_STORE_DB", "ai_agent_params.db")
+DEFAULT_KEY = "latest"
+BUSY_TIMEOUT = 5.0  # seconds a writer waits for another writer's lock
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS params (
+    key         TEXT PRIMARY KEY,
+    version     INTEGER NOT NULL,
+    take_profit REAL NOT NULL,
+    stop_loss   REAL NOT NULL,
+    buy         TEXT NOT NULL,
+    updated_at  REAL NOT NULL
+);
+"""
+
+UPSERT_SQL = """
+INSERT INTO params (key, version, take_profit, stop_loss, buy, updated_at)
+VALUES (?, 1, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    version     = params.version + 1,
+    take_profit = excluded.take_profit,
+    stop_loss   = excluded.stop_loss,
+    buy         = excluded.buy,
+    updated_at  = excluded.updated_at;
+"""
+
+
+def export_json(data, path):
+    """Writes data to path via a temporary file and a rename, so readers never see it half-written."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+class ParamStore:
+    def __init__(self, path=DEFAULT_DB, timeout=BUSY_TIMEOUT):
+        self.path = path
+        # Autocommit; writes open their own transaction
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(SCHEMA)
+        self.data_version = None
+
+    def put(self, key, take_profit, stop_loss, buy="no"):
+        """Stores the parameters under key; returns the key's new version."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(UPSERT_SQL, (key, float(take_profit), float(stop_loss), buy, time.time()))
+            version = self.conn.execute("SELECT version FROM params WHERE key = ?", (key,)).fetchone()[0]
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return version
+
+    def get(self, key):
+        """Returns {'take_profit', 'stop_loss', 'buy', 'version', 'updated_at'} for key, or None."""
+        row = self.conn.execute(
+            "SELECT take_profit, stop_loss, buy, version, updated_at FROM params WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('take_profit', 'stop_loss', 'buy', 'version', 'updated_at'), row))
+
+    def get_many(self, keys):
+        """Returns {key: row} (see get()) for the keys that exist, in one query."""
+        keys = list(keys)
+        rows = {}
+        # Stay well under SQLite's limit on bound parameters per statement
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            for key, *row in self.conn.execute(
+                    "SELECT key, take_profit, stop_loss, buy, version, updated_at FROM params "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})", chunk):
+                rows[key] = dict(zip(('take_profit', 'stop_loss', 'buy', 'version', 'updated_at'), row))
+        return rows
+
+    def changed(self):
+        """True if another connection committed since the last call (and on the first call)."""
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        changed = data_version != self.data_version
+        self.data_version = data_version
+        return changed
+
+    def close(self):
+        self.conn.close()
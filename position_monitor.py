@@ -0,0 +1,420 @@
+"""One asyncio process watching every open position's Take Profit and Stop Loss.
+
+Replaces one blocking mexc_check_balance_and_sell.py process per buy. Positions
+(symbol, quantity, take_profit, stop_loss) are kept in memory, indexed per symbol by
+two heaps - take-profits lowest first and stop-losses highest first - so a price
+update only touches the positions it actually triggers. Prices for all watched
+symbols come from a single call to the all-symbols ticker per poll. Positions are
+handed over through a local HTTP API, so n8n gets its answer immediately:
+
+    POST   /positions       {"symbol": "WBTCUSDT", "take_profit": 70000, "stop_loss": 60000, "quantity": "0.001"}
+                            -> {"id", "symbol", "quantity", "take_profit", "stop_loss"}
+    POST   /positions       {"symbol": "WBTCUSDT", "param_key": "<run id>"}
+    GET    /positions       -> {"positions": [...]}
+    DELETE /positions/<id>
+    GET    /health          -> {"status": "ok", "positions", "polls", "orders_placed", ...}
+
+Without a quantity, the free balance of the symbol's base asset (minus what other
+positions on it already hold) is used, like mexc_check_balance_and_sell.py does.
+A position opened with a "param_key" (the run id ai_agent_trade.py stored its
+parameters under) takes missing levels from the parameter store and follows later
+versions of that key, checked once per poll. A position whose sell fails is
+watched again after a cooldown that doubles with each further failure. Open
+positions are saved to POSITIONS_FILE and reloaded on start.
+"""
+import os
+import json
+import time
+import uuid
+import heapq
+import asyncio
+import argparse
+import requests
+from decimal import Decimal, InvalidOperation
+
+import tracing
+import mexc_check_balance_and_sell as mexc
+from json_http import handle_request, parse_json
+from param_store import ParamStore, DEFAULT_DB as DEFAULT_PARAM_STORE
+
+HOST = os.getenv("POSITION_MONITOR_HOST", "127.0.0.1")
+PORT = int(os.getenv("POSITION_MONITOR_PORT", "8766"))
+POSITIONS_FILE = os.getenv("POSITIONS_FILE", "open_positions.json")
+POLL_INTERVAL = 2           # seconds between all-symbols ticker calls
+MAX_CONCURRENT_ORDERS = 4
+QUOTE_ASSETS = ("USDT", "USDC", "BTC", "ETH")
+
+
+def base_asset(symbol):
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)]
+    raise ValueError(f"Can't tell the base asset of {symbol}")
+
+
+def get_all_prices():
+    """Returns {symbol: Decimal price} for every symbol on the exchange, in one request."""
+    r = mexc.client.session.get(f"{mexc.client.base_url}/api/v3/ticker/price")
+    r.raise_for_status()
+    return {t['symbol']: Decimal(t['price']) for t in r.json()}
+
+
+def get_free_balance(asset):
+    return mexc.client.free_balance(asset, refresh=True)
+
+
+def place_market_sell(symbol, quantity):
+    # Rounded down to the symbol's step size by the client, no fee haircut needed
+    return mexc.client.market_sell(symbol, quantity, mexc.MIN_BALANCE)
+
+
+class PositionBook:
+    """Open positions indexed for fast trigger checks.
+
+    Removed positions, and entries for levels a position has since moved away from,
+    are dropped from the heaps lazily, when they reach the top.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.open_per_symbol = {}
+        self.take_profits = {}  # symbol -> heap of (take_profit, id)
+        self.stop_losses = {}   # symbol -> heap of (-stop_loss, id)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, position):
+        self.positions[position['id']] = position
+        self.open_per_symbol[position['symbol']] = self.open_per_symbol.get(position['symbol'], 0) + 1
+        heapq.heappush(self.take_profits.setdefault(position['symbol'], []),
+                       (position['take_profit'], position['id']))
+        heapq.heappush(self.stop_losses.setdefault(position['symbol'], []),
+                       (-position['stop_loss'], position['id']))
+
+    def move(self, position_id, take_profit, stop_loss):
+        """Gives an open position new levels; its old heap entries go stale."""
+        position = self.positions[position_id]
+        position['take_profit'], position['stop_loss'] = take_profit, stop_loss
+        heapq.heappush(self.take_profits[position['symbol']], (take_profit, position_id))
+        heapq.heappush(self.stop_losses[position['symbol']], (-stop_loss, position_id))
+
+    def remove(self, position_id):
+        position = self.positions.pop(position_id, None)
+        if position is not None:
+            symbol = position['symbol']
+            self.open_per_symbol[symbol] -= 1
+            if not self.open_per_symbol[symbol]:
+                del self.open_per_symbol[symbol], self.take_profits[symbol], self.stop_losses[symbol]
+        return position
+
+    def symbols(self):
+        return list(self.open_per_symbol)
+
+    def held(self, symbol):
+        return sum((p['quantity'] for p in self.positions.values() if p['symbol'] == symbol), Decimal('0'))
+
+    def _pop_while(self, heap, level, crossed):
+        hits = []
+        while heap:
+            value, position_id = heap[0]
+            position = self.positions.get(position_id)
+            stale = position is None or position[level] != abs(value)
+            if not stale and not crossed(value):
+                break
+            heapq.heappop(heap)
+            if not stale:
+                hits.append(self.remove(position_id))
+        return hits
+
+    def triggered(self, symbol, price):
+        """Removes and returns [(position, 'take_profit'|'stop_loss')] triggered by price."""
+        hits = [(p, 'take_profit') for p in
+                self._pop_while(self.take_profits.get(symbol, []), 'take_profit', lambda tp: tp <= price)]
+        # All of the symbol's positions may be gone (and its heaps deleted) by now
+        hits += [(p, 'stop_loss') for p in
+                 self._pop_while(self.stop_losses.get(symbol, []), 'stop_loss', lambda neg_sl: -neg_sl >= price)]
+        return hits
+
+
+def _to_json(position):
+    return {k: str(v) if isinstance(v, Decimal) else v for k, v in position.items()}
+
+
+def _from_json(data):
+    position = dict(data)
+    for key in ('quantity', 'take_profit', 'stop_loss'):
+        position[key] = Decimal(str(data[key]))
+    return position
+
+
+class PositionMonitor:
+    """Polls prices for every open position and market-sells the ones that hit TP or SL."""
+
+    def __init__(self, poll_interval=POLL_INTERVAL, positions_file=POSITIONS_FILE,
+                 max_concurrent_orders=MAX_CONCURRENT_ORDERS, param_store=None):
+        self.poll_interval = poll_interval
+        self.positions_file = positions_file
+        self.param_store = param_store
+        self.book = PositionBook()
+        self.order_slots = asyncio.Semaphore(max_concurrent_orders)
+        # Serializes balance lookups so two quantity-less positions can't claim the same coins
+        self.add_lock = asyncio.Lock()
+        self.orders = set()
+        self.selling = {}       # id -> position whose sell order is in flight
+        self.cooling = {}       # id -> (position, monotonic time it's watched again) after a failed sell
+        self.retry_delays = {}  # id -> cooldown after the position's last failed sell
+        self.dirty = False
+        self.polls = 0
+        self.orders_placed = 0
+        self.orders_failed = 0
+        self.levels_updated = 0
+        self.last_poll_seconds = 0.0
+
+    def load(self):
+        if not self.positions_file or not os.path.exists(self.positions_file):
+            return
+        with open(self.positions_file) as f:
+            for data in json.load(f):
+                self.book.add(_from_json(data))
+        print(f"Loaded {len(self.book)} open position(s) from {self.positions_file}")
+
+    def save(self):
+        if not self.positions_file:
+            return
+        tmp_path = f"{self.positions_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump([_to_json(p) for p in self.open_positions()], f)
+        os.replace(tmp_path, self.positions_file)
+        self.dirty = False
+
+    def open_positions(self):
+        return list(self.book.positions.values()) + [p for p, _ in self.cooling.values()]
+
+    def release_cooled(self):
+        """Puts positions whose cooldown after a failed sell has passed back in the book."""
+        now = time.monotonic()
+        for position_id, (position, retry_at) in list(self.cooling.items()):
+            if retry_at <= now:
+                del self.cooling[position_id]
+                self.book.add(position)
+
+    def remove(self, position_id):
+        """Stops watching a position, wherever it is; a sell already in flight still goes through."""
+        self.retry_delays.pop(position_id, None)
+        position = self.book.remove(position_id) or self.selling.pop(position_id, None)
+        if position is None and position_id in self.cooling:
+            position = self.cooling.pop(position_id)[0]
+        return position
+
+    def stored_params(self, param_key):
+        if self.param_store is None:
+            raise ValueError("param_key given, but the monitor runs without a parameter store")
+        return self.param_store.get(param_key)
+
+    async def add_position(self, payload):
+        try:
+            symbol = payload['symbol'].upper()
+            param_key = payload.get('param_key')
+            stored = self.stored_params(param_key) if param_key else None
+            if stored is not None:
+                payload = dict(stored, **payload)
+            take_profit = Decimal(str(payload['take_profit']))
+            stop_loss = Decimal(str(payload['stop_loss']))
+            quantity = Decimal(str(payload['quantity'])) if payload.get('quantity') else None
+        except (KeyError, TypeError, AttributeError, InvalidOperation):
+            raise ValueError("Body must be JSON with 'symbol', 'take_profit' and 'stop_loss' (or a stored "
+                             "'param_key'), and optionally 'quantity'")
+        if stop_loss <= 0:
+            # The stop-loss heap stores -stop_loss and matches entries by abs(), so levels must be positive
+            raise ValueError("take_profit and stop_loss must be positive")
+        if stop_loss >= take_profit:
+            raise ValueError("stop_loss must be below take_profit")
+
+        async with self.add_lock:
+            if quantity is None:
+                balance = await asyncio.to_thread(get_free_balance, base_asset(symbol))
+                quantity = balance - self.book.held(symbol)
+            if quantity < mexc.MIN_BALANCE:
+                raise ValueError(f"Quantity {quantity} is below the minimum of {mexc.MIN_BALANCE}")
+
+            position = {'id': uuid.uuid4().hex[:12], 'symbol': symbol, 'quantity': quantity,
+                        'take_profit': take_profit, 'stop_loss': stop_loss, 'opened_at': time.time()}
+            if param_key:
+                position['param_key'] = param_key
+                position['param_version'] = stored['version'] if stored else 0
+            self.book.add(position)
+        self.dirty = True
+        print(f"Watching {symbol} {quantity} - Take-Profit @ {take_profit}, Stop-Loss @ {stop_loss} "
+              f"(id {position['id']})")
+        return position
+
+    async def sell(self, position, reason, price, detected_at):
+        # Runs in its own task, so the run id only tags this order's spans
+        tracing.set_run_id(position.get('param_key'))
+        async with self.order_slots:
+            try:
+                resp = await asyncio.to_thread(place_market_sell, position['symbol'], position['quantity'])
+            except Exception as e:
+                self.orders_failed += 1
+                tracing.record("trigger to order", time.perf_counter() - detected_at, ok=False,
+                               symbol=position['symbol'], reason=reason)
+                if self.selling.pop(position['id'], None) is None:
+                    print(f"Failed to sell {position['symbol']} (id {position['id']}): {e}. "
+                          f"It was removed meanwhile, so it stays closed.")
+                    return
+                # triggered() already took the position out of the book; it goes back once the cooldown passes
+                delay = self.retry_delays.get(position['id'])
+                delay = min(delay * 2, mexc.SELL_RETRY_MAX) if delay else mexc.SELL_RETRY_DELAY
+                self.retry_delays[position['id']] = delay
+                self.cooling[position['id']] = (position, time.monotonic() + delay)
+                print(f"Failed to sell {position['symbol']} (id {position['id']}): {e}. "
+                      f"Will keep monitoring, next attempt in {delay}s...")
+                self.dirty = True
+                return
+        self.selling.pop(position['id'], None)
+        self.retry_delays.pop(position['id'], None)
+        self.orders_placed += 1
+        self.dirty = True
+        tracing.record("trigger to order", time.perf_counter() - detected_at, symbol=position['symbol'], reason=reason)
+        print(f"[+] {reason} hit for {position['symbol']} @ {price} (id {position['id']}), "
+              f"order placed in {(time.perf_counter() - detected_at) * 1000:.0f} ms: {resp}")
+
+    def refresh_levels(self):
+        """Moves positions opened with a param_key to newer versions of their stored parameters."""
+        # Cheap when nothing was written: the store only compares PRAGMA data_version
+        if self.param_store is None or not self.param_store.changed():
+            return 0
+        keyed = [p for p in self.book.positions.values() if p.get('param_key')]
+        rows = self.param_store.get_many({p['param_key'] for p in keyed}) if keyed else {}
+        updated = 0
+        for position in keyed:
+            row = rows.get(position['param_key'])
+            if row is None or row['version'] <= position['param_version']:
+                continue
+            position['param_version'] = row['version']
+            take_profit, stop_loss = Decimal(str(row['take_profit'])), Decimal(str(row['stop_loss']))
+            if stop_loss <= 0 or stop_loss >= take_profit:
+                print(f"Ignoring version {row['version']} of '{position['param_key']}': stop_loss must be "
+                      f"positive and below take_profit")
+                continue
+            self.book.move(position['id'], take_profit, stop_loss)
+            updated += 1
+            print(f"{position['symbol']} (id {position['id']}) now Take-Profit @ {take_profit}, "
+                  f"Stop-Loss @ {stop_loss} (version {row['version']} of '{position['param_key']}')")
+        if updated:
+            self.levels_updated += updated
+            self.dirty = True
+        return updated
+
+    async def poll_once(self):
+        """Checks every open position against one batch of prices; returns how many triggered."""
+        self.release_cooled()
+        if not len(self.book):
+            return 0
+        self.refresh_levels()
+        prices = await asyncio.to_thread(get_all_prices)
+        started = time.perf_counter()
+        triggered = 0
+        for symbol in self.book.symbols():
+            price = prices.get(symbol)
+            if price is None:
+                continue
+            for position, reason in self.book.triggered(symbol, price):
+                triggered += 1
+                self.selling[position['id']] = position
+                task = asyncio.create_task(self.sell(position, reason, price, started))
+                self.orders.add(task)
+                task.add_done_callback(self.orders.discard)
+        self.polls += 1
+        self.last_poll_seconds = time.perf_counter() - started
+        tracing.record("monitor tick", self.last_poll_seconds, positions=len(self.book), triggered=triggered)
+        if triggered:
+            self.dirty = True
+        return triggered
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.poll_once()
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                print(f"Failed to fetch prices: {e}")
+            if self.dirty:
+                self.save()
+            await asyncio.sleep(max(0.0, self.poll_interval - (time.monotonic() - started)))
+
+    def stats(self):
+        return {
+            'status': 'ok',
+            'positions': len(self.book),
+            'cooling': len(self.cooling),
+            'symbols': len(self.book.symbols()),
+            'polls': self.polls,
+            'orders_placed': self.orders_placed,
+            'orders_failed': self.orders_failed,
+            'levels_updated': self.levels_updated,
+            'last_poll_ms': round(self.last_poll_seconds * 1000, 3),
+        }
+
+    async def route(self, method, path, body):
+        if path == '/health':
+            return 200, self.stats()
+        if path == '/positions':
+            if method == 'GET':
+                return 200, {'positions': [_to_json(p) for p in self.open_positions()]}
+            if method != 'POST':
+                return 405, {'error': 'Use GET or POST'}
+            payload, error = parse_json(body)
+            if error:
+                return error
+            try:
+                position = await self.add_position(payload or {})
+            except (ValueError, requests.exceptions.RequestException) as e:
+                return 400, {'error': str(e)}
+            return 201, _to_json(position)
+        if path.startswith('/positions/'):
+            if method != 'DELETE':
+                return 405, {'error': 'Use DELETE'}
+            position = self.remove(path.rsplit('/', 1)[1])
+            if position is None:
+                return 404, {'error': 'Unknown position'}
+            self.dirty = True
+            return 200, _to_json(position)
+        return 404, {'error': f'Unknown path {path}'}
+
+    async def handle(self, reader, writer):
+        await handle_request(reader, writer, self.route)
+
+
+async def serve(host, port, poll_interval=POLL_INTERVAL, positions_file=POSITIONS_FILE,
+                param_store_path=DEFAULT_PARAM_STORE):
+    param_store = ParamStore(param_store_path) if param_store_path else None
+    monitor = PositionMonitor(poll_interval, positions_file, param_store=param_store)
+    monitor.load()
+    server = await asyncio.start_server(monitor.handle, host, port)
+    print(f"✅ Position monitor listening on http://{host}:{port}")
+    async with server:
+        await monitor.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch many positions' Take Profit / Stop Loss in one process.")
+    parser.add_argument("--host", default=HOST, help=f"Interface to bind (default: {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port to listen on (default: {PORT})")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help=f"Seconds between price checks (default: {POLL_INTERVAL})")
+    parser.add_argument("--positions-file", default=POSITIONS_FILE,
+                        help=f"Where open positions are saved (default: {POSITIONS_FILE})")
+    parser.add_argument("--param-store", default=DEFAULT_PARAM_STORE,
+                        help=f"Parameter store that param_key positions follow (default: {DEFAULT_PARAM_STORE}, '' to disable)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.poll_interval, args.positions_file, args.param_store))
+    except KeyboardInterrupt:
+        print("Position monitor stopped.")
+
+
+if __name__ == "__main__":
+    main()
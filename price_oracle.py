@@ -0,0 +1,370 @@
+"""Shared price oracle: the latest WBTC/USDT (and other pairs') price, fetched once and reused.
+
+The analysis needs the WBTC price for its prompt and the sell script polls the same
+ticker while its price stream is down; without this every run asked CoinAPI or MEXC
+on its own. A PriceOracle keeps the last price per symbol in memory and only goes
+upstream when it is older than the caller's max_age (PRICE_MAX_AGE seconds by
+default). Concurrent callers that find the same symbol stale share one upstream
+request, and each source keeps a single keep-alive connection. Sources are tried in
+order (PRICE_SOURCES, default "mexc,coinapi": MEXC's public ticker first, so CoinAPI
+quota is only spent when MEXC doesn't answer).
+
+Run it as a process to share the prices between the scripts n8n starts:
+
+    python3 price_oracle.py [--symbols WBTCUSDT,BTCUSDT] [--refresh 2]
+
+    GET /price/<symbol>  -> {"symbol", "price", "age", "source"}
+    GET /prices          -> {"prices": {symbol: {...}}}
+    GET /health          -> {"status": "ok", "hits", "coalesced", "upstream_requests", ...}
+
+It refreshes the configured symbols every --refresh seconds with one request for all
+of them. With PRICE_ORACLE_URL set (e.g. http://127.0.0.1:8767), get_price() asks
+that process and falls back to fetching in-process when it isn't reachable.
+"""
+import os
+import time
+import asyncio
+import argparse
+import threading
+from decimal import Decimal
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+import tracing
+from json_http import handle_request
+
+# Load environment variables
+load_dotenv()
+
+HOST = os.getenv("PRICE_ORACLE_HOST", "127.0.0.1")
+PORT = int(os.getenv("PRICE_ORACLE_PORT", "8767"))
+ORACLE_URL = os.getenv("PRICE_ORACLE_URL")
+MAX_AGE = float(os.getenv("PRICE_MAX_AGE", "10"))  # seconds a price is served from memory
+SOURCES = os.getenv("PRICE_SOURCES", "mexc,coinapi")
+SYMBOLS = os.getenv("PRICE_SYMBOLS", "WBTCUSDT")
+MEXC_BASE_URL = os.getenv("MEXC_BASE_URL") or "https://api.mexc.co"
+COINAPI_URL = os.getenv("COINAPI_URL", "https://rest.coinapi.io")
+COINAPI_KEY = os.getenv("COINAPI_KEY")
+REFRESH_INTERVAL = 2   # seconds between the oracle process's background refreshes
+UPSTREAM_TIMEOUT = 10
+ORACLE_TIMEOUT = 2
+QUOTE_ASSETS = ("USDT", "USDC", "BTC", "ETH")
+
+
+class PriceUnavailable(Exception):
+    """Raised when no source has a price for the symbol within the staleness bound."""
+
+
+def split_symbol(symbol):
+    """'WBTCUSDT' -> ('WBTC', 'USDT')."""
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)], quote
+    raise ValueError(f"Can't tell the base asset of {symbol}")
+
+
+def _single_connection_session(base_url):
+    session = requests.Session()
+    # One keep-alive connection per upstream; concurrent fetches queue for it instead of opening more
+    session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=1, pool_block=True))
+    return session
+
+
+class MexcTicker:
+    """MEXC's public ticker: one symbol per request, or every symbol in one request."""
+
+    name = "mexc"
+
+    def __init__(self, base_url=MEXC_BASE_URL):
+        self.base_url = base_url
+        self.session = _single_connection_session(base_url)
+        self.requests = 0
+
+    def fetch(self, symbols):
+        self.requests += 1
+        url = f"{self.base_url}/api/v3/ticker/price"
+        if len(symbols) == 1:
+            r = self.session.get(url, params={'symbol': symbols[0]}, timeout=UPSTREAM_TIMEOUT)
+            r.raise_for_status()
+            return {symbols[0]: Decimal(r.json()['price'])}
+        r = self.session.get(url, timeout=UPSTREAM_TIMEOUT)
+        r.raise_for_status()
+        wanted = set(symbols)
+        return {t['symbol']: Decimal(t['price']) for t in r.json() if t['symbol'] in wanted}
+
+
+class CoinApiRate:
+    """CoinAPI's exchange rate endpoint, one request per symbol."""
+
+    name = "coinapi"
+
+    def __init__(self, api_key=COINAPI_KEY, base_url=COINAPI_URL):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.session = _single_connection_session(base_url)
+        self.requests = 0
+
+    def fetch(self, symbols):
+        if not self.api_key:
+            raise ValueError("COINAPI_KEY not set")
+        prices = {}
+        for symbol in symbols:
+            base, quote = split_symbol(symbol)
+            self.requests += 1
+            r = self.session.get(f"{self.base_url}/v1/exchangerate/{base}/{quote}",
+                                 headers={'X-CoinAPI-Key': self.api_key}, timeout=UPSTREAM_TIMEOUT)
+            r.raise_for_status()
+            rate = r.json().get('rate')
+            if rate:
+                prices[symbol] = Decimal(str(rate))
+        return prices
+
+
+SOURCE_TYPES = {"mexc": MexcTicker, "coinapi": CoinApiRate}
+
+
+def make_sources(names=SOURCES, coinapi_key=None):
+    """Builds the sources named in a comma-separated list, in order."""
+    sources = []
+    for name in [n.strip() for n in names.split(",") if n.strip()]:
+        if name not in SOURCE_TYPES:
+            raise ValueError(f"Unknown price source {name!r} (choose from {', '.join(SOURCE_TYPES)})")
+        sources.append(CoinApiRate(coinapi_key or COINAPI_KEY) if name == "coinapi" else SOURCE_TYPES[name]())
+    return sources
+
+
+class _Flight:
+    """One upstream fetch that other callers for the same symbol wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class PriceOracle:
+    """The latest price per symbol, shared by every caller in the process."""
+
+    def __init__(self, sources=None, max_age=MAX_AGE):
+        self.sources = make_sources() if sources is None else sources
+        self.max_age = max_age
+        self.prices = {}   # symbol -> (Decimal price, time.monotonic() when fetched, source name)
+        self.flights = {}  # symbol -> _Flight in progress
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    def cached(self, symbol, max_age=None):
+        """Returns (price, age in seconds, source) if the stored price is fresh enough, else None."""
+        max_age = self.max_age if max_age is None else max_age
+        entry = self.prices.get(symbol)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry[1]
+        return (entry[0], age, entry[2]) if age <= max_age else None
+
+    def get(self, symbol, max_age=None):
+        """Returns (price, age, source) for symbol, going upstream only when the stored price is too old.
+
+        Callers that arrive while the symbol is being fetched (by another caller or the
+        background refresh) wait for that fetch instead of starting their own. Raises
+        PriceUnavailable when every source fails.
+        """
+        with self.lock:
+            fresh = self.cached(symbol, max_age)
+            if fresh:
+                self.hits += 1
+                return fresh
+            flight = self.flights.get(symbol)
+            leader = flight is None
+            if leader:
+                flight = self.flights[symbol] = _Flight()
+            else:
+                self.coalesced += 1
+        if leader:
+            self._fly({symbol: flight})
+        else:
+            flight.done.wait()
+        if flight.error:
+            raise flight.error
+        with self.lock:
+            price, fetched_at, source = self.prices[symbol]
+        return price, time.monotonic() - fetched_at, source
+
+    def refresh(self, symbols):
+        """Fetches every symbol that isn't already being fetched, in one request per source.
+
+        Returns {symbol: error} for the symbols no source could price.
+        """
+        with self.lock:
+            flights = {s: _Flight() for s in symbols if s not in self.flights}
+            self.flights.update(flights)
+        return self._fly(flights)
+
+    def _fly(self, flights):
+        """Fetches the flights' symbols, then releases everyone waiting on them."""
+        errors = {}
+        try:
+            errors = self._fetch(list(flights))
+            for symbol, error in errors.items():
+                flights[symbol].error = PriceUnavailable(f"No price for {symbol}: {error}")
+        except Exception as e:
+            for flight in flights.values():
+                flight.error = e
+        finally:
+            with self.lock:
+                for symbol in flights:
+                    del self.flights[symbol]
+            for flight in flights.values():
+                flight.done.set()
+        return errors
+
+    def _fetch(self, symbols):
+        """Tries the sources in order, each for the symbols the previous ones didn't price."""
+        missing, failures = list(symbols), []
+        for i, source in enumerate(self.sources):
+            if not missing:
+                break
+            try:
+                with tracing.span("price fetch", source=source.name, symbols=len(missing)):
+                    prices = source.fetch(missing)
+            except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+                failures.append(f"{source.name}: {e}")
+                continue
+            fetched_at = time.monotonic()
+            with self.lock:
+                for symbol in missing:
+                    if symbol in prices:
+                        self.prices[symbol] = (prices[symbol], fetched_at, source.name)
+                        if i > 0:
+                            self.fallbacks += 1
+            missing = [s for s in missing if s not in prices]
+            if missing:
+                failures.append(f"{source.name}: no price for {', '.join(missing)}")
+        if missing and failures:
+            print(f"⚠️ Price fetch failed ({'; '.join(failures)})")
+        return {symbol: "; ".join(failures) or "no sources configured" for symbol in missing}
+
+    def stats(self):
+        return {
+            'status': 'ok',
+            'symbols': len(self.prices),
+            'hits': self.hits,
+            'coalesced': self.coalesced,
+            'fallbacks': self.fallbacks,
+            'upstream_requests': {source.name: source.requests for source in self.sources},
+        }
+
+
+_oracles = {}
+_oracles_lock = threading.Lock()
+
+
+def get_oracle(coinapi_key=None):
+    """Returns this process's shared PriceOracle (one per CoinAPI key), created on first use."""
+    with _oracles_lock:
+        oracle = _oracles.get(coinapi_key)
+        if oracle is None:
+            oracle = _oracles[coinapi_key] = PriceOracle(make_sources(coinapi_key=coinapi_key))
+        return oracle
+
+
+def get_price(symbol, max_age=None, coinapi_key=None, session=None):
+    """Returns the latest price of symbol as a Decimal, at most max_age (default PRICE_MAX_AGE) seconds old.
+
+    Asks the oracle process at PRICE_ORACLE_URL when one is configured (through session,
+    if given), otherwise or when it can't answer, this process's own oracle. Raises
+    PriceUnavailable when no source has the price.
+    """
+    if ORACLE_URL:
+        try:
+            r = (session or requests).get(f"{ORACLE_URL}/price/{symbol}", timeout=ORACLE_TIMEOUT)
+            r.raise_for_status()
+            data = r.json()
+            if data['age'] <= (MAX_AGE if max_age is None else max_age):
+                return Decimal(data['price'])
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"⚠️ Price oracle at {ORACLE_URL} unavailable ({e}), fetching the price directly")
+    return get_oracle(coinapi_key).get(symbol, max_age)[0]
+
+
+def _price_json(symbol, price, age, source):
+    return {'symbol': symbol, 'price': str(price), 'age': round(age, 3), 'source': source}
+
+
+class OracleService:
+    """Serves the oracle's prices over HTTP and keeps the configured symbols fresh."""
+
+    def __init__(self, oracle, symbols, refresh_interval=REFRESH_INTERVAL):
+        self.oracle = oracle
+        self.symbols = symbols
+        self.refresh_interval = refresh_interval
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            # All configured symbols in one upstream request per source
+            await asyncio.to_thread(self.oracle.refresh, self.symbols)
+            await asyncio.sleep(max(0.0, self.refresh_interval - (time.monotonic() - started)))
+
+    async def route(self, method, path, body):
+        if method != 'GET':
+            return 405, {'error': 'Use GET'}
+        if path == '/health':
+            return 200, self.oracle.stats()
+        if path == '/prices':
+            with self.oracle.lock:
+                now = time.monotonic()
+                entries = list(self.oracle.prices.items())
+            return 200, {'prices': {s: _price_json(s, p, now - at, source) for s, (p, at, source) in entries}}
+        if path.startswith('/price/'):
+            symbol = path.rsplit('/', 1)[1].upper()
+            try:
+                # In a worker thread, so a slow upstream fetch doesn't hold up the other requests
+                price, age, source = await asyncio.to_thread(self.oracle.get, symbol)
+            except PriceUnavailable as e:
+                return 503, {'error': str(e)}
+            return 200, _price_json(symbol, price, age, source)
+        return 404, {'error': f'Unknown path {path}'}
+
+    async def handle(self, reader, writer):
+        await handle_request(reader, writer, self.route)
+
+
+async def serve(host, port, symbols, refresh_interval=REFRESH_INTERVAL, max_age=MAX_AGE, sources=SOURCES):
+    service = OracleService(PriceOracle(make_sources(sources), max_age), symbols, refresh_interval)
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"✅ Price oracle for {', '.join(symbols)} listening on http://{host}:{port} "
+          f"(sources: {sources}, max age {max_age:g}s)")
+    async with server:
+        await service.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the latest prices from one shared upstream connection.")
+    parser.add_argument("--host", default=HOST, help=f"Interface to bind (default: {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port to listen on (default: {PORT})")
+    parser.add_argument("--symbols", default=SYMBOLS,
+                        help=f"Comma-separated symbols to keep fresh (default: {SYMBOLS})")
+    parser.add_argument("--refresh", type=float, default=REFRESH_INTERVAL,
+                        help=f"Seconds between background refreshes (default: {REFRESH_INTERVAL})")
+    parser.add_argument("--max-age", type=float, default=MAX_AGE,
+                        help=f"Oldest price served without going upstream, in seconds (default: {MAX_AGE:g})")
+    parser.add_argument("--sources", default=SOURCES, help=f"Sources in fallback order (default: {SOURCES})")
+    args = parser.parse_args()
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+    try:
+        make_sources(args.sources)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        asyncio.run(serve(args.host, args.port, symbols, args.refresh, args.max_age, args.sources))
+    except KeyboardInterrupt:
+        print("Price oracle stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Compact, token-budgeted encoding of OHLCV rows for the analysis prompt.
+
+Long date ranges are too big to send to the model verbatim, so the most recent days
+stay daily while older history is aggregated into weekly (or, if that is still too
+big, monthly) OHLC bars. Summary statistics are computed with NumPy over the full
+daily data, so nothing is lost by the downsampling for returns, volatility or the
+stock/BTC correlation. Rows read from the weekly or monthly rollups work the same
+way, starting from their own timeframe and labelled for it.
+"""
+import numpy as np
+
+from indicators import BAR_UNITS, align, indicator_summary
+
+DEFAULT_TOKEN_BUDGET = 8000
+RECENT_DAILY_DAYS = 90
+MIN_RECENT_DAILY_DAYS = 10
+# Numeric tables tokenize poorly; ~3 characters per token is a conservative estimate
+CHARS_PER_TOKEN = 3
+# Shortest possible row ("2024-01-02 1.00 1.00 1.00 1.00 0"), used to skip hopeless candidates
+MIN_ROW_CHARS = 32
+
+PERIOD_NAMES = {'D': 'Daily', 'W': 'Weekly', 'M': 'Monthly'}
+PERIODS = ['D', 'W', 'M']
+# Bar timeframe of the rows (see ohlcv_store.py) -> their period, and how the table rows are dated
+TIMEFRAME_PERIODS = {'1d': 'D', '1w': 'W', '1mo': 'M'}
+ROW_DATES = {
+    'D': "weekly/monthly rows start on their first trading day",
+    'W': "rows start on the Monday of their first week",
+    'M': "rows start on the first day of their month",
+}
+
+
+def estimate_tokens(text):
+    """Rough token count for text, erring on the high side."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def to_arrays(rows):
+    """Converts (trade_date, open, high, low, close, volume) rows into NumPy columns."""
+    if not rows:
+        return None
+    dates, opens, highs, lows, closes, volumes = zip(*rows)
+    return {
+        'date': np.array(dates, dtype='datetime64[D]'),
+        'open': np.array(opens, dtype=float),
+        'high': np.array(highs, dtype=float),
+        'low': np.array(lows, dtype=float),
+        'close': np.array(closes, dtype=float),
+        'volume': np.array(volumes, dtype=float),
+    }
+
+
+def _slice(arrays, start, stop):
+    return {name: values[start:stop] for name, values in arrays.items()}
+
+
+def resample(arrays, period):
+    """Aggregates daily columns into 'W' (Monday-based weeks) or 'M' (calendar months) bars.
+
+    Each bar is labelled with its first trading date. Expects date-sorted input.
+    """
+    dates = arrays['date']
+    if period == 'W':
+        # 1970-01-01 was a Thursday, so shifting by 3 days makes weeks start on Monday
+        key = (dates.astype('int64') + 3) // 7
+    elif period == 'M':
+        key = dates.astype('datetime64[M]').astype('int64')
+    else:
+        raise ValueError(f"Unknown period {period!r}")
+
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    ends = np.r_[starts[1:], len(dates)] - 1
+    return {
+        'date': dates[starts],
+        'open': arrays['open'][starts],
+        'high': np.maximum.reduceat(arrays['high'], starts),
+        'low': np.minimum.reduceat(arrays['low'], starts),
+        'close': arrays['close'][ends],
+        'volume': np.add.reduceat(arrays['volume'], starts),
+    }
+
+
+def _table_lines(arrays, period):
+    if not len(arrays['date']):
+        return []
+    dates = np.datetime_as_string(arrays['date'], unit='D')
+    return [f"{PERIOD_NAMES[period]} bars ({dates[0]}..{dates[-1]}, {len(dates)} rows):"] + [
+        f"{d} {o:.2f} {h:.2f} {l:.2f} {c:.2f} {v:.0f}"
+        for d, o, h, l, c, v in zip(dates, arrays['open'].tolist(), arrays['high'].tolist(),
+                                    arrays['low'].tolist(), arrays['close'].tolist(),
+                                    arrays['volume'].tolist())
+    ]
+
+
+def _render(symbol, older, recent, base='D'):
+    lines = [f"{symbol} Data (Date Open High Low Close Volume; {ROW_DATES[base]}):"]
+    for period, arrays in older:
+        lines.extend(_table_lines(arrays, period))
+    lines.extend(_table_lines(recent, base))
+    return "\n".join(lines)
+
+
+def encode_series(rows, symbol, token_budget=DEFAULT_TOKEN_BUDGET, recent_days=RECENT_DAILY_DAYS, timeframe='1d'):
+    """Encodes one symbol's rows (bars in timeframe: '1d', '1w' or '1mo') within token_budget.
+
+    Tries, in order: every row as is; the last recent_days rows with weekly bars
+    before them; the same with monthly bars; then shrinks the recent window. Only
+    periods coarser than the rows' own are tried. Returns the first encoding that fits,
+    or the most compact one.
+    """
+    arrays = to_arrays(rows)
+    if arrays is None:
+        return f"No data available for {symbol} in the specified range."
+
+    base = TIMEFRAME_PERIODS[timeframe]
+    coarser = PERIODS[PERIODS.index(base) + 1:]
+    n = len(arrays['date'])
+    if not coarser or n * MIN_ROW_CHARS // CHARS_PER_TOKEN <= token_budget:
+        text = _render(symbol, [], arrays, base)
+        if not coarser or estimate_tokens(text) <= token_budget:
+            return text
+
+    n_recent = min(recent_days, n)
+    while True:
+        recent = _slice(arrays, n - n_recent, n)
+        older = _slice(arrays, 0, n - n_recent)
+        for period in coarser:
+            text = _render(symbol, [(period, resample(older, period))], recent, base)
+            if estimate_tokens(text) <= token_budget:
+                return text
+        if n_recent <= MIN_RECENT_DAILY_DAYS:
+            return text
+        n_recent = max(MIN_RECENT_DAILY_DAYS, n_recent // 2)
+
+
+def _series_stats(symbol, arrays, unit):
+    dates, close = arrays['date'], arrays['close']
+    span_years = max(int((dates[-1] - dates[0]).astype(int)), 1) / 365.25
+    log_returns = np.diff(np.log(close))
+    # Annualize with the symbol's own observation frequency (stocks ~252/yr, BTC 365/yr)
+    periods_per_year = len(log_returns) / span_years if len(log_returns) else 0
+    volatility = log_returns.std(ddof=1) * np.sqrt(periods_per_year) if len(log_returns) > 1 else float('nan')
+    drawdown = (close / np.maximum.accumulate(close) - 1).min()
+    first, last = np.datetime_as_string(dates[[0, -1]], unit='D')
+    return (f"{symbol}: {first}..{last}, {len(close)} {unit}s, close {close[0]:.2f} -> {close[-1]:.2f} "
+            f"({(close[-1] / close[0] - 1) * 100:+.2f}%), range {arrays['low'].min():.2f}-{arrays['high'].max():.2f}, "
+            f"annualized volatility {volatility * 100:.1f}%, max drawdown {drawdown * 100:.1f}%")
+
+
+def return_correlation(a, b):
+    """Pearson correlation of close-to-close log returns over the dates both series share.
+
+    Returns (correlation, number of returns used); correlation is nan with < 3 returns.
+    """
+    a, b = align(a, b)
+    ra, rb = np.diff(np.log(a['close'])), np.diff(np.log(b['close']))
+    if len(ra) < 3:
+        return float('nan'), len(ra)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return float(np.corrcoef(ra, rb)[0, 1]), len(ra)
+
+
+def summary_statistics(stock_rows, stock_symbol, btc_rows, btc_symbol, timeframe='1d'):
+    """Returns a short text block of per-series statistics, their return correlation and
+    the latest indicator values (see indicators.py), for rows of bars in timeframe."""
+    name, _, unit, _, _ = BAR_UNITS[timeframe]
+    stock, btc = to_arrays(stock_rows), to_arrays(btc_rows)
+    lines = [f"Summary statistics (computed from the full {name} data):"]
+    for symbol, arrays in ((stock_symbol, stock), (btc_symbol, btc)):
+        if arrays is not None:
+            lines.append(_series_stats(symbol, arrays, unit))
+    if stock is not None and btc is not None:
+        corr, n = return_correlation(stock, btc)
+        lines.append(f"Correlation of {name} returns {stock_symbol} vs {btc_symbol}: {corr:.2f} "
+                     f"over {n} common {unit}s")
+    if len(lines) == 1:
+        return ""
+    indicators = indicator_summary(stock, stock_symbol, btc, btc_symbol, timeframe)
+    return "\n".join(lines + ["", indicators] if indicators else lines)
+
+
+def encode_prompt_data(stock_rows, stock_symbol, btc_rows, btc_symbol, token_budget=DEFAULT_TOKEN_BUDGET,
+                       timeframe='1d'):
+    """Encodes both series (splitting the budget evenly) plus their summary statistics.
+
+    Both series hold bars in timeframe ('1d', '1w' or '1mo'). Returns (stock_text,
+    btc_text, summary_text).
+    """
+    per_series = token_budget // 2
+    return (encode_series(stock_rows, stock_symbol, per_series, timeframe=timeframe),
+            encode_series(btc_rows, btc_symbol, per_series, timeframe=timeframe),
+            summary_statistics(stock_rows, stock_symbol, btc_rows, btc_symbol, timeframe))
@@ -0,0 +1,76 @@
+"""A run after rows were appended to a partially exported day (or bar) rebuilds that bar whole.
+
+    python3 -m pytest tests
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import kraken_csv_extract as kraken
+
+DAY = 19723 * kraken.DAY_SECONDS  # 2024-01-01 00:00 UTC
+
+# (timestamp, price, volume); the first export ends partway through the second day
+FIRST_EXPORT = [(DAY + 60, 100.0, 1.0), (DAY + 7200, 105.0, 2.0),
+                (DAY + 86400 + 60, 110.0, 1.0), (DAY + 86400 + 3600, 108.0, 1.0)]
+APPENDED = [(DAY + 86400 + 50000, 120.0, 3.0), (DAY + 86400 + 80000, 95.0, 4.0),
+            (DAY + 2 * 86400 + 60, 99.0, 1.0)]
+
+
+def write_trades(path, trades, mode='w'):
+    with open(path, mode) as f:
+        f.writelines(f"{ts},{price},{volume}\n" for ts, price, volume in trades)
+
+
+def args():
+    return argparse.Namespace(chunk_rows=2, loader='copy', page_size=100)
+
+
+def test_daily_bar_completed_by_appended_trades(tmp_path, monkeypatch):
+    stored = {}
+
+    def load_bars(conn, bars, args):
+        for i, day in enumerate(bars['trade_date'].tolist()):
+            stored[day] = tuple(bars[k][i].item() for k in ('high_price', 'low_price', 'close_price', 'volume'))
+        return len(bars['trade_date'])
+
+    monkeypatch.setattr(kraken, 'load_bars', load_bars)
+    path = tmp_path / 'trades.csv'
+    write_trades(path, FIRST_EXPORT)
+    kraken.stream_to_db(None, str(path), None, args())
+    write_trades(path, APPENDED, mode='a')
+    kraken.stream_to_db(None, str(path), max(stored), args())
+
+    second_day = np.datetime64('2024-01-02').item()
+    assert stored[second_day] == (120.0, 95.0, 95.0, 9)
+    assert len(stored) == 3
+
+
+def test_intraday_bar_completed_by_appended_trades(tmp_path, monkeypatch):
+    stored = {}
+
+    def copy_intraday(conn, symbol, timeframe, bars):
+        for i, start in enumerate(bars['bar_start'].tolist()):
+            stored[start] = tuple(bars[k][i].item() for k in ('high_price', 'low_price', 'close_price', 'volume'))
+        return len(bars['bar_start'])
+
+    def latest_bar(conn, symbol, timeframe):
+        return max(stored).replace(tzinfo=kraken.datetime.timezone.utc) if stored else None
+
+    monkeypatch.setattr(kraken.ohlcv_store, 'copy_intraday', copy_intraday)
+    monkeypatch.setattr(kraken.ohlcv_store, 'latest_bar', latest_bar)
+    path = tmp_path / 'trades.csv'
+    # The first export ends partway through the 01:00 hour
+    write_trades(path, [(DAY + 60, 100.0, 1.0), (DAY + 3600 + 60, 110.0, 1.0)])
+    kraken.stream_intraday_to_db(None, str(path), '1h', args())
+    write_trades(path, [(DAY + 3600 + 1800, 130.0, 2.0), (DAY + 3600 + 3000, 90.0, 0.5),
+                        (DAY + 7200 + 60, 95.0, 1.0)], mode='a')
+    kraken.stream_intraday_to_db(None, str(path), '1h', args())
+
+    hour = np.datetime64(DAY + 3600, 's').item()
+    assert stored[hour] == (130.0, 90.0, 90.0, 3.5)
+    assert len(stored) == 3
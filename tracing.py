@@ -0,0 +1,198 @@
+"""Structured timing spans for the analysis, agent, ingest and trading scripts.
+
+Every span is one JSON line appended to TRACE_FILE:
+
+    {"ts": 1718000000.123, "run_id": "4711", "script": "mexc_buy.py", "pid": 812,
+     "span": "order send", "ms": 48.2, "ok": true, ...attributes}
+
+Tracing is off unless TRACE_FILE is set ("-" writes to stderr); then a span costs a
+json.dumps and one appended line. If the file can't be written, tracing turns itself
+off with a warning rather than failing the script. The run id ties the spans of one n8n execution
+together across processes: it comes from set_run_id() (the scripts call it with the
+run id they are given) or else from TRACE_RUN_ID in the environment. It is kept per
+context, so concurrent requests in the services don't mix their ids up, and it
+follows asyncio.to_thread() into worker threads.
+
+    python3 tracing.py traces.jsonl [--run-id ID] [--script NAME] [--span NAME]
+
+prints the count, p50, p95 and max of every stage across the recorded runs.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+import contextvars
+
+TRACE_FILE_ENV = "TRACE_FILE"
+RUN_ID_ENV = "TRACE_RUN_ID"
+SCRIPT = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python"
+
+_run_id = contextvars.ContextVar("trace_run_id", default=None)
+_lock = threading.Lock()
+_UNSET = object()
+_path = _UNSET  # resolved on first use, after the scripts' load_dotenv()
+_out = None
+
+
+def configure(path):
+    """Sends spans to path ("-" for stderr, None to turn tracing off), overriding TRACE_FILE."""
+    global _path, _out
+    with _lock:
+        if _out is not None and _out is not sys.stderr:
+            _out.close()
+        _path, _out = path, None
+
+
+def enabled():
+    global _path
+    if _path is _UNSET:
+        _path = os.getenv(TRACE_FILE_ENV) or None
+    return _path is not None
+
+
+def set_run_id(run_id):
+    """Tags the spans recorded from here on (in this context) with run_id."""
+    _run_id.set(str(run_id) if run_id is not None else None)
+
+
+def run_id():
+    return _run_id.get() or os.getenv(RUN_ID_ENV) or None
+
+
+def record(name, seconds, ok=True, start=None, **attrs):
+    """Writes a span that was timed elsewhere (seconds long, started at epoch `start`)."""
+    if not enabled():
+        return
+    entry = {
+        "ts": round(start if start is not None else time.time() - seconds, 6),
+        "run_id": run_id(),
+        "script": SCRIPT,
+        "pid": os.getpid(),
+        "span": name,
+        "ms": round(seconds * 1000, 3),
+        "ok": ok,
+    }
+    entry.update(attrs)
+    line = json.dumps(entry, default=str) + "\n"
+    global _path, _out
+    with _lock:
+        if _path is None:
+            return
+        try:
+            if _out is None:
+                # Line buffered: each span is a single append, so processes sharing the file don't interleave
+                _out = sys.stderr if _path == "-" else open(_path, "a", buffering=1)
+            _out.write(line)
+        except OSError as e:
+            # Spans are recorded next to live orders, so a full disk or bad path must not raise into them
+            print(f"⚠️ Tracing disabled, can't write to {_path}: {e}", file=sys.stderr)
+            if _out is not None and _out is not sys.stderr:
+                with contextlib.suppress(OSError):
+                    _out.close()
+            _path, _out = None, None
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Times the block as span `name`. Yields attrs, so the block can add attributes to the span.
+
+    A block that raises is recorded with ok=false and the error, and the exception propagates.
+    """
+    if not enabled():
+        yield attrs
+        return
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        record(name, time.perf_counter() - t0, ok=False, start=start, **attrs)
+        raise
+    record(name, time.perf_counter() - t0, start=start, **attrs)
+
+
+def load(paths, run_id=None, script=None, span_name=None):
+    """Reads spans from JSONL files, skipping malformed lines and those not matching the filters."""
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entry["span"], entry["ms"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if ((run_id and entry.get("run_id") != run_id) or (script and entry.get("script") != script)
+                        or (span_name and entry["span"] != span_name)):
+                    continue
+                spans.append(entry)
+    return spans
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0..100) of sorted values."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, -(-q * len(values) // 100) - 1))
+    return values[int(index)]
+
+
+def summarize(spans):
+    """Returns {stage: {'count', 'errors', 'p50', 'p95', 'max'}} (milliseconds), plus 'run total'.
+
+    'run total' is, for every run id, the time from its first span's start to its last span's end.
+    """
+    by_stage, runs = {}, {}
+    for entry in spans:
+        by_stage.setdefault(entry["span"], []).append(entry)
+        if entry.get("run_id"):
+            start, end = entry["ts"], entry["ts"] + entry["ms"] / 1000
+            first, last = runs.get(entry["run_id"], (start, end))
+            runs[entry["run_id"]] = (min(first, start), max(last, end))
+    stats = {}
+    for stage, entries in by_stage.items():
+        ms = sorted(entry["ms"] for entry in entries)
+        stats[stage] = {"count": len(ms), "errors": sum(not entry.get("ok", True) for entry in entries),
+                        "p50": percentile(ms, 50), "p95": percentile(ms, 95), "max": ms[-1]}
+    if runs:
+        ms = sorted((end - start) * 1000 for start, end in runs.values())
+        stats["run total"] = {"count": len(ms), "errors": 0, "p50": percentile(ms, 50),
+                              "p95": percentile(ms, 95), "max": ms[-1]}
+    return stats
+
+
+def print_summary(stats):
+    width = max([len(stage) for stage in stats] + [5])
+    print(f"{'stage':<{width}}  {'count':>6}  {'errors':>6}  {'p50 ms':>10}  {'p95 ms':>10}  {'max ms':>10}")
+    # Slowest stages first, so the top line is where the seconds go
+    for stage, s in sorted(stats.items(), key=lambda item: -item[1]["p95"]):
+        print(f"{stage:<{width}}  {s['count']:>6}  {s['errors']:>6}  {s['p50']:>10.1f}  {s['p95']:>10.1f}  "
+              f"{s['max']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise trace spans: p50/p95 per stage across runs")
+    parser.add_argument("files", nargs="*", help=f"Span files (default: ${TRACE_FILE_ENV})")
+    parser.add_argument("--run-id", help="Only this run's spans")
+    parser.add_argument("--script", help="Only spans from this script (e.g. mexc_buy.py)")
+    parser.add_argument("--span", help="Only this stage")
+    args = parser.parse_args()
+
+    files = args.files or [path for path in [os.getenv(TRACE_FILE_ENV)] if path and path != "-"]
+    if not files:
+        parser.error(f"no span files given and {TRACE_FILE_ENV} isn't set")
+    spans = load(files, args.run_id, args.script, args.span)
+    if not spans:
+        print("No spans found.")
+        return
+    runs = {entry.get("run_id") for entry in spans} - {None}
+    print(f"{len(spans)} spans from {len(runs)} run(s) in {', '.join(files)}\n")
+    print_summary(summarize(spans))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,134 +1,238 @@
 import os
+import time
+import threading
 import requests
-import psycopg2
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import argparse
 import datetime
 
+import ohlcv_ingest
+import ohlcv_store
+import tracing
+
 # Load environment variables
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 API_KEY = os.getenv("ALPHAVANTAGE_API_KEY")
+# Overridable so the fetcher can be pointed at a local stand-in server
+API_URL = os.getenv("ALPHAVANTAGE_URL", "https://www.alphavantage.co/query")
+
+# Alpha Vantage's free tier allows 5 requests per minute
+DEFAULT_REQUESTS_PER_MINUTE = 5
+DEFAULT_WORKERS = 4
+# outputsize=compact returns the latest 100 trading days. A gap of up to 100 calendar
+# days never holds more than 100 trading days, so compact is always enough for it.
+COMPACT_WINDOW_DAYS = 100
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate_per_minute` tokens per minute, at most `capacity` saved up."""
+
+    def __init__(self, rate_per_minute, capacity=1):
+        self.interval = 60.0 / rate_per_minute
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.interval
+            time.sleep(wait)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fetch and upload stock data to Supabase')
+    parser.add_argument('symbols', type=str, nargs='*', help='Stock symbol(s) (e.g., AAPL MSFT)')
+    parser.add_argument('--symbols-file', type=str,
+                        help='File with one symbol per line (blank lines and # comments are ignored)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Concurrent Alpha Vantage requests (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--requests-per-minute', type=float, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help=f'Alpha Vantage quota to stay under (default: {DEFAULT_REQUESTS_PER_MINUTE})')
+    parser.add_argument('--page-size', type=int, default=ohlcv_ingest.DEFAULT_PAGE_SIZE,
+                        help=f'Rows per upsert statement (default: {ohlcv_ingest.DEFAULT_PAGE_SIZE})')
+    parser.add_argument('--outputsize', choices=['auto', 'compact', 'full'], default='auto',
+                        help="'auto' uses compact when the stored data is recent enough, full otherwise (default: auto)")
+    args = parser.parse_args()
+
+    symbols = list(args.symbols)
+    if args.symbols_file:
+        with open(args.symbols_file) as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    symbols.append(line)
+    if not symbols:
+        parser.error("provide at least one symbol or --symbols-file")
+
+    # Upper-case and de-duplicate while keeping the given order
+    args.symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    return args
+
+
+def choose_outputsize(latest_date, today=None):
+    """Picks 'compact' when the gap since latest_date fits in the compact window, else 'full'."""
+    if latest_date is None:
+        return 'full'
+    today = today or datetime.date.today()
+    return 'compact' if (today - latest_date).days <= COMPACT_WINDOW_DAYS else 'full'
+
+
+def fetch_daily_series(symbol, session=requests, outputsize='full'):
+    """Fetches the daily time series for symbol from Alpha Vantage.
+
+    Returns (timeseries, bytes downloaded).
+    """
+    print(f"Fetching daily time series for {symbol} from Alpha Vantage (outputsize={outputsize})...")
+    params = {
+        'function': 'TIME_SERIES_DAILY',
+        'symbol': symbol,
+        'outputsize': outputsize,
+        'apikey': API_KEY,
+    }
+    with tracing.span("alphavantage fetch", symbol=symbol, outputsize=outputsize):
+        resp = session.get(API_URL, params=params)
+        resp.raise_for_status()
+        data = resp.json()
+
+    timeseries = data.get("Time Series (Daily)", {})
+    if not timeseries:
+        # Quota and invalid-symbol errors come back as HTTP 200 with a "Note"/"Information"/"Error Message"
+        detail = data.get("Note") or data.get("Information") or data.get("Error Message") or ""
+        raise RuntimeError(f"No 'Time Series (Daily)' found in response for {symbol}. {detail}".strip())
+    nbytes = len(resp.content)
+    print(f"✅ Data fetched successfully for {symbol}: {nbytes / 1024:.1f} KB, {len(timeseries)} entries parsed.")
+    return timeseries, nbytes
+
+
+def fetch_new_entries(symbol, latest_date, session=requests, outputsize='auto', limiter=None):
+    """Fetches only what is needed to bring symbol up to date.
+
+    With outputsize='auto', a compact response is used when it covers latest_date;
+    if it turns out not to (e.g. a long holiday or exchange closure), the full
+    history is fetched instead. Every request takes a token from limiter, if given.
+    Returns (new entries, bytes downloaded).
+    """
+    size = choose_outputsize(latest_date) if outputsize == 'auto' else outputsize
+    if limiter:
+        limiter.acquire()
+    timeseries, nbytes = fetch_daily_series(symbol, session, size)
+    if size == 'compact' and latest_date and min(timeseries) > latest_date.isoformat():
+        print(f"⚠️ Compact response for {symbol} starts after {latest_date}, fetching full history...")
+        if limiter:
+            limiter.acquire()
+        timeseries, full_bytes = fetch_daily_series(symbol, session, 'full')
+        nbytes += full_bytes
+    return filter_new_entries(timeseries, latest_date), nbytes
+
+
+def filter_new_entries(timeseries, latest_date):
+    """Keeps only the entries after latest_date (all of them when latest_date is None)."""
+    if not latest_date:
+        return timeseries
+    return {
+        date_str: stats for date_str, stats in timeseries.items()
+        if datetime.datetime.strptime(date_str, '%Y-%m-%d').date() > latest_date
+    }
+
+
+def to_bars(timeseries):
+    """Converts Alpha Vantage {date: stats} entries into columnar bars, oldest first."""
+    dates = sorted(timeseries)
+    return {
+        'trade_date':  dates,
+        'open_price':  [timeseries[d]["1. open"] for d in dates],
+        'high_price':  [timeseries[d]["2. high"] for d in dates],
+        'low_price':   [timeseries[d]["3. low"] for d in dates],
+        'close_price': [timeseries[d]["4. close"] for d in dates],
+        'volume':      [timeseries[d]["5. volume"] for d in dates],
+    }
+
+
+def ingest_symbols(conn, symbols, workers=DEFAULT_WORKERS,
+                   requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                   page_size=ohlcv_ingest.DEFAULT_PAGE_SIZE, outputsize='auto'):
+    """Fetches and upserts every symbol.
+
+    Returns ({symbol: rows upserted}, [failed symbols], {symbol: bytes downloaded}).
+
+    Fetching and parsing run on a thread pool under a shared token bucket; the calling
+    thread does all the writes on `conn` as soon as each symbol is ready, so upserts
+    overlap with the remaining network waits.
+    """
+    latest_dates = ohlcv_ingest.latest_trade_dates(conn, symbols)
+    limiter = TokenBucket(requests_per_minute)
+    local = threading.local()
+
+    def fetch(symbol):
+        # requests.Session isn't guaranteed thread-safe, so keep one per worker
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        new_entries, nbytes = fetch_new_entries(symbol, latest_dates.get(symbol), local.session,
+                                                outputsize, limiter)
+        downloaded[symbol] = nbytes
+        return to_bars(new_entries)
+
+    upserted, failed, downloaded = {}, [], {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, symbol): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                bars = future.result()
+                latest_date = latest_dates.get(symbol)
+                if not bars['trade_date']:
+                    print(f"No new data to upload for {symbol} (up to {latest_date})")
+                    upserted[symbol] = 0
+                    continue
+                print(f"Upserting {len(bars['trade_date'])} daily bars for {symbol}"
+                      f"{f' (after {latest_date})' if latest_date else ''}...")
+                upserted[symbol] = ohlcv_ingest.upsert_bars(symbol, bars, conn, page_size=page_size)
+                # Only the weeks/months holding the new days are rebuilt, unless the rollups lack older history
+                ohlcv_store.refresh_rollups(conn, symbol, '1d', since=bars['trade_date'][0])
+            except Exception as e:
+                print(f"❌ Failed to ingest {symbol}: {e}")
+                failed.append(symbol)
+    return upserted, failed, downloaded
+
+
+def main():
+    args = parse_args()
+
+    if not DATABASE_URL or not API_KEY:
+        raise RuntimeError("Please set DATABASE_URL and ALPHAVANTAGE_API_KEY in your .env")
+
+    conn = ohlcv_ingest.connect(DATABASE_URL)
+    ohlcv_store.ensure_tables(conn)
+
+    print(f"Ingesting {len(args.symbols)} symbol(s) with {args.workers} worker(s) "
+          f"at up to {args.requests_per_minute:g} requests/minute...")
+    upserted, failed, downloaded = ingest_symbols(conn, args.symbols, args.workers,
+                                                  args.requests_per_minute, args.page_size,
+                                                  args.outputsize)
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Fetch and upload stock data to Supabase')
-parser.add_argument('symbol', type=str, help='Stock symbol (e.g., AAPL)')
-args = parser.parse_args()
-SYMBOL = args.symbol.upper()
-
-if not DATABASE_URL or not API_KEY:
-    raise RuntimeError("Please set DATABASE_URL and ALPHAVANTAGE_API_KEY in your .env")
-
-# Connect to Supabase
-print(f"Connecting to database...")
-conn = psycopg2.connect(DATABASE_URL)
-cur = conn.cursor()
-print("✅ Connected to database.")
-
-# Validate table existence
-print("Ensuring 'daily_ohlcv' table exists...")
-cur.execute("""
-CREATE TABLE IF NOT EXISTS daily_ohlcv (
-    symbol      TEXT        NOT NULL,
-    trade_date  DATE        NOT NULL,
-    open_price  NUMERIC(12,4) NOT NULL,
-    high_price  NUMERIC(12,4) NOT NULL,
-    low_price   NUMERIC(12,4) NOT NULL,
-    close_price NUMERIC(12,4) NOT NULL,
-    volume      BIGINT      NOT NULL,
-    PRIMARY KEY (symbol, trade_date)
-);
-""")
-conn.commit()
-print("✅ Table 'daily_ohlcv' is ready.")
-
-# Check latest date in database for this symbol
-latest_date = None
-cur.execute("SELECT MAX(trade_date) FROM daily_ohlcv WHERE symbol = %s", (SYMBOL,))
-result = cur.fetchone()
-if result[0] is not None:
-    latest_date = result[0]
-    print(f"Found existing data for {SYMBOL} up to {latest_date}")
-else:
-    print(f"No existing data found for {SYMBOL}, will fetch all available history")
-
-# Fetch full daily time series
-print(f"Fetching daily time series for {SYMBOL} from Alpha Vantage...")
-url = (
-    f"https://www.alphavantage.co/query?"
-    f"function=TIME_SERIES_DAILY&symbol={SYMBOL}"
-    f"&outputsize=full&apikey={API_KEY}"
-)
-resp = requests.get(url)
-resp.raise_for_status()
-data = resp.json()
-print("✅ Data fetched successfully.")
-
-timeseries = data.get("Time Series (Daily)", {})
-if not timeseries:
-    raise RuntimeError("No 'Time Series (Daily)' found in response.")
-
-# Filter data to only include new entries
-new_entries = {}
-if latest_date:
-    for date_str, stats in timeseries.items():
-        if datetime.datetime.strptime(date_str, '%Y-%m-%d').date() > latest_date:
-            new_entries[date_str] = stats
-    print(f"Found {len(new_entries)} new entries to upload (after {latest_date})")
-else:
-    new_entries = timeseries
-    print(f"All {len(new_entries)} entries will be uploaded")
-
-if not new_entries:
-    print("No new data to upload!")
-    cur.close()
     conn.close()
     print("✅ Database connection closed.")
-    exit(0)
-
-# Upsert each daily bar
-print(f"Upserting {len(new_entries)} daily bars for {SYMBOL}...")
-upsert_sql = """
-INSERT INTO daily_ohlcv
-  (symbol, trade_date, open_price, high_price, low_price, close_price, volume)
-VALUES (%s, %s, %s, %s, %s, %s, %s)
-ON CONFLICT (symbol, trade_date) DO UPDATE
-  SET open_price  = EXCLUDED.open_price,
-      high_price  = EXCLUDED.high_price,
-      low_price   = EXCLUDED.low_price,
-      close_price = EXCLUDED.close_price,
-      volume      = EXCLUDED.volume;
-"""
-
-row_count = 0
-commit_interval = 500 # Commit every 500 rows
-
-first_row = True
-for date_str, stats in new_entries.items():
-    if first_row:
-        print(f"Inserting first row for date: {date_str}...")
-        first_row = False
-    cur.execute(upsert_sql, (
-        SYMBOL,
-        date_str,
-        stats["1. open"],
-        stats["2. high"],
-        stats["3. low"],
-        stats["4. close"],
-        stats["5. volume"]
-    ))
-    row_count += 1
-    if row_count % commit_interval == 0:
-        conn.commit()
-        print(f"    Committed {row_count}/{len(new_entries)} rows...")
-
-# Commit any remaining rows that didn't make a full batch
-conn.commit()
-print(f"    Committed final rows. Total: {row_count}")
-
-cur.close()
-conn.close()
-print("✅ Database connection closed.")
-
-print(f"✅ Successfully upserted {len(new_entries)} days of {SYMBOL} into daily_ohlcv")
+
+    for symbol in args.symbols:
+        if symbol in upserted:
+            print(f"✅ Successfully upserted {upserted[symbol]} days of {symbol} into daily_ohlcv")
+    print(f"Downloaded {sum(downloaded.values()) / 1024:.1f} KB from Alpha Vantage "
+          f"for {len(downloaded)} symbol(s).")
+    if failed:
+        raise SystemExit(f"❌ Failed symbols: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()